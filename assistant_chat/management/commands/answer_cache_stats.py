@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from assistant_chat.services import answer_cache
+
+
+class Command(BaseCommand):
+    help = "Mostra la taxa d'encerts de la cache de respostes de l'assistent."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Posa els comptadors a zero després de mostrar-los")
+
+    def handle(self, *args, **options):
+        if not answer_cache.shared_stats():
+            # Aquest procés té els seus propis comptadors (a zero), no els del servidor
+            raise CommandError(
+                "Els comptadors són en una cache local del procés del servidor. Configureu "
+                "ASSISTANT_ANSWER_STATS_CACHE amb una cache compartida (Redis, Memcached, "
+                "fitxers o DB) o consulteu /assistant/api/stats/ al servidor en marxa."
+            )
+        if not answer_cache.enabled():
+            self.stdout.write("La cache de respostes està desactivada (ASSISTANT_ANSWER_CACHE_TTL = 0)")
+        data = answer_cache.stats()
+        self.stdout.write(
+            f"Encerts: {data['hits']}  Errades: {data['misses']}  Respostes guardades: {data['stores']}  "
+            f"Taxa d'encerts: {data['hit_rate']:.1%}"
+        )
+        if options["reset"]:
+            answer_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Comptadors reiniciats"))
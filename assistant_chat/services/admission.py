@@ -0,0 +1,202 @@
+"""
+Control d'admissió de les generacions de l'assistent.
+
+Com a molt ASSISTANT_MAX_CONCURRENCY generacions alhora per procés; les
+següents esperen en una cua FIFO de com a molt ASSISTANT_QUEUE_SIZE places
+i, si la cua és plena, es rebutgen a l'instant (la vista respon 503).
+Una petició que porta més de ASSISTANT_QUEUE_TIMEOUT segons a la cua també
+es rebutja.
+
+És segur entre fils i entre event loops (amb WSGI cada petició asíncrona té
+el seu loop): cada espera és un Future del loop que espera, que es resol
+amb call_soon_threadsafe. Les respostes que es consumeixen des d'un fil
+(servidor WSGI) esperen amb wait_sync(), sobre un threading.Event.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+
+
+class Overloaded(Exception):
+    """La cua d'espera és plena."""
+
+
+class QueueTimeout(Exception):
+    """S'ha esperat massa a la cua."""
+
+
+class Ticket:
+    __slots__ = ("loop", "future", "event", "enqueued_at", "granted")
+
+    def __init__(self):
+        # loop i future es creen a wait(), al loop que realment espera
+        self.loop = None
+        self.future = None
+        self.event = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = deque()
+        self._waits = deque(maxlen=1000)
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+
+    def _max_concurrency(self) -> int:
+        return getattr(settings, "ASSISTANT_MAX_CONCURRENCY", 2)
+
+    def shed(self) -> bool:
+        """
+        Comprovació ràpida abans de començar la resposta: True (i es compta
+        com a rebuig) si ara mateix una petició nova no cabria a la cua.
+        """
+        with self._lock:
+            full = (
+                self._active >= self._max_concurrency()
+                and len(self._waiting) >= getattr(settings, "ASSISTANT_QUEUE_SIZE", 16)
+            )
+            if full:
+                self.rejected += 1
+            return full
+
+    def enter(self) -> Ticket:
+        """
+        Demana torn. El Ticket retornat pot estar ja concedit o a la cua
+        (vegeu wait). Llença Overloaded si la cua és plena.
+        """
+        ticket = Ticket()
+        with self._lock:
+            if self._active < self._max_concurrency() and not self._waiting:
+                self._active += 1
+                self._grant(ticket)
+            elif len(self._waiting) < getattr(settings, "ASSISTANT_QUEUE_SIZE", 16):
+                self._waiting.append(ticket)
+                self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            else:
+                self.rejected += 1
+                raise Overloaded()
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """Posició a la cua començant per 1 (0 si ja té torn)."""
+        with self._lock:
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    async def wait(self, ticket: Ticket, poll: float = 1.0):
+        """
+        Generador asíncron: mentre el ticket és a la cua en dona la posició
+        cada vegada que canvia; acaba quan té torn. Llença QueueTimeout.
+        """
+        timeout = getattr(settings, "ASSISTANT_QUEUE_TIMEOUT", 30)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not ticket.granted and ticket.loop is not loop:
+                ticket.loop = loop
+                ticket.future = loop.create_future()
+        last = None
+        while not ticket.granted:
+            position = self.position(ticket)
+            if position and position != last:
+                last = position
+                yield position
+            remaining = ticket.enqueued_at + timeout - time.monotonic()
+            if remaining <= 0:
+                if self._abandon(ticket):
+                    with self._lock:
+                        self.timeouts += 1
+                    raise QueueTimeout()
+                continue
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), min(poll, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def wait_sync(self, ticket: Ticket, poll: float = 1.0):
+        """Com wait(), però com a generador síncron que bloqueja el fil."""
+        timeout = getattr(settings, "ASSISTANT_QUEUE_TIMEOUT", 30)
+        last = None
+        while not ticket.granted:
+            position = self.position(ticket)
+            if position and position != last:
+                last = position
+                yield position
+            remaining = ticket.enqueued_at + timeout - time.monotonic()
+            if remaining <= 0:
+                if self._abandon(ticket):
+                    with self._lock:
+                        self.timeouts += 1
+                    raise QueueTimeout()
+                continue
+            ticket.event.wait(min(poll, remaining))
+
+    def release(self, ticket: Ticket):
+        """Allibera el torn, o surt de la cua si encara no en tenia."""
+        if self._abandon(ticket):
+            return
+        with self._lock:
+            while self._waiting:
+                waiter = self._waiting.popleft()
+                # El torn passa directament al següent (el nombre d'actives no canvia)
+                waiter.granted = True
+                if waiter.loop is not None:
+                    try:
+                        waiter.loop.call_soon_threadsafe(self._resolve, waiter)
+                    except RuntimeError:  # el seu loop ja s'ha tancat: ningú no l'espera
+                        waiter.granted = False
+                        continue
+                waiter.event.set()
+                self._grant(waiter)
+                return
+            self._active -= 1
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        self.admitted += 1
+        self._waits.append(time.monotonic() - ticket.enqueued_at)
+
+    @staticmethod
+    def _resolve(ticket: Ticket):
+        if not ticket.future.done():
+            ticket.future.set_result(True)
+
+    def _abandon(self, ticket: Ticket) -> bool:
+        with self._lock:
+            if ticket.granted:
+                return False
+            try:
+                self._waiting.remove(ticket)
+            except ValueError:
+                pass
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = np.array(self._waits, dtype=np.float64)
+            return {
+                "active": self._active,
+                "queued": len(self._waiting),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "wait_p50_ms": float(np.percentile(waits, 50) * 1000) if len(waits) else 0.0,
+                "wait_p95_ms": float(np.percentile(waits, 95) * 1000) if len(waits) else 0.0,
+                "wait_max_ms": float(waits.max() * 1000) if len(waits) else 0.0,
+            }
+
+
+controller = AdmissionController()
@@ -0,0 +1,230 @@
+"""
+Cache de respostes de l'assistent.
+
+La clau és el missatge normalitzat més un hash dels events candidats (ids i
+puntuacions) que ha retornat retrieve_events. Si el catàleg canvia, canvien
+els candidats i la clau: una resposta guardada no pot recomanar events que
+ja no surten a la recuperació.
+
+Es fa servir la cache de Django ASSISTANT_ANSWER_CACHE (amb Redis/Memcached,
+compartida entre workers), amb ASSISTANT_ANSWER_CACHE_TTL segons de vida
+(0 = desactivada). Els comptadors d'encerts són a ASSISTANT_ANSWER_STATS_CACHE
+(per defecte la mateixa cache): si és compartida, stats() dona la taxa
+d'encerts de tots els processos; si és local (LocMem), només la del procés
+que la consulta, i la comanda answer_cache_stats no la pot llegir.
+
+A més, SemanticAnswerCache reaprofita respostes de consultes formulades
+d'una altra manera: si l'embedding d'una consulta nova té una similitud
+cosinus >= ASSISTANT_SEMANTIC_CACHE_THRESHOLD amb una de recent i els
+candidats recuperats són els mateixos events, es torna la mateixa resposta.
+És local al procés, amb com a molt ASSISTANT_SEMANTIC_CACHE_SIZE entrades (LRU).
+"""
+import hashlib
+import json
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+_PREFIX = "assistant:answer:"
+_COUNTERS = ("hits", "misses", "stores")
+# Backends que només viuen dins d'un procés
+_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def _cache():
+    return caches[getattr(settings, "ASSISTANT_ANSWER_CACHE", "default")]
+
+
+def _stats_alias() -> str:
+    return getattr(settings, "ASSISTANT_ANSWER_STATS_CACHE", None) or getattr(settings, "ASSISTANT_ANSWER_CACHE", "default")
+
+
+def _stats_cache():
+    return caches[_stats_alias()]
+
+
+def shared_stats() -> bool:
+    """True si els comptadors són visibles des de qualsevol procés."""
+    return settings.CACHES.get(_stats_alias(), {}).get("BACKEND", "") not in _LOCAL_BACKENDS
+
+
+def ttl() -> int:
+    return getattr(settings, "ASSISTANT_ANSWER_CACHE_TTL", 600)
+
+
+def enabled() -> bool:
+    return ttl() > 0
+
+
+def normalize_message(message: str) -> str:
+    """Minúscules, espais col·lapsats i sense puntuació als extrems ("Futbol?" == "futbol")."""
+    text = " ".join(unicodedata.normalize("NFC", message or "").casefold().split())
+    return text.strip(string.punctuation + "¿¡ ")
+
+
+def _context(candidates: list[dict], scores: bool) -> str:
+    # El model forma part de la clau: canviar-lo no ha de servir respostes de l'anterior
+    items = [[c["id"], c["score"]] if scores else c["id"] for c in candidates]
+    return json.dumps([getattr(settings, "OLLAMA_MODEL", "")] + items, separators=(",", ":"))
+
+
+def cache_key(message: str, candidates: list[dict]) -> str:
+    context = _context(candidates, scores=True)
+    digest = hashlib.sha1(f"{normalize_message(message)}\0{context}".encode("utf-8")).hexdigest()
+    return _PREFIX + digest
+
+
+def candidate_signature(candidates: list[dict]) -> str:
+    """Identifica el conjunt d'events candidats (sense puntuacions, que varien amb la formulació)."""
+    ordered = sorted(candidates, key=lambda c: c["id"])
+    return hashlib.sha1(_context(ordered, scores=False).encode("utf-8")).hexdigest()
+
+
+async def _count(name: str):
+    cache = _stats_cache()
+    key = f"{_PREFIX}stats:{name}"
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        # Encara no existeix (o ha caducat): add() evita trepitjar un altre worker
+        if not await cache.aadd(key, 1, None):
+            await cache.aincr(key)
+
+
+def _count_sync(name: str):
+    cache = _stats_cache()
+    key = f"{_PREFIX}stats:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+async def aget(key: str):
+    """Text de la resposta guardada, o None."""
+    if not enabled():
+        return None
+    answer = await _cache().aget(key)
+    await _count("hits" if answer is not None else "misses")
+    return answer
+
+
+async def aset(key: str, answer: str):
+    if not enabled() or not answer:
+        return
+    await _cache().aset(key, answer, ttl())
+    await _count("stores")
+
+
+def put(key: str, answer: str):
+    """Versió síncrona d'aset(), per a les respostes que s'envien des d'un fil (WSGI)."""
+    if not enabled() or not answer:
+        return
+    _cache().set(key, answer, ttl())
+    _count_sync("stores")
+
+
+class SemanticAnswerCache:
+    """
+    LRU de (embedding de la consulta, signatura dels candidats, resposta).
+    La cerca és lineal: amb unes centenars d'entrades són microsegons.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, vec, signature: str):
+        size = getattr(settings, "ASSISTANT_SEMANTIC_CACHE_SIZE", 256)
+        if size <= 0 or not enabled() or not len(vec):
+            return None
+        threshold = getattr(settings, "ASSISTANT_SEMANTIC_CACHE_THRESHOLD", 0.92)
+        query = _unit(vec)
+        now = time.monotonic()
+        with self._lock:
+            best, best_key = threshold, None
+            for key, (stored_at, sig, entry_vec, _) in list(self._data.items()):
+                if now - stored_at >= ttl():
+                    del self._data[key]
+                    continue
+                if sig != signature or entry_vec.shape != query.shape:
+                    continue
+                similarity = float(np.dot(entry_vec, query))
+                if similarity >= best:
+                    best, best_key = similarity, key
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(best_key)
+            self.hits += 1
+            return self._data[best_key][3]
+
+    def put(self, message: str, vec, signature: str, answer: str):
+        size = getattr(settings, "ASSISTANT_SEMANTIC_CACHE_SIZE", 256)
+        if size <= 0 or not enabled() or not len(vec) or not answer:
+            return
+        key = (normalize_message(message), signature)
+        with self._lock:
+            self._data[key] = (time.monotonic(), signature, _unit(vec), answer)
+            self._data.move_to_end(key)
+            while len(self._data) > size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _unit(vec) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+semantic_cache = SemanticAnswerCache()
+
+
+def stats() -> dict:
+    """
+    Comptadors de la cache exacta (de tots els processos si `shared`) i de la
+    semàntica (`semantic`, aquest procés).
+    """
+    values = _stats_cache().get_many([f"{_PREFIX}stats:{name}" for name in _COUNTERS])
+    data = {name: values.get(f"{_PREFIX}stats:{name}", 0) for name in _COUNTERS}
+    lookups = data["hits"] + data["misses"]
+    data["hit_rate"] = data["hits"] / lookups if lookups else 0.0
+    data["shared"] = shared_stats()
+    data["semantic"] = semantic_cache.stats()
+    return data
+
+
+def reset_stats():
+    _stats_cache().delete_many([f"{_PREFIX}stats:{name}" for name in _COUNTERS])
+    semantic_cache.reset_counters()
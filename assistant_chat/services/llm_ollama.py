@@ -1,12 +1,43 @@
+"""
+Client de l'API de generació d'Ollama (OLLAMA_URL, OLLAMA_MODEL).
+
+generate_stream() fa servir una requests.Session compartida pel procés, amb
+connexions keep-alive: les peticions successives no obren una connexió nova.
+
+agenerate_stream() és la variant asíncrona per a la vista ASGI: amb httpx
+(requirements.txt) la resposta es llegeix sense ocupar cap fil; sense httpx es
+llegeix la versió síncrona en un fil a part per resposta oberta (i s'avisa al
+log) i els tokens passen per una cua.
+"""
+import asyncio
 import json
+import logging
+import threading
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "llama3.1:8b"
+try:
+    import httpx
+except ImportError:  # opcional
+    httpx = None
 
-def generate_stream(prompt: str):
-    payload = {
-        "model": OLLAMA_MODEL,
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session = None
+_async_clients = {}
+_warned = False
+
+
+def ollama_url() -> str:
+    return getattr(settings, "OLLAMA_URL", "http://localhost:11434/api/generate")
+
+
+def _payload(prompt: str) -> dict:
+    return {
+        "model": getattr(settings, "OLLAMA_MODEL", "llama3.1:8b"),
         "prompt": prompt,
         "stream": True,
         "options": {
@@ -15,9 +46,121 @@ def generate_stream(prompt: str):
             "num_ctx": 2048
         }
     }
-    r = requests.post(OLLAMA_URL, json=payload, stream=True, timeout=60)
-    r.raise_for_status()
-    for line in r.iter_lines():
-        if line:
-            data = json.loads(line)
-            yield data.get("response", "")
+
+
+def _timeouts():
+    # (connexió, lectura entre dos fragments de la resposta)
+    return getattr(settings, "OLLAMA_CONNECT_TIMEOUT", 5.0), getattr(settings, "OLLAMA_TIMEOUT", 60.0)
+
+
+def _parse(line) -> str:
+    return json.loads(line).get("response", "")
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                size = getattr(settings, "OLLAMA_POOL_SIZE", 16)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def generate_stream(prompt: str):
+    with get_session().post(ollama_url(), json=_payload(prompt), stream=True, timeout=_timeouts()) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line:
+                yield _parse(line)
+
+
+async def _get_async_client():
+    # Un client per event loop: les connexions d'httpx no es poden compartir entre loops
+    loop = asyncio.get_running_loop()
+    stale = []
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            # Els clients de loops tancats ja no es poden fer servir: es tanquen fora del bloqueig
+            stale = [_async_clients.pop(other) for other in list(_async_clients) if other.is_closed()]
+            connect, read = _timeouts()
+            size = getattr(settings, "OLLAMA_POOL_SIZE", 16)
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=size),
+            )
+            _async_clients[loop] = client
+    for other in stale:
+        try:
+            await other.aclose()
+        except Exception:
+            pass  # connexions lligades al loop mort: el que calia era alliberar el pool
+    return client
+
+
+async def _agenerate_httpx(prompt: str):
+    client = await _get_async_client()
+    async with client.stream("POST", ollama_url(), json=_payload(prompt)) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if line:
+                yield _parse(line)
+
+
+_DONE = object()
+
+
+async def _agenerate_thread(prompt: str):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # el loop ja s'ha tancat
+            stop.set()
+
+    def pump():
+        stream = generate_stream(prompt)
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                put(chunk)
+            put(_DONE)
+        except Exception as exc:
+            put(exc)
+        finally:
+            stream.close()
+
+    worker = loop.run_in_executor(None, pump)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Si el client es desconnecta, el fil deixa de llegir al següent fragment
+        stop.set()
+        if worker.done():
+            await worker
+
+
+def agenerate_stream(prompt: str):
+    """Generador asíncron amb els mateixos fragments que generate_stream()."""
+    global _warned
+    if httpx is not None:
+        return _agenerate_httpx(prompt)
+    if not _warned:
+        _warned = True
+        logger.warning("httpx no està instal·lat: cada resposta de l'assistent en streaming ocuparà un fil")
+    return _agenerate_thread(prompt)
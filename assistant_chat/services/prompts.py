@@ -1,10 +1,15 @@
-import json
+import math
+import re
+from datetime import datetime
 
-def build_prompt(user_message: str, candidates: list[dict]) -> str:
-    # candidates: [{id,title,scheduled_date,category,tags,url,score}, ...]
-    context_json = json.dumps(candidates, ensure_ascii=False, indent=2)
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-    return f"""
+# Paraules, salts de línia (amb el sagnat que els segueix) i signes de puntuació
+_TOKEN_RE = re.compile(r"\w+|\n[ \t]*|[^\w\s]")
+
+_INSTRUCTIONS = """
 Ets un assistent que recomana esdeveniments del lloc StreamEvents.
 IMPORTANT:
 - NOMÉS pots recomanar esdeveniments que apareguin en el CONTEXT.
@@ -14,8 +19,81 @@ IMPORTANT:
 
 Respon en català i en format de text explicatiu de forma amable. No utilitzis JSON. Recomana els esdeveniments parlant d'ells i donant context.
 
-CONTEXT (llista d'esdeveniments disponibles):
-{context_json}
-
-Petició de l'usuari: {user_message}
+CONTEXT (un esdeveniment per línia: títol | data | categoria | etiquetes | URL | descripció):
 """.strip()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimació offline dels tokens del model: cada signe i cada salt de línia
+    és un token i cada paraula en compta un per cada 4 caràcters (arrodonit a
+    l'alça), que és aproximadament el que fan els tokenitzadors BPE amb el català.
+    """
+    return sum(math.ceil(len(t) / 4) if t[0].isalnum() or t[0] == "_" else 1 for t in _TOKEN_RE.findall(text))
+
+
+def truncate(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut.rstrip(",.;:") + "…"
+
+
+def _local_date(value) -> str:
+    """Data en hora local (TIME_ZONE), que és la que l'usuari espera llegir."""
+    if not isinstance(value, datetime):
+        value = parse_datetime(value or "")
+    if value is None:
+        return ""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime("%Y-%m-%d %H:%M")
+
+
+def _line(c: dict, description_chars: int) -> str:
+    date = _local_date(c.get("scheduled_date"))
+    fields = [c["title"], date, c.get("category") or "", c.get("tags") or "", c.get("url") or ""]
+    description = truncate(c.get("description") or "", description_chars)
+    if description:
+        fields.append(description)
+    return "- " + " | ".join(f.replace("|", "/").strip() for f in fields)
+
+
+class Prompt:
+    """Prompt final amb la seva mida estimada i els candidats que hi han cabut."""
+
+    def __init__(self, text: str, tokens: int, included: int):
+        self.text = text
+        self.tokens = tokens
+        self.included = included
+
+    def __str__(self):
+        return self.text
+
+
+def build_prompt(user_message: str, candidates: list[dict]) -> Prompt:
+    """
+    candidates: [{id,title,scheduled_date,category,tags,url,score,description}, ...]
+    ordenats per rellevància. S'hi afegeixen en format d'una línia mentre el
+    prompt no superi ASSISTANT_PROMPT_TOKENS; les descripcions es retallen a
+    ASSISTANT_PROMPT_DESCRIPTION_CHARS caràcters i el missatge de l'usuari
+    (que també compta dins del pressupost) a ASSISTANT_PROMPT_MESSAGE_CHARS.
+    """
+    budget = getattr(settings, "ASSISTANT_PROMPT_TOKENS", 1536)
+    description_chars = getattr(settings, "ASSISTANT_PROMPT_DESCRIPTION_CHARS", 200)
+    message_chars = getattr(settings, "ASSISTANT_PROMPT_MESSAGE_CHARS", 500)
+
+    question = f"\n\nPetició de l'usuari: {truncate(user_message, message_chars)}"
+    used = count_tokens(_INSTRUCTIONS) + count_tokens(question)
+    lines = []
+    for c in candidates:
+        line = _line(c, description_chars)
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+
+    text = _INSTRUCTIONS + "\n" + ("\n".join(lines) or "(cap)") + question
+    return Prompt(text, count_tokens(text), len(lines))
@@ -1,7 +1,5 @@
-from django.utils import timezone
 from events.models import Event
-from semantic_search.services.embeddings import embed_text
-from semantic_search.services.ranker import cosine_top_k
+from semantic_search.services.hybrid import hybrid_search
 
 def build_event_text(e: Event) -> str:
     return " | ".join([
@@ -11,24 +9,15 @@ def build_event_text(e: Event) -> str:
         (e.tags or "").strip(),
     ]).strip()
 
-def retrieve_events(query: str, only_future: bool = True, k: int = 8):
-    q_vec = embed_text(query)
-
-    qs = Event.objects.all()
-    if only_future:
-        qs = qs.filter(scheduled_date__gte=timezone.now())
-
-    items = []
-    # IMPORTANT amb djongo: only(...) i validar embedding
-    for e in qs.only("id", "title", "scheduled_date", "category", "tags", "embedding"):
-        emb = getattr(e, "embedding", None)
-        if isinstance(emb, list) and len(emb) > 0:
-            items.append((e, emb))
-
-    ranked = cosine_top_k(q_vec, items, k=max(k, 20))
-
-    # Llindar mínim per evitar recomanar qualsevol cosa
-    ranked = [(e, s) for (e, s) in ranked if s >= 0.25]
-
-    # retalla a k
-    return ranked[:k]
+def retrieve_events(query: str, only_future: bool = True, k: int = 8, query_vec=None):
+    # Rànquing híbrid: coincidències de títol/etiquetes/categoria + similitud vectorial.
+    # El llindar mínim (per no recomanar qualsevol cosa) no s'aplica a les coincidències lèxiques.
+    # IMPORTANT amb djongo: only(...) per no carregar camps pesats
+    return hybrid_search(
+        query,
+        k=k,
+        only_future=only_future,
+        fields=("id", "title", "scheduled_date", "category", "tags", "description"),
+        min_score=0.25,
+        query_vec=query_vec,
+    )
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .services import admission, answer_cache, llm_ollama
+from .services.prompts import build_prompt, count_tokens
+
+TOKENS = ["Hola", ", et ", "recomano ", "el concert."]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Respon a /api/generate amb els TOKENS en streaming (NDJSON, chunked)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.client_address, body))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, token in enumerate(TOKENS + [""]):
+                # Latència configurable per token, com un model lent
+                time.sleep(server.delay)
+                if i == 1:
+                    # Després del primer token, el test decideix quan continua
+                    server.gate.wait(5)
+                line = json.dumps({"response": token, "done": i == len(TOKENS)}).encode("utf-8") + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            server.finished += 1
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOllamaMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+        cls.server.daemon_threads = True
+        cls.server.requests = []
+        cls.server.lock = threading.Lock()
+        cls.server.active = cls.server.max_active = 0
+        cls.server.delay = 0
+        cls.server.gate = threading.Event()
+        cls.server.finished = 0
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{cls.server.server_address[1]}/api/generate"
+        cls.settings_override = override_settings(OLLAMA_URL=url, OLLAMA_MODEL="fake-model")
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.server.max_active = 0
+        self.server.delay = 0
+        self.server.gate.set()
+        self.server.finished = 0
+
+
+class OllamaClientTests(FakeOllamaMixin, SimpleTestCase):
+
+    def test_generate_stream(self):
+        self.assertEqual(list(llm_ollama.generate_stream("hola")), TOKENS + [""])
+        _, body = self.server.requests[0]
+        self.assertEqual(body["model"], "fake-model")
+        self.assertEqual(body["prompt"], "hola")
+
+    def test_connection_is_reused(self):
+        list(llm_ollama.generate_stream("u"))
+        list(llm_ollama.generate_stream("dos"))
+        clients = [address for address, _ in self.server.requests]
+        self.assertEqual(len(clients), 2)
+        self.assertEqual(clients[0], clients[1])
+
+    def test_agenerate_stream(self):
+        async def collect():
+            return [chunk async for chunk in llm_ollama.agenerate_stream("hola")]
+
+        self.assertEqual(asyncio.run(collect()), TOKENS + [""])
+
+    def test_thread_fallback_warns_once(self):
+        async def collect():
+            return [chunk async for chunk in llm_ollama.agenerate_stream("hola")]
+
+        with mock.patch.object(llm_ollama, "httpx", None), mock.patch.object(llm_ollama, "_warned", False):
+            with self.assertLogs(llm_ollama.logger, "WARNING") as logs:
+                self.assertEqual(asyncio.run(collect()), TOKENS + [""])
+                asyncio.run(collect())
+        self.assertEqual(len(logs.records), 1)
+
+
+class AsyncClientPoolTests(SimpleTestCase):
+
+    def test_clients_of_closed_loops_are_closed(self):
+        closed = []
+
+        class FakeClient:
+            def __init__(self, **kwargs):
+                pass
+
+            async def aclose(self):
+                closed.append(self)
+
+        fake_httpx = mock.Mock(AsyncClient=FakeClient)
+        with mock.patch.object(llm_ollama, "httpx", fake_httpx), \
+                mock.patch.object(llm_ollama, "_async_clients", {}) as clients:
+            first = asyncio.run(llm_ollama._get_async_client())
+
+            async def twice():
+                return await llm_ollama._get_async_client(), await llm_ollama._get_async_client()
+
+            second, again = asyncio.run(twice())
+            self.assertIs(second, again)
+            self.assertIsNot(first, second)
+            self.assertEqual(closed, [first])
+            self.assertEqual(list(clients.values()), [second])
+
+
+CANDIDATES = [{"id": 1, "title": "Concert", "scheduled_date": None, "category": "music",
+               "tags": "", "url": "/events/1/", "score": 0.9}]
+
+
+class ChatApiTests(FakeOllamaMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        answer_cache.semantic_cache.clear()
+
+    async def ask(self, message, candidates=CANDIDATES, vec=(1.0, 0.0, 0.0)):
+        with mock.patch("assistant_chat.views._candidates", return_value=(candidates, list(vec))):
+            response = await self.async_client.post(
+                "/assistant/api/chat/", {"message": message}, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 200)
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode("utf-8")
+        return [json.loads(line[len("data: "):]) for line in body.split("\n\n") if line]
+
+    async def test_streams_metadata_and_text(self):
+        events = await self.ask("concerts?")
+        self.assertEqual(events[0], {"type": "metadata", "events": CANDIDATES})
+        self.assertEqual("".join(e["text"] for e in events[1:]), "".join(TOKENS))
+
+    async def test_answer_cache_replays_answer(self):
+        first = await self.ask("Què hi ha de concerts?")
+        second = await self.ask("  què hi ha de CONCERTS ")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(second[0], first[0])
+        self.assertEqual(second[1:], [{"type": "text", "text": "".join(TOKENS)}])
+        stats = answer_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    @override_settings(ASSISTANT_SEMANTIC_CACHE_SIZE=0)
+    async def test_answer_cache_depends_on_candidates(self):
+        await self.ask("concerts")
+        await self.ask("concerts", candidates=[dict(CANDIDATES[0], score=0.8)])
+        self.assertEqual(len(self.server.requests), 2)
+
+    @override_settings(ASSISTANT_SEMANTIC_CACHE_THRESHOLD=0.9)
+    async def test_semantic_cache_reuses_similar_query(self):
+        await self.ask("concerts aquest cap de setmana", vec=(1.0, 0.1, 0.0))
+        events = await self.ask("quins concerts hi ha dissabte", vec=(1.0, 0.2, 0.0))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(events[1:], [{"type": "text", "text": "".join(TOKENS)}])
+        self.assertEqual(answer_cache.stats()["semantic"]["hits"], 1)
+
+    @override_settings(ASSISTANT_SEMANTIC_CACHE_THRESHOLD=0.9)
+    async def test_semantic_cache_requires_similarity_and_same_candidates(self):
+        await self.ask("concerts", vec=(1.0, 0.0, 0.0))
+        await self.ask("teatre", vec=(0.0, 1.0, 0.0))
+        await self.ask("música en directe", vec=(1.0, 0.1, 0.0), candidates=[dict(CANDIDATES[0], id=2)])
+        self.assertEqual(len(self.server.requests), 3)
+
+    @override_settings(ASSISTANT_ANSWER_CACHE_TTL=0)
+    async def test_answer_cache_disabled(self):
+        await self.ask("concerts")
+        await self.ask("concerts")
+        self.assertEqual(len(self.server.requests), 2)
+
+    async def test_rejects_empty_message(self):
+        response = await self.async_client.post(
+            "/assistant/api/chat/", {"message": "  "}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ASSISTANT_ANSWER_CACHE_TTL=0)
+class ChatApiWsgiTests(FakeOllamaMixin, SimpleTestCase):
+    """Amb WSGI (el Client síncron) la resposta també ha d'arribar token a token."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(admission, "controller", admission.AdmissionController())
+        self.controller = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, message):
+        with mock.patch("assistant_chat.views._candidates", return_value=(CANDIDATES, [1.0, 0.0])):
+            response = self.client.post(
+                "/assistant/api/chat/", {"message": message}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.addCleanup(response.close)
+        return iter(response.streaming_content)
+
+    @staticmethod
+    def parse(chunk):
+        return json.loads(chunk.decode("utf-8")[len("data: "):])
+
+    def test_first_chunk_before_generation_finishes(self):
+        self.server.gate.clear()
+        chunks = self.post("concerts?")
+        self.assertEqual(self.parse(next(chunks))["type"], "metadata")
+        self.assertEqual(self.parse(next(chunks)), {"type": "text", "text": TOKENS[0]})
+        self.assertEqual(self.server.finished, 0)
+
+        self.server.gate.set()
+        rest = [self.parse(chunk) for chunk in chunks]
+        self.assertEqual("".join(e["text"] for e in rest), "".join(TOKENS[1:]))
+        self.assertEqual(self.server.finished, 1)
+
+    @override_settings(ASSISTANT_ANSWER_CACHE_TTL=600)
+    def test_answer_is_cached(self):
+        cache.clear()
+        answer_cache.semantic_cache.clear()
+        list(self.post("concerts?"))
+        events = [self.parse(chunk) for chunk in self.post("Concerts")]
+        self.assertEqual(events[1:], [{"type": "text", "text": "".join(TOKENS)}])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(answer_cache.stats()["stores"], 1)
+
+    @override_settings(ASSISTANT_MAX_CONCURRENCY=1, ASSISTANT_QUEUE_SIZE=1)
+    def test_queued_events(self):
+        self.server.gate.clear()
+        first = self.post("u")
+        next(first), next(first)  # metadata i primer token: té el torn
+        second = self.post("dos")
+        self.assertEqual(self.parse(next(second))["type"], "metadata")
+
+        # La posició a la cua arriba abans que el torn
+        queued = []
+        reader = threading.Thread(target=lambda: queued.append(self.parse(next(second))))
+        reader.start()
+        reader.join(2)
+        self.assertEqual(queued, [{"type": "queued", "position": 1}])
+
+        self.server.gate.set()
+        list(first)
+        events = [self.parse(chunk) for chunk in second]
+        self.assertEqual("".join(e["text"] for e in events), "".join(TOKENS))
+        self.assertEqual(self.server.max_active, 1)
+        self.assertEqual(self.controller.stats()["active"], 0)
+
+
+class AnswerCacheStatsCommandTests(SimpleTestCase):
+
+    def test_refuses_process_local_counters(self):
+        self.assertFalse(answer_cache.shared_stats())
+        with self.assertRaises(CommandError):
+            call_command("answer_cache_stats", stdout=io.StringIO())
+
+    def test_reads_shared_counters(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "stats": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name},
+        }
+        with override_settings(CACHES=caches, ASSISTANT_ANSWER_STATS_CACHE="stats"):
+            # Com si ho haguessin comptat els workers del servidor
+            answer_cache._count_sync("hits")
+            answer_cache._count_sync("misses")
+            out = io.StringIO()
+            call_command("answer_cache_stats", "--reset", stdout=out)
+            self.assertIn("Encerts: 1  Errades: 1", out.getvalue())
+            self.assertEqual(answer_cache.stats()["hits"], 0)
+
+
+@override_settings(ASSISTANT_SEMANTIC_CACHE_SIZE=2, ASSISTANT_SEMANTIC_CACHE_THRESHOLD=0.99)
+class SemanticAnswerCacheTests(SimpleTestCase):
+
+    def test_lru_eviction(self):
+        semantic = answer_cache.SemanticAnswerCache()
+        semantic.put("a", [1.0, 0.0, 0.0], "sig", "A")
+        semantic.put("b", [0.0, 1.0, 0.0], "sig", "B")
+        self.assertEqual(semantic.get([1.0, 0.0, 0.0], "sig"), "A")  # "a" passa a ser la més recent
+        semantic.put("c", [0.0, 0.0, 1.0], "sig", "C")
+        self.assertIsNone(semantic.get([0.0, 1.0, 0.0], "sig"))
+        self.assertEqual(semantic.get([2.0, 0.0, 0.0], "sig"), "A")
+        self.assertEqual(semantic.stats()["size"], 2)
+
+
+class PromptBuilderTests(SimpleTestCase):
+
+    def candidate(self, i, description=""):
+        return {"id": i, "title": f"Concert {i}", "scheduled_date": "2026-11-07T20:30:00+00:00",
+                "category": "music", "tags": "jazz", "url": f"/events/{i}/", "score": 0.5,
+                "description": description}
+
+    def test_compact_lines(self):
+        prompt = build_prompt("jazz?", [self.candidate(1)])
+        # 20:30 UTC és 21:30 a Europe/Madrid (TIME_ZONE)
+        self.assertIn("- Concert 1 | 2026-11-07 21:30 | music | jazz | /events/1/\n", prompt.text)
+        self.assertTrue(prompt.text.endswith("Petició de l'usuari: jazz?"))
+        self.assertEqual(prompt.tokens, count_tokens(prompt.text))
+        self.assertEqual(prompt.included, 1)
+
+    @override_settings(ASSISTANT_PROMPT_DESCRIPTION_CHARS=40)
+    def test_truncates_descriptions(self):
+        prompt = build_prompt("jazz?", [self.candidate(1, "Una nit de jazz en directe amb músics locals i convidats.")])
+        self.assertIn("| Una nit de jazz en directe amb músics…", prompt.text)
+
+    def test_respects_token_budget(self):
+        candidates = [self.candidate(i, "Descripció llarga de l'esdeveniment. " * 20) for i in range(50)]
+        with override_settings(ASSISTANT_PROMPT_TOKENS=600):
+            prompt = build_prompt("jazz?", candidates)
+        self.assertLessEqual(prompt.tokens, 600)
+        self.assertGreater(prompt.included, 0)
+        self.assertLess(prompt.included, 50)
+        self.assertIn("Concert 0 |", prompt.text)
+
+    @override_settings(TIME_ZONE="UTC")
+    def test_dates_in_local_time(self):
+        prompt = build_prompt("jazz?", [self.candidate(1)])
+        self.assertIn("| 2026-11-07 20:30 |", prompt.text)
+
+    @override_settings(ASSISTANT_PROMPT_TOKENS=600, ASSISTANT_PROMPT_MESSAGE_CHARS=100)
+    def test_long_message_stays_within_budget(self):
+        candidates = [self.candidate(i, "Descripció llarga de l'esdeveniment. " * 20) for i in range(50)]
+        prompt = build_prompt("vull un concert de jazz " * 200, candidates)
+        self.assertLessEqual(prompt.tokens, 600)
+        self.assertGreater(prompt.included, 0)
+        self.assertLess(len(prompt.text.rsplit("Petició de l'usuari: ", 1)[1]), 102)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+
+    @override_settings(ASSISTANT_MAX_CONCURRENCY=1, ASSISTANT_QUEUE_SIZE=2)
+    def test_fifo_queue_and_shedding(self):
+        async def scenario():
+            controller = admission.AdmissionController()
+            first = controller.enter()
+            second = controller.enter()
+            third = controller.enter()
+            self.assertTrue(first.granted)
+            self.assertEqual((controller.position(second), controller.position(third)), (1, 2))
+            self.assertTrue(controller.shed())
+            with self.assertRaises(admission.Overloaded):
+                controller.enter()
+
+            controller.release(first)
+            self.assertTrue(second.granted)
+            self.assertEqual(controller.position(third), 1)
+            controller.release(third)  # abandona la cua
+            controller.release(second)
+            return controller.stats()
+
+        stats = asyncio.run(scenario())
+        self.assertEqual((stats["active"], stats["queued"]), (0, 0))
+        self.assertEqual((stats["admitted"], stats["rejected"], stats["max_queue_depth"]), (2, 2, 2))
+
+    @override_settings(ASSISTANT_MAX_CONCURRENCY=1, ASSISTANT_QUEUE_SIZE=2)
+    def test_wait_sync_across_threads(self):
+        controller = admission.AdmissionController()
+        first = controller.enter()
+        second = controller.enter()
+        positions = []
+        waiter = threading.Thread(target=lambda: positions.extend(controller.wait_sync(second, poll=5)))
+        waiter.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        controller.release(first)
+        waiter.join(2)
+        # El torn desperta el fil en lloc d'esperar el següent poll
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(positions, [1])
+        self.assertTrue(second.granted)
+        controller.release(second)
+        self.assertEqual(controller.stats()["active"], 0)
+
+    @override_settings(ASSISTANT_MAX_CONCURRENCY=1, ASSISTANT_QUEUE_SIZE=1, ASSISTANT_QUEUE_TIMEOUT=0.05)
+    def test_wait_sync_timeout(self):
+        controller = admission.AdmissionController()
+        controller.enter()
+        ticket = controller.enter()
+        with self.assertRaises(admission.QueueTimeout):
+            list(controller.wait_sync(ticket))
+        self.assertEqual(controller.stats()["queued"], 0)
+
+
+@override_settings(ASSISTANT_MAX_CONCURRENCY=1, ASSISTANT_QUEUE_SIZE=1, ASSISTANT_ANSWER_CACHE_TTL=0)
+class ChatAdmissionTests(FakeOllamaMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.delay = 0.05
+        patcher = mock.patch.object(admission, "controller", admission.AdmissionController())
+        self.controller = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, message):
+        with mock.patch("assistant_chat.views._candidates", return_value=(CANDIDATES, [1.0, 0.0])):
+            return await self.async_client.post(
+                "/assistant/api/chat/", {"message": message}, content_type="application/json"
+            )
+
+    async def read(self, response):
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode("utf-8")
+        return [json.loads(line[len("data: "):]) for line in body.split("\n\n") if line]
+
+    async def wait_for(self, condition):
+        for _ in range(200):
+            if condition(self.controller.stats()):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"No s'ha arribat a l'estat esperat: {self.controller.stats()}")
+
+    async def test_queues_and_sheds(self):
+        first = asyncio.ensure_future(self.read(await self.post("u")))
+        await self.wait_for(lambda s: s["active"] == 1)
+        second = asyncio.ensure_future(self.read(await self.post("dos")))
+        await self.wait_for(lambda s: s["queued"] == 1)
+
+        response = await self.post("tres")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("error", json.loads(response.content))
+
+        events = await second
+        await first
+        self.assertEqual(events[1], {"type": "queued", "position": 1})
+        self.assertEqual("".join(e["text"] for e in events if e["type"] == "text"), "".join(TOKENS))
+        self.assertEqual(self.server.max_active, 1)
+
+        stats = self.controller.stats()
+        self.assertEqual((stats["admitted"], stats["rejected"], stats["max_queue_depth"]), (2, 1, 1))
+        self.assertGreater(stats["wait_max_ms"], 0)
+        self.assertEqual((stats["active"], stats["queued"]), (0, 0))
+
+    @override_settings(ASSISTANT_QUEUE_TIMEOUT=0.1)
+    async def test_queue_timeout(self):
+        first = asyncio.ensure_future(self.read(await self.post("u")))
+        await self.wait_for(lambda s: s["active"] == 1)
+        events = await self.read(await self.post("dos"))
+        await first
+        self.assertEqual(events[-1]["type"], "error")
+        self.assertEqual(self.controller.stats()["timeouts"], 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class ChatStatsViewTests(TestCase):
+
+    def test_staff_sees_all_caches(self):
+        from users.models import CustomUser
+
+        staff = CustomUser.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_login(staff)
+        data = self.client.get("/assistant/api/stats/").json()
+        self.assertEqual(set(data), {"admission", "answer_cache", "embed_cache"})
+        self.assertIn("hit_rate", data["embed_cache"])
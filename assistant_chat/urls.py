@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import chat_page, chat_api
+from .views import chat_page, chat_api, chat_stats
 
 app_name = "assistant_chat"
 
 urlpatterns = [
     path("assistant/", chat_page, name="page"),
     path("assistant/api/chat/", chat_api, name="api_chat"),
+    path("assistant/api/stats/", chat_stats, name="api_stats"),
 ]
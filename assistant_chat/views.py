@@ -1,32 +1,99 @@
 import json
+import logging
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
 from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 
+from semantic_search.services.embeddings import embed_cache_stats, embed_text
+from .services import admission, answer_cache
 from .services.retriever import retrieve_events
 from .services.prompts import build_prompt
-from .services.llm_ollama import generate_stream
+from .services.llm_ollama import agenerate_stream, generate_stream
+
+logger = logging.getLogger(__name__)
+
+_OVERLOADED = "L'assistent té massa peticions ara mateix. Torna-ho a provar d'aquí a uns segons."
 
 def chat_page(request):
     return render(request, "assistant_chat/chat.html")
 
-@csrf_exempt
-def chat_api(request):
-    if request.method != "POST":
-        return JsonResponse({"error": "POST only"}, status=405)
+def _event(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
 
-    try:
-        payload = json.loads(request.body.decode("utf-8"))
-    except Exception:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+def _prompt(message: str, candidates: list):
+    prompt = build_prompt(message, candidates)
+    logger.info("Prompt de l'assistent: %s tokens (estimats), %s/%s candidats", prompt.tokens, prompt.included, len(candidates))
+    return prompt
 
-    message = (payload.get("message") or "").strip()
-    only_future = bool(payload.get("only_future", True))
+class _AnswerStream:
+    """
+    Esdeveniments SSE d'una resposta, comuns a la variant asíncrona (ASGI) i a
+    la síncrona (WSGI) de chat_api: cadascuna només hi posa l'espera del torn
+    i la lectura del model.
+    """
 
-    if not message:
-        return JsonResponse({"error": "Empty message"}, status=400)
+    def __init__(self, message: str, candidates: list, cached):
+        self.message = message
+        self.candidates = candidates
+        self.cached = cached
+        self.finished = False
+        self.ticket = None
+        self.chunks = []
+
+    def opening(self) -> list:
+        # La descripció només es fa servir al prompt
+        events = [{k: v for k, v in c.items() if k != "description"} for c in self.candidates[:3]]
+        frames = [_event({'type': 'metadata', 'events': events})]
+        if self.cached is not None:
+            frames.append(_event({'type': 'text', 'text': self.cached}))
+            self.finished = True
+        return frames
+
+    def enter(self):
+        """Demana torn. Retorna l'error a enviar si la cua és plena."""
+        try:
+            self.ticket = admission.controller.enter()
+        except admission.Overloaded:
+            return self.overloaded()
+        return None
+
+    def release(self):
+        admission.controller.release(self.ticket)
 
-    ranked = retrieve_events(message, only_future=only_future, k=8)
+    def queued(self, position: int) -> str:
+        return _event({'type': 'queued', 'position': position})
+
+    def overloaded(self) -> str:
+        return _event({'type': 'error', 'error': _OVERLOADED})
+
+    def prompt(self) -> str:
+        return _prompt(self.message, self.candidates).text
+
+    def text(self, chunk: str) -> str:
+        self.chunks.append(chunk)
+        return _event({'type': 'text', 'text': chunk})
+
+    def model_error(self, error: Exception) -> str:
+        return _event({'type': 'text', 'text': f' [Error de model IA: {str(error)}]'})
+
+    def answer(self, query_vec, signature: str) -> str:
+        """Resposta completa (només es guarden aquestes); també va a la cache semàntica."""
+        answer = "".join(self.chunks)
+        answer_cache.semantic_cache.put(self.message, query_vec, signature, answer)
+        return answer
+
+def _candidates(message: str, only_future: bool):
+    """Retorna (candidats, embedding de la consulta)."""
+    close_old_connections()
+    try:
+        query_vec = embed_text(message)
+        ranked = retrieve_events(message, only_future=only_future, k=8, query_vec=query_vec)
+    finally:
+        close_old_connections()
 
     candidates = []
     for e, score in ranked:
@@ -38,17 +105,113 @@ def chat_api(request):
             "tags": e.tags or "",
             "url": e.get_absolute_url(),
             "score": round(float(score), 3),
+            "description": e.description or "",
         })
+    return candidates, query_vec
 
-    prompt = build_prompt(message, candidates)
+@csrf_exempt
+async def chat_api(request):
+    """
+    Vista asíncrona: amb un servidor ASGI la resposta en streaming del model
+    no ocupa cap fil de worker mentre s'esperen els tokens. Amb WSGI la
+    resposta és un generador síncron (vegeu sync_event_stream), perquè
+    Django consumiria sencer un generador asíncron abans d'enviar-ne res.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-    def event_stream():
-        yield f"data: {json.dumps({'type': 'metadata', 'events': candidates[:3]})}\n\n"
-        
+    message = (payload.get("message") or "").strip()
+    only_future = bool(payload.get("only_future", True))
+
+    if not message:
+        return JsonResponse({"error": "Empty message"}, status=400)
+
+    # La recuperació (DB + embeddings) és síncrona
+    candidates, query_vec = await sync_to_async(_candidates, thread_sensitive=False)(message, only_future)
+
+    key = answer_cache.cache_key(message, candidates)
+    signature = answer_cache.candidate_signature(candidates)
+    cached = await answer_cache.aget(key)
+    if cached is None:
+        # Una altra formulació de la mateixa petició, amb els mateixos candidats
+        cached = answer_cache.semantic_cache.get(query_vec, signature)
+
+    if cached is None and admission.controller.shed():
+        response = JsonResponse({"error": _OVERLOADED}, status=503)
+        response["Retry-After"] = "5"
+        return response
+
+    async def event_stream():
+        stream = _AnswerStream(message, candidates, cached)
+        for frame in stream.opening():
+            yield frame
+        if stream.finished:
+            return
+        # El torn es demana dins del generador perquè es pugui alliberar sempre al finally
+        refused = stream.enter()
+        if refused:
+            yield refused
+            return
+        try:
+            try:
+                async for position in admission.controller.wait(stream.ticket):
+                    yield stream.queued(position)
+            except admission.QueueTimeout:
+                yield stream.overloaded()
+                return
+            try:
+                async for chunk in agenerate_stream(stream.prompt()):
+                    yield stream.text(chunk)
+            except Exception as e:
+                yield stream.model_error(e)
+                return
+        finally:
+            stream.release()
+        await answer_cache.aset(key, stream.answer(query_vec, signature))
+
+    def sync_event_stream():
+        # El mateix que event_stream, llegit pel fil del worker WSGI amb la
+        # sessió compartida de requests: cada token s'envia quan arriba
+        stream = _AnswerStream(message, candidates, cached)
+        for frame in stream.opening():
+            yield frame
+        if stream.finished:
+            return
+        refused = stream.enter()
+        if refused:
+            yield refused
+            return
         try:
-            for chunk in generate_stream(prompt):
-                yield f"data: {json.dumps({'type': 'text', 'text': chunk})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'text', 'text': f' [Error de model IA: {str(e)}]'})}\n\n"
-            
+            try:
+                for position in admission.controller.wait_sync(stream.ticket):
+                    yield stream.queued(position)
+            except admission.QueueTimeout:
+                yield stream.overloaded()
+                return
+            try:
+                for chunk in generate_stream(stream.prompt()):
+                    yield stream.text(chunk)
+            except Exception as e:
+                yield stream.model_error(e)
+                return
+        finally:
+            stream.release()
+        answer_cache.put(key, stream.answer(query_vec, signature))
+
+    if not isinstance(request, ASGIRequest):
+        return StreamingHttpResponse(sync_event_stream(), content_type='text/event-stream')
     return StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+
+@staff_member_required
+def chat_stats(request):
+    """Mètriques d'aquest procés: cua de generació, caches de respostes i d'embeddings de consultes."""
+    return JsonResponse({
+        "admission": admission.controller.stats(),
+        "answer_cache": answer_cache.stats(),
+        "embed_cache": embed_cache_stats(),
+    })
@@ -0,0 +1,108 @@
+"""
+Endpoint ASGI de push del xat (Server-Sent Events).
+
+GET /chat/<event_pk>/stream/ manté la connexió oberta i envia cada missatge
+nou, esborrat o destacat de l'event tan bon punt es publica al hub.
+El polling de chat_load_messages continua disponible com a alternativa.
+"""
+import asyncio
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+
+from .services import hub
+from .services.serializers import present_message
+
+
+def _load_context(cookie_header: str, event_pk: int):
+    """
+    Retorna (creator_id, viewer_id, viewer_is_staff) o None si l'event no existeix.
+    Reutilitza la sessió de Django per identificar l'usuari.
+    """
+    from django.contrib.auth import get_user
+    from events.models import Event
+
+    close_old_connections()
+    try:
+        creator_id = Event.objects.filter(pk=event_pk).values_list('creator_id', flat=True).first()
+        if creator_id is None:
+            return None
+
+        request = HttpRequest()
+        request.COOKIES = parse_cookie(cookie_header)
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        user = get_user(request)
+        if user.is_authenticated:
+            return creator_id, user.pk, user.is_staff
+        return creator_id, None, False
+    finally:
+        close_old_connections()
+
+
+def _encode(data: dict) -> bytes:
+    return f"data: {json.dumps(data)}\n\n".encode('utf-8')
+
+
+async def chat_stream(scope, receive, send, event_pk: int):
+    headers = dict(scope.get('headers') or [])
+    cookie_header = headers.get(b'cookie', b'').decode('latin-1')
+    context = await sync_to_async(_load_context, thread_sensitive=False)(cookie_header, event_pk)
+    if context is None:
+        await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not found'})
+        return
+    creator_id, viewer_id, viewer_is_staff = context
+
+    subscription = hub.subscribe(event_pk)
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    keepalive = getattr(settings, 'CHAT_STREAM_KEEPALIVE', 15)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        while not disconnected.is_set() and not subscription.overflowed:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, watcher}, timeout=keepalive, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not disconnected.is_set():
+                    # Comentari SSE per mantenir viva la connexió a través de proxies
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+
+            payload = getter.result()
+            if payload.get('type') == 'message':
+                payload = {
+                    'type': 'message',
+                    'message': present_message(payload['message'], viewer_id, viewer_is_staff, creator_id),
+                }
+            await send({'type': 'http.response.body', 'body': _encode(payload), 'more_body': True})
+
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        subscription.close()
@@ -21,6 +21,9 @@ class ChatMessage(models.Model):
     
     # Data automàtica
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # Última modificació (esborrat, destacat...): serveix de cursor per al polling incremental
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     # Si és True, el missatge no es veu (paperera)
     is_deleted = models.BooleanField(default=False)
@@ -43,9 +46,10 @@ class ChatMessage(models.Model):
         """
         if not user.is_authenticated:
             return False
+        # Comparem ids per no carregar l'autor ni el creador de la DB
         return (
-            user == self.user or
-            user == self.event.creator or
+            user.pk == self.user_id or
+            user.pk == self.event.creator_id or
             user.is_staff
         )
 
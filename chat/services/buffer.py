@@ -0,0 +1,188 @@
+"""
+Buffer per event dels últims missatges del xat, guardat a la cache
+CHAT_BUFFER_CACHE. Els cursors dels clients (?since=<id>) depenen que el
+buffer tingui tots els missatges en ordre d'id, per això:
+
+- Cal una cache compartida entre processos (Redis, Memcached). Amb una cache
+  local (LocMem) cada procés tindria la seva còpia desfasada; llavors el
+  buffer es desactiva i l'estat es llegeix de la DB a cada petició, tret que
+  CHAT_SINGLE_PROCESS digui que només hi ha un procés.
+- Les escriptures (i l'assignació de l'id del missatge nou, vegeu posting())
+  es fan amb un bloqueig per event compartit entre processos (cache.add), de
+  manera que un id més alt mai no arriba al buffer abans que un de més baix.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.dateparse import parse_datetime
+
+from chat.models import ChatMessage
+from events.models import Event
+from . import writer
+from .serializers import message_record
+
+# Records guardats per event (inclou els esborrats, que fan de marca per als cursors)
+BUFFER_SIZE = 100
+# Missatges visibles que es mostren al xat
+VISIBLE_SIZE = 50
+
+# Backends que només viuen dins d'un procés
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Segons màxims que es pot tenir el bloqueig d'un event (si el procés mor, caduca)
+LOCK_TIMEOUT = 5
+
+_local = threading.local()
+# Bloquejos dins del procés, repartits per event
+_stripes = [threading.Lock() for _ in range(64)]
+
+
+def _cache():
+    return caches[getattr(settings, 'CHAT_BUFFER_CACHE', 'default')]
+
+
+def shared_cache() -> bool:
+    """True si CHAT_BUFFER_CACHE és visible per a tots els processos."""
+    alias = getattr(settings, 'CHAT_BUFFER_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return backend not in LOCAL_CACHE_BACKENDS
+
+
+def enabled() -> bool:
+    return shared_cache() or getattr(settings, 'CHAT_SINGLE_PROCESS', False)
+
+
+@contextmanager
+def posting(event_pk: int):
+    """
+    Bloqueig (reentrant) de les escriptures al buffer d'un event. La vista
+    d'enviar hi desa el missatge i l'afegeix al buffer, perquè l'ordre del
+    buffer sigui el dels ids.
+    """
+    held = _local.__dict__.setdefault('held', {})
+    if held.get(event_pk):
+        held[event_pk] += 1
+        try:
+            yield
+        finally:
+            held[event_pk] -= 1
+        return
+
+    with _stripes[event_pk % len(_stripes)]:
+        token = None
+        if shared_cache():
+            cache, key, token = _cache(), f'chat:buffer:lock:{event_pk}', uuid.uuid4().hex
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while not cache.add(key, token, LOCK_TIMEOUT):
+                if time.monotonic() > deadline:
+                    # Un procés ha mort amb el bloqueig: el nostre add el substituirà quan caduqui
+                    raise TimeoutError(f"No s'ha pogut bloquejar el buffer del xat {event_pk}")
+                time.sleep(0.002)
+        held[event_pk] = 1
+        try:
+            yield
+        finally:
+            held.pop(event_pk, None)
+            if token is not None and cache.get(key) == token:
+                cache.delete(key)
+
+
+def _key(event_pk: int) -> str:
+    return f'chat:buffer:{event_pk}'
+
+
+def _timeout():
+    return getattr(settings, 'CHAT_BUFFER_TTL', 60)
+
+
+def _latest(*stamps):
+    """El més recent d'uns quants instants ISO (ignorant els buits)."""
+    return max(filter(None, stamps), key=parse_datetime, default=None)
+
+
+def _fill(event_pk: int, store: bool = True):
+    """
+    Omple el buffer des de la DB (2 consultes). Retorna None si l'event no existeix.
+    """
+    creator_id = Event.objects.filter(pk=event_pk).values_list('creator_id', flat=True).first()
+    if creator_id is None:
+        return None
+    messages = (
+        ChatMessage.objects.filter(event_id=event_pk)
+        .select_related('user')
+        .order_by('-id')[:BUFFER_SIZE]
+    )
+    records = [message_record(m) for m in reversed(list(messages))]
+
+    # En mode write-behind, els missatges encara a la cua no són a la DB
+    if writer.enabled():
+        known = {r['id'] for r in records}
+        pending = [m for m in writer.get_queue().pending_for(event_pk) if m.id not in known]
+        records = sorted(records + [message_record(m) for m in pending], key=lambda r: r['id'])[-BUFFER_SIZE:]
+    state = {
+        'creator_id': creator_id,
+        'records': records,
+        'version': _latest(*(r['updated_at'] for r in records)),
+    }
+    if store:
+        _cache().set(_key(event_pk), state, _timeout())
+    return state
+
+
+def get_state(event_pk: int):
+    """
+    Estat del xat d'un event: {'creator_id', 'records', 'version'}.
+    Les lectures surten de la cache; només es consulta la DB si està freda
+    (o sempre, si el buffer està desactivat).
+    """
+    if not enabled():
+        return _fill(event_pk, store=False)
+    state = _cache().get(_key(event_pk))
+    if state is None:
+        # Sota el bloqueig: un missatge afegit mentre llegim la DB no es pot perdre
+        with posting(event_pk):
+            state = _cache().get(_key(event_pk)) or _fill(event_pk)
+    return state
+
+
+def _modify(event_pk: int, change):
+    # Write-through. Si el buffer és fred, omplir-lo ja inclou el canvi
+    if not enabled():
+        return
+    with posting(event_pk):
+        cache = _cache()
+        state = cache.get(_key(event_pk))
+        if state is None:
+            _fill(event_pk)
+            return
+        change(state)
+        cache.set(_key(event_pk), state, _timeout())
+
+
+def append(event_pk: int, record: dict):
+    """Afegeix un missatge nou al buffer, en la posició que li toca per id."""
+    def change(state):
+        records = [r for r in state['records'] if r['id'] != record['id']]
+        records.append(record)
+        records.sort(key=lambda r: r['id'])
+        state['records'] = records[-BUFFER_SIZE:]
+        state['version'] = _latest(state['version'], record['updated_at'])
+    _modify(event_pk, change)
+
+
+def update(event_pk: int, record: dict):
+    """Substitueix un missatge existent (esborrat, destacat)."""
+    def change(state):
+        state['records'] = [record if r['id'] == record['id'] else r for r in state['records']]
+        state['version'] = _latest(state['version'], record['updated_at'])
+    _modify(event_pk, change)
+
+
+def clear(event_pk: int):
+    _cache().delete(_key(event_pk))
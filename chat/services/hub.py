@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LocalBackend:
+    """
+    Pub/sub en memòria del procés. Només arriba als subscriptors del mateix
+    procés: per a diversos processos cal un backend compartit (CHAT_PUBSUB_BACKEND).
+
+    Un backend ha d'implementar subscribe(event_id, callback) -> funció per
+    donar-se de baixa, i publish(event_id, payload). Els callbacks poden ser
+    cridats des de qualsevol fil.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, event_id: int, callback):
+        with self._lock:
+            self._subscribers[event_id].add(callback)
+
+        def unsubscribe():
+            with self._lock:
+                subs = self._subscribers.get(event_id)
+                if subs is not None:
+                    subs.discard(callback)
+                    if not subs:
+                        del self._subscribers[event_id]
+
+        return unsubscribe
+
+    def publish(self, event_id: int, payload: dict):
+        with self._lock:
+            callbacks = list(self._subscribers.get(event_id, ()))
+        for callback in callbacks:
+            callback(payload)
+
+    def subscriber_count(self, event_id: int) -> int:
+        with self._lock:
+            return len(self._subscribers.get(event_id, ()))
+
+
+class Subscription:
+    """
+    Subscripció d'una connexió ASGI. Rep els missatges en una cua asyncio
+    del seu event loop; si el client és massa lent i la cua s'omple, es marca
+    com a desbordada i la connexió s'ha de tancar (el client es reconnecta).
+    """
+
+    def __init__(self, backend, event_id: int, maxsize: int):
+        self._loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+        self._unsubscribe = backend.subscribe(event_id, self._deliver)
+
+    def _deliver(self, payload: dict):
+        self._loop.call_soon_threadsafe(self._put, payload)
+
+    def _put(self, payload: dict):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def close(self):
+        self._unsubscribe()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'CHAT_PUBSUB_BACKEND', 'chat.services.hub.LocalBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def publish(event_id: int, payload: dict):
+    """Envia un esdeveniment de xat a tots els subscriptors de l'event."""
+    get_backend().publish(event_id, payload)
+
+
+def subscribe(event_id: int) -> Subscription:
+    """S'ha de cridar des d'un event loop (connexió ASGI)."""
+    return Subscription(get_backend(), event_id, getattr(settings, 'CHAT_STREAM_QUEUE_SIZE', 100))
@@ -0,0 +1,39 @@
+from django.utils.dateparse import parse_datetime
+from django.utils.timesince import timesince
+
+
+def message_record(msg) -> dict:
+    """
+    Representació d'un missatge independent de qui el mira.
+    És el que viatja pel hub de push (i per tant ha de ser JSON).
+    """
+    return {
+        'id': msg.id,
+        'user_id': msg.user_id,
+        'user': msg.user.username,
+        'display_name': msg.get_user_display_name(),
+        'message': msg.message,
+        'created_at': msg.created_at.isoformat(),
+        'updated_at': msg.updated_at.isoformat(),
+        'is_highlighted': msg.is_highlighted,
+        'is_deleted': msg.is_deleted,
+    }
+
+
+def present_message(record: dict, viewer_id=None, viewer_is_staff=False, creator_id=None) -> dict:
+    """
+    Converteix un record al format que espera chat.js, calculant els camps
+    que depenen de l'usuari que mira (can_delete) i de l'hora actual.
+    """
+    can_delete = viewer_id is not None and (
+        viewer_id == record['user_id'] or viewer_id == creator_id or viewer_is_staff
+    )
+    return {
+        'id': record['id'],
+        'user': record['user'],
+        'display_name': record['display_name'],
+        'message': record['message'],
+        'created_at': f"fa {timesince(parse_datetime(record['created_at']))}",
+        'can_delete': can_delete,
+        'is_highlighted': record['is_highlighted'],
+    }
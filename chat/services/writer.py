@@ -0,0 +1,227 @@
+"""
+Mode write-behind del xat (CHAT_WRITE_BEHIND).
+
+Els missatges acceptats reben un id i es publiquen de seguida (buffer i hub),
+però es desen a la DB per lots amb bulk_create cada CHAT_WRITE_BEHIND_INTERVAL
+segons o quan n'hi ha CHAT_WRITE_BEHIND_BATCH de pendents. En sortir del procés
+es buida la cua.
+
+Els ids es reserven amb un comptador atòmic a la cache (cache.incr), que
+només és únic entre processos si CHAT_BUFFER_CACHE és una cache compartida
+(Redis, Memcached). Amb una cache local el mode no s'activa (les escriptures
+van directes a la DB) tret que CHAT_SINGLE_PROCESS digui que hi ha un sol procés.
+Si el comptador desapareix de la cache (reinici, evicció), es torna a sembrar
+amb l'id més alt de la DB més CHAT_WRITE_BEHIND_ID_GAP: els ids pendents dels
+altres workers, que encara no són a la DB, queden per sota del salt.
+
+Un lot que no es pot desar es reintenta; després de CHAT_WRITE_BEHIND_RETRIES
+intents es desa missatge a missatge i els que la DB rebutja (IntegrityError,
+DataError) es descarten i s'esborren del xat, perquè no bloquegin la resta.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from chat.models import ChatMessage
+from events.models import Event
+
+from . import buffer, hub
+from .serializers import message_record
+
+logger = logging.getLogger(__name__)
+
+_ID_KEY = 'chat:next_message_id'
+_warned = False
+
+
+def enabled() -> bool:
+    global _warned
+    if not getattr(settings, 'CHAT_WRITE_BEHIND', False):
+        return False
+    if buffer.enabled():
+        return True
+    if not _warned:
+        _warned = True
+        logger.warning(
+            'CHAT_WRITE_BEHIND necessita una cache compartida a CHAT_BUFFER_CACHE '
+            '(o CHAT_SINGLE_PROCESS): els missatges es desaran directament a la DB'
+        )
+    return False
+
+
+def _cache():
+    return caches[getattr(settings, 'CHAT_BUFFER_CACHE', 'default')]
+
+
+def allocate_id() -> int:
+    cache = _cache()
+    try:
+        return cache.incr(_ID_KEY)
+    except ValueError:
+        # Primer ús (o el comptador ha sortit de la cache): el sembrem per sobre
+        # de la DB i dels pendents de tots els processos (vegeu el docstring)
+        last = ChatMessage.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        last = max(last, get_queue().max_pending_id()) + getattr(settings, 'CHAT_WRITE_BEHIND_ID_GAP', 100000)
+        cache.add(_ID_KEY, last, None)
+        return cache.incr(_ID_KEY)
+
+
+def event_info(event_pk: int):
+    """
+    (status, creator_id) de l'event amb una cache molt curta, per no fer una
+    consulta a Event per cada missatge durant una ràfega. None si no existeix.
+    """
+    cache = _cache()
+    key = f'chat:event_info:{event_pk}'
+    info = cache.get(key)
+    if info is None:
+        row = Event.objects.filter(pk=event_pk).values_list('status', 'creator_id').first()
+        if row is None:
+            return None
+        info = tuple(row)
+        cache.set(key, info, getattr(settings, 'CHAT_EVENT_INFO_TTL', 2))
+    return info
+
+
+def _write(batch):
+    """
+    bulk_create amb les dates que ja s'han publicat: auto_now i auto_now_add
+    les sobreescriurien, i llavors el buffer i la DB no coincidirien.
+    """
+    stamps = [(m.created_at, m.updated_at) for m in batch]
+    try:
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(batch)
+            for msg, (created_at, updated_at) in zip(batch, stamps):
+                msg.created_at, msg.updated_at = created_at, updated_at
+            ChatMessage.objects.bulk_update(batch, ['created_at', 'updated_at'])
+    finally:
+        for msg, (created_at, updated_at) in zip(batch, stamps):
+            msg.created_at, msg.updated_at = created_at, updated_at
+
+
+def _discard(msg):
+    # Els espectadors ja l'han vist: desapareix del xat com un missatge esborrat
+    msg.is_deleted = True
+    msg.updated_at = timezone.now()
+    buffer.update(msg.event_id, message_record(msg))
+    hub.publish(msg.event_id, {'type': 'deleted', 'id': msg.id})
+
+
+class WriteBehindQueue:
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # una sola escriptura a la vegada
+        self._pending = []
+        self._pending_ids = set()
+        self._failures = 0  # intents fallits seguits del lot actual
+        self._thread = None
+
+    def submit(self, msg: ChatMessage):
+        """Assigna id i dates al missatge i el deixa pendent de desar."""
+        now = timezone.now()
+        msg.id = allocate_id()
+        msg.created_at = msg.updated_at = now
+        with self._cond:
+            self._pending.append(msg)
+            self._pending_ids.add(msg.id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='chat-write-behind', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= getattr(settings, 'CHAT_WRITE_BEHIND_BATCH', 100):
+                self._cond.notify()
+
+    def is_pending(self, message_pk: int) -> bool:
+        with self._cond:
+            return message_pk in self._pending_ids
+
+    def pending_for(self, event_pk: int) -> list:
+        with self._cond:
+            return [m for m in self._pending if m.event_id == event_pk]
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def max_pending_id(self) -> int:
+        with self._cond:
+            return max(self._pending_ids, default=0)
+
+    def flush(self):
+        """
+        Desa tots els missatges pendents amb un sol bulk_create. El lot continua
+        a la cua (visible per pending_for) fins que l'escriptura ha acabat.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._pending)
+            if not batch:
+                return
+            try:
+                _write(batch)
+            except Exception:
+                self._failures += 1
+                retries = getattr(settings, 'CHAT_WRITE_BEHIND_RETRIES', 3)
+                if self._failures < retries:
+                    logger.exception(
+                        'No s\'han pogut desar %s missatges de xat (intent %s de %s); es tornaran a provar',
+                        len(batch), self._failures, retries,
+                    )
+                    raise
+                logger.exception('El lot de %s missatges de xat continua fallant: es desa un per un', len(batch))
+                self._one_by_one(batch)
+            self._failures = 0
+            self._done(batch)
+
+    def _one_by_one(self, batch):
+        done = []
+        try:
+            for msg in batch:
+                try:
+                    _write([msg])
+                except (IntegrityError, DataError):
+                    logger.exception('Es descarta el missatge de xat %s: la DB el rebutja', msg.id)
+                    _discard(msg)
+                done.append(msg)
+        except Exception:
+            # Una altra mena d'error (p. ex. la DB no respon): la resta es queda a la cua
+            self._done(done)
+            raise
+
+    def _done(self, batch):
+        written = {m.id for m in batch}
+        with self._cond:
+            self._pending = [m for m in self._pending if m.id not in written]
+            self._pending_ids.difference_update(written)
+
+    def _run(self):
+        interval = getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL', 0.2)
+        while True:
+            with self._cond:
+                self._cond.wait(interval)
+            try:
+                self.flush()
+            except Exception:
+                pass  # ja registrat a flush(); es reintenta al següent interval
+            finally:
+                connection.close()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> WriteBehindQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue()
+                atexit.register(_queue.flush)
+    return _queue
@@ -4,11 +4,18 @@ document.addEventListener('DOMContentLoaded', function() {
     const chatErrors = document.getElementById('chat-errors');
     const messageCount = document.getElementById('message-count');
 
+    // Cursor del polling incremental: últim id vist, últim canvi i ETag de la resposta
+    let cursor = null;
+    let etag = null;
+
     // Carrega els missatges només obrir la pàgina
     loadMessages();
 
     // Actualitza el xat automàticament cada 3 segons
-    setInterval(loadMessages, 3000);
+    let pollTimer = setInterval(loadMessages, 3000);
+
+    // Si el servidor suporta push (SSE), deixem de fer polling
+    connectStream();
 
     // Enviar missatge quan es prem el botó
     if (chatForm) {
@@ -32,18 +39,113 @@ document.addEventListener('DOMContentLoaded', function() {
     // Demana els missatges nous al servidor
     function loadMessages() {
         if (typeof eventId === 'undefined') return;
-        
-        fetch(`/chat/${eventId}/messages/`)
-            .then(response => response.json())
+
+        // La primera vegada ho demanem tot; després només els canvis des del cursor
+        let url = `/chat/${eventId}/messages/`;
+        const headers = {};
+        if (cursor) {
+            url += `?since=${cursor.since}`;
+            if (cursor.changed) url += `&changed=${encodeURIComponent(cursor.changed)}`;
+            if (etag) headers['If-None-Match'] = etag;
+        }
+        const incremental = cursor !== null;
+
+        fetch(url, {headers: headers, cache: 'no-store'})
+            .then(response => {
+                if (response.status === 304) return null; // Res de nou
+                etag = response.headers.get('ETag');
+                return response.json();
+            })
             .then(data => {
-                if (data.messages) {
+                if (!data || !data.messages) return;
+                if (incremental) {
+                    applyChanges(data);
+                } else {
                     renderMessages(data.messages);
-                    updateMessageCount(data.messages.length);
                 }
+                cursor = data.cursor;
+                updateMessageCount(chatMessages.querySelectorAll('.chat-message').length);
             })
             .catch(error => console.error('Error:', error));
     }
 
+    // Aplica una resposta incremental del polling
+    function applyChanges(data) {
+        data.messages.forEach(appendMessage);
+        (data.deleted || []).forEach(id => {
+            const el = findMessageElement(id);
+            if (el) el.remove();
+        });
+        (data.highlighted || []).forEach(item => {
+            const el = findMessageElement(item.id);
+            if (el) el.classList.toggle('highlighted', item.is_highlighted);
+        });
+        if (data.deleted && data.deleted.length && !chatMessages.querySelector('.chat-message')) {
+            chatMessages.innerHTML = '<p class="text-center mt-3 text-muted">Encara no hi ha missatges.</p>';
+        }
+    }
+
+    // Connexió push: el servidor ens envia els canvis quan passen
+    function connectStream() {
+        if (typeof eventId === 'undefined' || !window.EventSource) return;
+
+        const source = new EventSource(`/chat/${eventId}/stream/`);
+
+        source.onopen = function() {
+            if (pollTimer) {
+                clearInterval(pollTimer);
+                pollTimer = null;
+            }
+            loadMessages(); // Recuperem el que hagi arribat mentre no estàvem connectats
+        };
+
+        source.onmessage = function(e) {
+            handlePush(JSON.parse(e.data));
+        };
+
+        source.onerror = function() {
+            // Sense servidor ASGI o connexió caiguda: tornem al polling
+            if (!pollTimer) {
+                pollTimer = setInterval(loadMessages, 3000);
+            }
+        };
+    }
+
+    // Aplica un canvi rebut per push sense tornar a dibuixar tot el xat
+    function handlePush(data) {
+        if (data.type === 'message') {
+            appendMessage(data.message);
+        } else if (data.type === 'deleted') {
+            const el = findMessageElement(data.id);
+            if (el) el.remove();
+        } else if (data.type === 'highlighted') {
+            const el = findMessageElement(data.id);
+            if (el) el.classList.toggle('highlighted', data.is_highlighted);
+        }
+        updateMessageCount(chatMessages.querySelectorAll('.chat-message').length);
+    }
+
+    function findMessageElement(messageId) {
+        return chatMessages.querySelector(`.chat-message[data-message-id="${messageId}"]`);
+    }
+
+    function appendMessage(msg) {
+        if (findMessageElement(msg.id)) return;
+
+        // Treu el text "Encara no hi ha missatges"
+        if (!chatMessages.querySelector('.chat-message')) {
+            chatMessages.innerHTML = '';
+        }
+        chatMessages.appendChild(createMessageElement(msg));
+
+        // Com el polling, mostrem com a màxim els últims 50
+        const all = chatMessages.querySelectorAll('.chat-message');
+        for (let i = 0; i < all.length - 50; i++) {
+            all[i].remove();
+        }
+        scrollToBottom();
+    }
+
     // Dibuixa els missatges a la pantalla
     function renderMessages(messages) {
         chatMessages.innerHTML = ''; // Neteja el xat
@@ -1,3 +1,342 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from events.models import Event
+from users.models import CustomUser
+from .models import ChatMessage
+
+
+def buffer_records(event_pk):
+    from .services import buffer
+
+    return buffer.get_state(event_pk)['records']
+
+# Consultes d'un poll amb el buffer fred: sessió, usuari, event i missatges amb autors
+COLD_POLL_QUERIES = 4
+# Amb el buffer calent només queden la sessió i l'usuari
+WARM_POLL_QUERIES = 2
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False, CHAT_SINGLE_PROCESS=True)
+class ChatLoadMessagesQueryTests(TestCase):
+    """
+    Regressió N+1: el cost d'un poll no pot dependre del nombre de missatges.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = CustomUser.objects.create_user(username='creador', password='x')
+        cls.viewer = CustomUser.objects.create_user(username='espectador', password='x')
+        cls.event = Event.objects.create(
+            title='Directe', description='Prova', creator=cls.creator,
+            category='gaming', scheduled_date=timezone.now(), status='live',
+        )
+        authors = [
+            CustomUser.objects.create_user(username=f'autor{i}', password='x', display_name=f'Autor {i}')
+            for i in range(10)
+        ]
+        for i in range(60):
+            ChatMessage.objects.create(
+                event=cls.event, user=authors[i % 10], message=f'missatge {i}', is_deleted=(i % 7 == 0),
+            )
+        cls.url = reverse('chat:load_messages', args=[cls.event.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    def test_full_poll_query_count(self):
+        with self.assertNumQueries(COLD_POLL_QUERIES):
+            response = self.client.get(self.url)
+        messages = response.json()['messages']
+        self.assertEqual(len(messages), 50)
+        self.assertFalse(any(m['can_delete'] for m in messages))
+
+        with self.assertNumQueries(WARM_POLL_QUERIES):
+            self.assertEqual(self.client.get(self.url).json()['messages'], messages)
+
+    def test_incremental_poll_query_count(self):
+        cursor = self.client.get(self.url).json()['cursor']
+        with self.assertNumQueries(WARM_POLL_QUERIES):
+            response = self.client.get(self.url, {'since': cursor['since'] - 20, 'changed': cursor['changed']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_creator_can_delete_without_extra_queries(self):
+        self.client.force_login(self.creator)
+        with self.assertNumQueries(COLD_POLL_QUERIES):
+            response = self.client.get(self.url)
+        self.assertTrue(all(m['can_delete'] for m in response.json()['messages']))
+
+    def test_invalid_changed_cursor_is_ignored(self):
+        cursor = self.client.get(self.url).json()['cursor']
+        for changed in ('2024-13-45T00:00:00', '2024-01-01T00:00:00', 'no', ''):
+            with self.subTest(changed=changed):
+                response = self.client.get(self.url, {'since': cursor['since'], 'changed': changed})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['deleted'], [])
+
+    def test_buffer_keeps_id_order(self):
+        from .services import buffer
+
+        cursor = self.client.get(self.url).json()['cursor']
+        base = {'is_deleted': False, 'is_highlighted': False, 'updated_at': cursor['changed']}
+        state = buffer.get_state(self.event.pk)
+        last = state['records'][-1]
+        # Un id més alt arriba abans que el més baix
+        buffer.append(self.event.pk, dict(last, **base, id=cursor['since'] + 2))
+        buffer.append(self.event.pk, dict(last, **base, id=cursor['since'] + 1))
+        ids = [r['id'] for r in buffer.get_state(self.event.pk)['records']]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_writes_go_through_the_buffer(self):
+        cursor = self.client.get(self.url).json()['cursor']
+        self.client.post(reverse('chat:send_message', args=[self.event.pk]), {'message': 'hola'})
+        self.client.force_login(self.creator)
+        last = ChatMessage.objects.filter(is_deleted=False).order_by('-id')[1]
+        self.client.post(reverse('chat:delete_message', args=[last.pk]))
+
+        with self.assertNumQueries(WARM_POLL_QUERIES):
+            data = self.client.get(self.url, {'since': cursor['since'], 'changed': cursor['changed']}).json()
+        self.assertEqual([m['message'] for m in data['messages']], ['hola'])
+        self.assertEqual(data['deleted'], [last.pk])
+
+
+@override_settings(
+    SEMANTIC_AUTO_EMBED=False, CHAT_WRITE_BEHIND=True, CHAT_WRITE_BEHIND_INTERVAL=60, CHAT_SINGLE_PROCESS=True,
+)
+class ChatWriteBehindTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='fan', password='x')
+        cls.event = Event.objects.create(
+            title='Final', description='Prova', creator=cls.user,
+            category='sports', scheduled_date=timezone.now(), status='live',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        from .services import writer
+
+        # La cua és del procés: es buida dins de la transacció del test
+        writer.get_queue().flush()
+
+    def test_messages_are_visible_before_being_persisted(self):
+        from .services import writer
+
+        send_url = reverse('chat:send_message', args=[self.event.pk])
+        ids = [self.client.post(send_url, {'message': f'gol {i}'}).json()['message']['id'] for i in range(3)]
+        self.assertEqual(ChatMessage.objects.count(), 0)
+
+        data = self.client.get(reverse('chat:load_messages', args=[self.event.pk])).json()
+        self.assertEqual([m['id'] for m in data['messages']], ids)
+
+        writer.get_queue().flush()
+        self.assertEqual(list(ChatMessage.objects.order_by('id').values_list('id', flat=True)), ids)
+
+    def test_batch_stays_visible_while_it_is_written(self):
+        from unittest import mock
+
+        from .services import buffer, writer
+
+        send_url = reverse('chat:send_message', args=[self.event.pk])
+        msg_id = self.client.post(send_url, {'message': 'gol'}).json()['message']['id']
+        seen = []
+
+        def bulk_create(batch):
+            # Encara no és a la DB: un buffer que s'omple ara l'ha de trobar a la cua
+            cache.clear()
+            seen.extend(r['id'] for r in buffer.get_state(self.event.pk)['records'])
+            return original(batch)
+
+        original = ChatMessage.objects.bulk_create
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=bulk_create):
+            writer.get_queue().flush()
+        self.assertIn(msg_id, seen)
+        self.assertEqual(writer.get_queue().pending(), 0)
+
+    def test_persisted_timestamps_match_the_buffer(self):
+        from .services import writer
+
+        send_url = reverse('chat:send_message', args=[self.event.pk])
+        sent = self.client.post(send_url, {'message': 'gol'}).json()['message']
+        record = next(r for r in buffer_records(self.event.pk) if r['id'] == sent['id'])
+        time.sleep(0.01)
+        writer.get_queue().flush()
+        msg = ChatMessage.objects.get(pk=sent['id'])
+        self.assertEqual(msg.created_at.isoformat(), record['created_at'])
+        self.assertEqual(msg.updated_at.isoformat(), record['updated_at'])
+
+    def test_poison_message_is_dropped_after_retries(self):
+        from django.db import IntegrityError
+
+        from .services import writer
+
+        write = writer._write
+
+        def reject_poison(batch):
+            if any(m.message == 'verí' for m in batch):
+                raise IntegrityError('fila invàlida')
+            write(batch)
+
+        send_url = reverse('chat:send_message', args=[self.event.pk])
+        ids = [self.client.post(send_url, {'message': text}).json()['message']['id'] for text in ('u', 'verí', 'dos')]
+        queue = writer.get_queue()
+        with mock.patch.object(writer, '_write', side_effect=reject_poison), self.assertLogs(writer.logger, 'ERROR'):
+            for _ in range(2):
+                with self.assertRaises(IntegrityError):
+                    queue.flush()
+            queue.flush()
+        self.assertEqual(queue.pending(), 0)
+        self.assertEqual(list(ChatMessage.objects.order_by('id').values_list('id', flat=True)), [ids[0], ids[2]])
+        poison = next(r for r in buffer_records(self.event.pk) if r['id'] == ids[1])
+        self.assertTrue(poison['is_deleted'])
+
+    def test_outage_keeps_messages_pending(self):
+        from django.db import OperationalError
+
+        from .services import writer
+
+        self.client.post(reverse('chat:send_message', args=[self.event.pk]), {'message': 'gol'})
+        queue = writer.get_queue()
+        with mock.patch.object(writer, '_write', side_effect=OperationalError('sense DB')), \
+                self.assertLogs(writer.logger, 'ERROR'):
+            for _ in range(4):
+                with self.assertRaises(OperationalError):
+                    queue.flush()
+        self.assertEqual(queue.pending(), 1)
+
+    def test_ids_follow_pending_messages_when_the_counter_is_lost(self):
+        from .services import writer
+
+        send_url = reverse('chat:send_message', args=[self.event.pk])
+        first = self.client.post(send_url, {'message': 'u'}).json()['message']['id']
+        cache.delete(writer._ID_KEY)
+        second = self.client.post(send_url, {'message': 'dos'}).json()['message']['id']
+        self.assertGreater(second, first)
+
+    @override_settings(CHAT_SINGLE_PROCESS=False)
+    def test_disabled_with_local_cache(self):
+        from .services import writer
+
+        self.assertFalse(writer.enabled())
+        self.client.post(reverse('chat:send_message', args=[self.event.pk]), {'message': 'gol'})
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False, CHAT_SINGLE_PROCESS=False)
+class ChatLocalCacheTests(TestCase):
+    """
+    Amb una cache local i diversos processos el buffer quedaria desfasat:
+    llavors es llegeix de la DB i no es perd cap missatge escrit per un altre procés.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='fan', password='x')
+        cls.event = Event.objects.create(
+            title='Final', description='Prova', creator=cls.user,
+            category='sports', scheduled_date=timezone.now(), status='live',
+        )
+        cls.url = reverse('chat:load_messages', args=[cls.event.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_buffer_disabled_with_local_cache(self):
+        from .services import buffer
+
+        self.assertFalse(buffer.enabled())
+        self.client.post(reverse('chat:send_message', args=[self.event.pk]), {'message': 'u'})
+        cursor = self.client.get(self.url).json()['cursor']
+
+        # Escrit per un altre procés: no ha passat pel buffer d'aquest
+        other = ChatMessage.objects.create(event=self.event, user=self.user, message='dos')
+        data = self.client.get(self.url, {'since': cursor['since'], 'changed': cursor['changed']}).json()
+        self.assertEqual([m['id'] for m in data['messages']], [other.pk])
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False, CHAT_STREAM_KEEPALIVE=0.05)
+class ChatStreamAsgiTests(TransactionTestCase):
+    """Endpoint SSE de config.asgi amb receive/send falsos."""
+
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(username='autor', password='x')
+        self.event = Event.objects.create(
+            title='Final', description='Prova', creator=self.author,
+            category='sports', scheduled_date=timezone.now(), status='live', thumbnail=None,
+        )
+        self.message = ChatMessage.objects.create(event=self.event, user=self.author, message='gol')
+
+    async def open(self, event_pk, cookie=''):
+        from config.asgi import application
+
+        inbox, sent = asyncio.Queue(), []
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': f'/chat/{event_pk}/stream/',
+            'headers': [(b'cookie', cookie.encode('latin-1'))],
+        }
+
+        async def send(message):
+            sent.append(message)
+
+        task = asyncio.ensure_future(application(scope, inbox.get, send))
+        return task, inbox, sent
+
+    async def wait_for(self, sent, condition):
+        for _ in range(200):
+            if condition(b''.join(m.get('body', b'') for m in sent)):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'No ha arribat: {sent}')
+
+    async def publish_and_read(self, cookie):
+        from .services import hub
+        from .services.serializers import message_record
+
+        task, inbox, sent = await self.open(self.event.pk, cookie)
+        await self.wait_for(sent, lambda body: body.startswith(b'retry:'))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(hub.get_backend().subscriber_count(self.event.pk), 1)
+
+        record = await sync_to_async(lambda: message_record(ChatMessage.objects.select_related('user').get()))()
+        hub.publish(self.event.pk, {'type': 'message', 'message': record})
+        await self.wait_for(sent, lambda body: b'"type": "message"' in body)
+
+        await inbox.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(task, 2)
+        self.assertEqual(hub.get_backend().subscriber_count(self.event.pk), 0)
+
+        body = b''.join(m.get('body', b'') for m in sent).decode('utf-8')
+        data = next(line for line in body.split('\n\n') if line.startswith('data: '))
+        return json.loads(data[len('data: '):])['message']
+
+    async def test_author_receives_message_and_unsubscribes(self):
+        await sync_to_async(self.client.force_login)(self.author)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        message = await self.publish_and_read(cookie)
+        self.assertEqual((message['id'], message['message']), (self.message.pk, 'gol'))
+        self.assertTrue(message['can_delete'])
+
+    async def test_invalid_session_is_anonymous(self):
+        message = await self.publish_and_read(f'{settings.SESSION_COOKIE_NAME}=inventada')
+        self.assertFalse(message['can_delete'])
+
+    async def test_unknown_event(self):
+        task, _, sent = await self.open(self.event.pk + 100)
+        await asyncio.wait_for(task, 2)
+        self.assertEqual(sent[0]['status'], 404)
@@ -1,10 +1,14 @@
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_POST
 from events.models import Event
 from .models import ChatMessage
 from .forms import ChatMessageForm
+from .services import buffer, hub, writer
+from .services.serializers import message_record, present_message
 
 @login_required
 @require_POST
@@ -14,68 +18,131 @@ def chat_send_message(request, event_pk):
     """
     Guarda un missatge nou.
     Només si l'esdeveniment està en directe.
+    En mode write-behind el missatge es publica de seguida i es desa per lots.
     """
-    event = get_object_or_404(Event, pk=event_pk)
+    write_behind = writer.enabled()
+    if write_behind:
+        info = writer.event_info(event_pk)
+        if info is None:
+            raise Http404("L'esdeveniment no existeix.")
+        status, creator_id = info
+    else:
+        event = get_object_or_404(Event, pk=event_pk)
+        status, creator_id = event.status, event.creator_id
     
     # Si no està 'live', no deixem escriure
-    if event.status != 'live':
+    if status != 'live':
         return JsonResponse({'success': False, 'errors': {'global': "L'esdeveniment no està en directe."}}, status=403)
     
     form = ChatMessageForm(request.POST)
     if form.is_valid():
         msg = form.save(commit=False)
-        msg.event = event
+        msg.event_id = event_pk
         msg.user = request.user
-        msg.save()
+        # L'id i l'entrada al buffer, sota el mateix bloqueig: així el buffer queda en ordre d'id
+        with buffer.posting(event_pk):
+            if write_behind:
+                writer.get_queue().submit(msg)
+            else:
+                msg.save()
+
+            # Write-through al buffer i push als espectadors connectats per SSE
+            record = message_record(msg)
+            buffer.append(event_pk, record)
+        hub.publish(event_pk, {'type': 'message', 'message': record})
         
         # Enviem el nou missatge en JSON
+        viewer_id, is_staff = _viewer(request)
         return JsonResponse({
             'success': True,
-            'message': {
-                'id': msg.id,
-                'user': msg.user.username,
-                'display_name': msg.get_user_display_name(),
-                'message': msg.message,
-                'created_at': msg.get_time_since(),
-                'can_delete': msg.can_delete(request.user),
-                'is_highlighted': msg.is_highlighted
-            }
+            'message': present_message(record, viewer_id, is_staff, creator_id)
         })
     else:
         return JsonResponse({'success': False, 'errors': form.errors}, status=400)
 
+def _viewer(request):
+    user = request.user
+    return (user.pk if user.is_authenticated else None), user.is_staff
+
+def _messages_etag(request, event_pk):
+    # L'ETag depèn de l'usuari perquè can_delete canvia segons qui mira
+    state = buffer.get_state(event_pk)
+    request.chat_state = state  # la vista el reutilitza
+    if state is None:
+        return None
+    return f"{event_pk}-{request.user.pk or 0}-{state['version'] or 0}"
+
+def _parse_changed(value):
+    """
+    Cursor ?changed= (data ISO amb zona). Com un ?since= invàlid, un valor
+    mal format o sense zona es tracta com si no hi fos.
+    """
+    try:
+        changed = parse_datetime(value or '')
+    except ValueError:
+        return None
+    if changed is None or timezone.is_naive(changed):
+        return None
+    return changed
+
+@condition(etag_func=_messages_etag)
 def chat_load_messages(request, event_pk):
     """
     Carrega missatges nous (es crida cada 3 segons).
+
+    Sense paràmetres retorna els últims 50. Amb ?since=<últim id vist>&changed=<cursor>
+    només retorna els missatges nous i els esborrats/destacats des del cursor.
+    Si no ha canviat res, el client rep un 304 gràcies a l'ETag.
+
+    Els missatges surten del buffer per event (services.buffer), compartit per
+    tots els espectadors: només can_delete es calcula per a cada petició.
     """
-    event = get_object_or_404(Event, pk=event_pk)
-    
-    # 1. Recuperem els últims 100
-    recent_messages = event.messages.all().order_by('-created_at')[:100]
-    
-    # 2. Filtrem esborrats i ens quedem amb 50
-    valid_messages = [m for m in recent_messages if not m.is_deleted]
-    messages_list = valid_messages[:50][::-1]
-    
-    data = []
-    user = request.user if request.user.is_authenticated else None
-    
-    for msg in messages_list:
-        can_delete = False
-        if request.user.is_authenticated:
-            can_delete = msg.can_delete(request.user)
-
-        data.append({
-            'id': msg.id,
-            'user': msg.user.username,
-            'display_name': msg.get_user_display_name(),
-            'message': msg.message,
-            'created_at': msg.get_time_since(),
-            'can_delete': can_delete,
-            'is_highlighted': msg.is_highlighted
+    state = request.chat_state
+    if state is None:
+        raise Http404("L'esdeveniment no existeix.")
+    records = state['records']
+    creator_id = state['creator_id']
+    viewer_id, is_staff = _viewer(request)
+
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+
+    if since is None:
+        visible = [r for r in records if not r['is_deleted']][-buffer.VISIBLE_SIZE:]
+        last_id = max((r['id'] for r in visible), default=0)
+        return JsonResponse({
+            'messages': [present_message(r, viewer_id, is_staff, creator_id) for r in visible],
+            'cursor': {'since': last_id, 'changed': state['version']},
         })
-        
-    return JsonResponse({'messages': data})
+
+    # Missatges nous des de l'últim id vist (com a molt 50)
+    new_records = [r for r in records if r['id'] > since][-buffer.VISIBLE_SIZE:]
+    last_id = max([since] + [r['id'] for r in new_records])
+
+    # Canvis als missatges que el client ja té
+    deleted, highlighted = [], []
+    changed = _parse_changed(request.GET.get('changed'))
+    if changed is not None:
+        for r in records:
+            if r['id'] <= since and parse_datetime(r['updated_at']) > changed:
+                if r['is_deleted']:
+                    deleted.append(r['id'])
+                else:
+                    highlighted.append({'id': r['id'], 'is_highlighted': r['is_highlighted']})
+
+    return JsonResponse({
+        'messages': [present_message(r, viewer_id, is_staff, creator_id) for r in new_records if not r['is_deleted']],
+        'deleted': deleted,
+        'highlighted': highlighted,
+        'cursor': {'since': last_id, 'changed': state['version']},
+    })
+
+def _flush_if_pending(message_pk):
+    # Un missatge encara a la cua write-behind no existeix a la DB
+    if writer.enabled() and writer.get_queue().is_pending(message_pk):
+        writer.get_queue().flush()
 
 @login_required
 @require_POST
@@ -83,11 +150,14 @@ def chat_delete_message(request, message_pk):
     """
     Elimina un missatge (només propietari o admin).
     """
-    msg = get_object_or_404(ChatMessage, pk=message_pk)
+    _flush_if_pending(message_pk)
+    msg = get_object_or_404(ChatMessage.objects.select_related('event', 'user'), pk=message_pk)
     
     if msg.can_delete(request.user):
         msg.is_deleted = True # Amagar missatge
         msg.save()
+        buffer.update(msg.event_id, message_record(msg))
+        hub.publish(msg.event_id, {'type': 'deleted', 'id': msg.id})
         return JsonResponse({'success': True})
     else:
         return JsonResponse({'success': False, 'error': 'Sense permís'}, status=403)
@@ -98,11 +168,14 @@ def chat_highlight_message(request, message_pk):
     """
     Destaca missatge (només creador event).
     """
-    msg = get_object_or_404(ChatMessage, pk=message_pk)
+    _flush_if_pending(message_pk)
+    msg = get_object_or_404(ChatMessage.objects.select_related('event', 'user'), pk=message_pk)
     
-    if request.user == msg.event.creator:
+    if request.user.pk == msg.event.creator_id:
         msg.is_highlighted = not msg.is_highlighted
         msg.save()
+        buffer.update(msg.event_id, message_record(msg))
+        hub.publish(msg.event_id, {'type': 'highlighted', 'id': msg.id, 'is_highlighted': msg.is_highlighted})
         return JsonResponse({'success': True, 'is_highlighted': msg.is_highlighted})
     else:
         return JsonResponse({'success': False, 'error': 'Sense permís'}, status=403)
@@ -8,9 +8,24 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
 
 import os
+import re
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from chat.asgi import chat_stream  # noqa: E402  (necessita Django configurat)
+
+# Connexions de llarga durada que no passen per les vistes de Django
+CHAT_STREAM_PATH = re.compile(r'^/chat/(?P<event_pk>\d+)/stream/$')
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        match = CHAT_STREAM_PATH.match(scope['path'])
+        if match:
+            await chat_stream(scope, receive, send, int(match.group('event_pk')))
+            return
+    await django_application(scope, receive, send)
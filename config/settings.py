@@ -152,3 +152,104 @@ MESSAGE_TAGS = {
 # CSRF_COOKIE_SECURE = True  # MOD
 # SESSION_COOKIE_SECURE = True  # MOD
 # SECURE_HSTS_SECONDS = 3600  # MOD
+
+# Cerca semàntica
+# Cada quants segons l'índex vectorial del procés incorpora canvis fets per altres processos
+SEMANTIC_INDEX_REFRESH_SECONDS = 30
+# Cache d'embeddings de consultes: mida LRU local, TTL en segons i àlies opcional
+# d'una cache de Django compartida entre workers (p. ex. 'default' amb Redis/Memcached)
+SEMANTIC_EMBED_CACHE_SIZE = 2048
+SEMANTIC_EMBED_CACHE_TTL = 3600
+SEMANTIC_EMBED_CACHE_ALIAS = None
+# Format d'emmagatzematge dels embeddings: 'float32', 'float16' o 'int8' (quantitzat amb escala)
+SEMANTIC_EMBEDDING_DTYPE = 'float32'
+# Recàlcul automàtic d'embeddings en segon pla quan es crea o edita un event
+SEMANTIC_AUTO_EMBED = True
+SEMANTIC_AUTO_EMBED_BATCH = 32
+SEMANTIC_AUTO_EMBED_DELAY = 1.0
+
+# Xat en directe (push per SSE a /chat/<pk>/stream/, només amb servidor ASGI)
+# Backend de pub/sub: per defecte en memòria del procés
+CHAT_PUBSUB_BACKEND = 'chat.services.hub.LocalBackend'
+CHAT_STREAM_QUEUE_SIZE = 100
+CHAT_STREAM_KEEPALIVE = 15
+# Buffer dels últims missatges per event (cache de Django; amb Redis/Memcached és compartit)
+CHAT_BUFFER_CACHE = 'default'
+CHAT_BUFFER_TTL = 60
+# Mode write-behind: els missatges es desen per lots (requereix una cache compartida amb diversos processos)
+CHAT_WRITE_BEHIND = False
+CHAT_WRITE_BEHIND_INTERVAL = 0.2
+CHAT_WRITE_BEHIND_BATCH = 100
+# Intents d'un lot abans de desar-lo missatge a missatge (i descartar els que la DB rebutja),
+# i salt dels ids quan el comptador s'ha de tornar a sembrar (més que els pendents de tots els workers)
+CHAT_WRITE_BEHIND_RETRIES = 3
+CHAT_WRITE_BEHIND_ID_GAP = 100000
+CHAT_EVENT_INFO_TTL = 2
+
+# Llistat d'events: segons que es guarda en cache la pàgina per als visitants anònims
+EVENTS_LIST_CACHE_TTL = 30
+# Cerca de text complet del llistat: refresc de l'índex del procés i màxim de resultats
+EVENTS_SEARCH_REFRESH_SECONDS = 30
+EVENTS_SEARCH_MAX_RESULTS = 1000
+# Cerca híbrida (lèxica + vectorial amb Reciprocal Rank Fusion)
+SEMANTIC_HYBRID = True
+SEMANTIC_RRF_K = 60
+# Si tots els termes de la consulta coincideixen en com a molt aquests events, només es puntuen ells
+SEMANTIC_HYBRID_PREFILTER_MAX = 200
+# Cerca aproximada (IVF) per a catàlegs grans; l'índex s'entrena amb `manage.py build_ann_index`
+SEMANTIC_ANN = False
+SEMANTIC_ANN_PATH = None  # per defecte BASE_DIR/.semantic_ann.npz
+# Llistes provades per consulta: més alt, més recall i més latència
+SEMANTIC_ANN_NPROBE = 16
+# Per sota d'aquesta mida la cerca és sempre exacta
+SEMANTIC_ANN_MIN_SIZE = 50_000
+# Magatzem d'embeddings compartit entre workers (fitxers .npy amb mmap, versionats).
+# backfill_event_embeddings publica una versió nova i els workers hi canvien al proper refresc
+SEMANTIC_EMBEDDING_STORE = False
+SEMANTIC_STORE_DIR = None  # per defecte BASE_DIR/.embedding_store
+# Servidor local d'embeddings (`manage.py run_embedding_server`): "http://127.0.0.1:8765" o
+# "unix:///run/embeddings.sock". Si no respon, els embeddings es calculen al mateix procés
+SEMANTIC_EMBED_SERVER_URL = None
+SEMANTIC_EMBED_SERVER_TIMEOUT = 5.0
+SEMANTIC_EMBED_SERVER_RETRY = 30
+# Carrega el model d'embeddings en arrencar (AppConfig.ready). Activar-ho només als workers web:
+# els altres `manage.py` no el necessiten. Alternativa explícita: `manage.py warmup_models`
+SEMANTIC_WARMUP_ON_START = False
+# Backend d'inferència dels embeddings: "torch", "torch-int8", "onnx" o "onnx-int8"
+# (els ONNX necessiten onnxruntime; comparar-los amb `manage.py bench_embed_backends`)
+SEMANTIC_EMBED_BACKEND = 'torch'
+SEMANTIC_EMBED_THREADS = 0  # fils de CPU per a la inferència; 0 = el valor per defecte
+SEMANTIC_ONNX_DIR = None  # per defecte BASE_DIR/.onnx
+# Assistent: servidor Ollama. El client reutilitza connexions (keep-alive) i, amb servidor ASGI,
+# la vista del xat llegeix la resposta de forma asíncrona (amb httpx; sense, en un fil a part)
+OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "llama3.1:8b"
+OLLAMA_CONNECT_TIMEOUT = 5.0
+OLLAMA_TIMEOUT = 60.0  # màxim entre dos fragments de la resposta
+OLLAMA_POOL_SIZE = 16
+# Cache de respostes de l'assistent (clau: missatge normalitzat + candidats recuperats).
+# Amb una cache compartida (Redis/Memcached) la comparteixen tots els workers. 0 = desactivada
+ASSISTANT_ANSWER_CACHE = 'default'
+ASSISTANT_ANSWER_CACHE_TTL = 600
+# Cache dels comptadors d'encerts (None = ASSISTANT_ANSWER_CACHE). Ha de ser compartida
+# perquè `answer_cache_stats` vegi els del servidor; amb LocMem només són a /assistant/api/stats/
+ASSISTANT_ANSWER_STATS_CACHE = None
+# Cache semàntica de respostes (local al procés): reaprofita la resposta d'una consulta
+# semblant (similitud cosinus >= llindar) si els events candidats són els mateixos. 0 = desactivada
+ASSISTANT_SEMANTIC_CACHE_SIZE = 256
+ASSISTANT_SEMANTIC_CACHE_THRESHOLD = 0.92
+# Prompt de l'assistent: tokens màxims (estimats) del prompt dins del num_ctx de 2048,
+# deixant marge per a la resposta, i caràcters màxims de descripció per event i del missatge de l'usuari
+ASSISTANT_PROMPT_TOKENS = 1536
+ASSISTANT_PROMPT_DESCRIPTION_CHARS = 200
+ASSISTANT_PROMPT_MESSAGE_CHARS = 500
+# Control d'admissió de l'assistent (per procés): generacions simultànies a Ollama, places
+# a la cua d'espera (amb la cua plena es respon 503) i segons màxims d'espera a la cua.
+# Mètriques a /assistant/api/stats/ (staff)
+ASSISTANT_MAX_CONCURRENCY = 2
+ASSISTANT_QUEUE_SIZE = 16
+ASSISTANT_QUEUE_TIMEOUT = 30
+# El buffer del xat i el mode write-behind necessiten una cache compartida entre processos
+# (CHAT_BUFFER_CACHE a Redis/Memcached). Amb una cache local només són correctes si hi ha un
+# sol procés (p. ex. runserver): posar-ho a True per activar-los igualment
+CHAT_SINGLE_PROCESS = False
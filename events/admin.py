@@ -12,7 +12,7 @@ class EventAdmin(admin.ModelAdmin):
             'fields': ('title', 'description', 'creator', 'category')
         }),
         ('Programació', {
-            'fields': ('scheduled_date', 'status', 'max_viewers')
+            'fields': ('scheduled_date', 'duration_minutes', 'status', 'max_viewers')
         }),
         ('Multimèdia', {
             'fields': ('thumbnail', 'stream_url')
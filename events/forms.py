@@ -9,7 +9,7 @@ class EventCreationForm(forms.ModelForm):
     """
     class Meta:
         model = Event
-        fields = ['title','description','category','scheduled_date','thumbnail','max_viewers','tags','status','stream_url']
+        fields = ['title','description','category','scheduled_date','duration_minutes','thumbnail','max_viewers','tags','status','stream_url']
         widgets = {
             'scheduled_date': forms.DateTimeInput(attrs={'type':'datetime-local'}), # Selector natiu de data i hora HTML5
             'description': forms.Textarea(), # Àrea de text gran
@@ -23,14 +23,14 @@ class EventUpdateForm(forms.ModelForm):
     """
     class Meta:
         model = Event
-        fields = ['title','description','category','scheduled_date','thumbnail','max_viewers','tags','status','stream_url']
+        fields = ['title','description','category','scheduled_date','duration_minutes','thumbnail','max_viewers','tags','status','stream_url']
 
 class EventSearchForm(forms.Form):
     """
     Formulari de cerca i filtratge per al llistat d'esdeveniments.
     No està lligat a cap model (és un form normal), només serveix per processar paràmetres GET.
     Camps:
-    - search: Text lliure per cercar per títol.
+    - search: Text lliure per cercar al títol, la descripció i les etiquetes.
     - category: Desplegable amb les categories definides al model.
     - status: Desplegable amb els estats definides al model.
     - date_from / date_to: Filtratge per rang de dates.
@@ -0,0 +1,87 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.services.search import TextIndex
+
+_WORDS = (
+    "concert música directe festival rock jazz clàssica banda gira torneig videojocs partida "
+    "fortnite lol esports futbol bàsquet tennis xerrada entrevista podcast debat conferència "
+    "curs taller tutorial programació python django intel·ligència artificial disseny pintura "
+    "dibuix còmic màgia comèdia espectacle ciència història cuina viatges fotografia natura"
+).split()
+
+
+_SYLLABLES = "ba ca da fa ga la ma na pa ra sa ta va xa be ce de le me ne pe re se te ri li ni ti ro so to lo mo nu tu".split()
+
+
+def _vocabulary(rng, size):
+    """Paraules temàtiques barrejades amb paraules inventades, amb pesos de Zipf."""
+    words = set(_WORDS)
+    while len(words) < size:
+        words.add("".join(rng.choices(_SYLLABLES, k=rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def _text(rng, vocab, n):
+    words, weights = vocab
+    return " ".join(rng.choices(words, weights, k=n))
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de la cerca del llistat: escaneig complet amb regex sobre títol, descripció i "
+        "etiquetes vs índex invertit BM25."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=100_000)
+        parser.add_argument("--queries", nargs="+", default=["concert", "jazz festival", "intel·ligencia", "tutorial python"])
+        parser.add_argument("--vocabulary", type=int, default=20_000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        vocab = _vocabulary(rng, options["vocabulary"])
+        rows = [
+            (pk, _text(rng, vocab, 6), _text(rng, vocab, 40), ",".join(rng.sample(_WORDS, 3)), "music", None)
+            for pk in range(1, options["events"] + 1)
+        ]
+
+        t0 = time.perf_counter()
+        index = TextIndex()
+        index.load(rows)
+        self.stdout.write(f"Índex construït amb {len(index)} events en {time.perf_counter() - t0:.1f}s")
+        self.stdout.write("Resultats: escaneig / índex (aproximadament comparables, vegeu el codi)")
+
+        self.stdout.write(f"{'consulta':<20} {'escaneig':>11} {'índex':>9} {'resultats':>19}")
+        for query in options["queries"]:
+            # Mateixos camps que l'índex: cada terme de la consulta ha d'aparèixer (icontains)
+            # al títol, la descripció o les etiquetes. L'índex, a més, treu accents i paraules
+            # buides i fa coincidència per paraula, així que els recomptes són semblants però
+            # no idèntics.
+            patterns = [re.compile(re.escape(term), re.IGNORECASE) for term in query.split()]
+            legacy_hits = []
+            legacy = _best_of(lambda: legacy_hits.__setitem__(slice(None), [
+                pk for pk, title, description, tags, *_ in rows
+                if all(p.search(title) or p.search(description) or p.search(tags) for p in patterns)
+            ]), options["repeat"])
+            hits = []
+            ranked = _best_of(lambda: hits.__setitem__(slice(None), index.search(query)), options["repeat"])
+            self.stdout.write(
+                f"{query:<20} {legacy:>9.1f}ms {ranked:>7.1f}ms {len(legacy_hits):>8} / {len(hits):<8}"
+            )
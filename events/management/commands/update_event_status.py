@@ -1,16 +1,72 @@
+import time
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from events.models import Event
+from events.services.listing import invalidate_list_cache
 from django.utils import timezone
 
+# Durada que s'assumeix per als events sense ends_at (p. ex. carregats amb fixtures)
+DEFAULT_DURATION = timedelta(minutes=120)
+
 class Command(BaseCommand):
     help = 'Actualitza els estats dels esdeveniments'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Es queda en marxa i dorm fins a la propera transició")
+        parser.add_argument('--max-sleep', type=int, default=300, help="Segons màxims entre comprovacions en mode --loop")
+
+    def transition(self, now):
+        """
+        Aplica les transicions amb dues consultes update() en bloc:
+        - scheduled -> live: ha començat i encara no ha acabat.
+        - scheduled/live -> finished: ha passat ends_at.
+        Retorna (iniciats, finalitzats).
+        """
+        not_ended = Q(ends_at__gt=now) | Q(ends_at__isnull=True, scheduled_date__gt=now - DEFAULT_DURATION)
+        ended = Q(ends_at__lte=now) | Q(ends_at__isnull=True, scheduled_date__lte=now - DEFAULT_DURATION)
+
+        started = (
+            Event.objects.filter(status='scheduled', scheduled_date__lte=now)
+            .filter(not_ended)
+            .update(status='live', updated_at=now)
+        )
+        finished = (
+            Event.objects.filter(status__in=['scheduled', 'live'])
+            .filter(ended)
+            .update(status='finished', updated_at=now)
+        )
+        # update() no envia signals: invalidem el llistat en cache a mà
+        if started or finished:
+            invalidate_list_cache()
+        return started, finished
+
+    def next_transition(self, now):
+        """Data de la propera transició coneguda (usa els índexs status+data)."""
+        next_start = (
+            Event.objects.filter(status='scheduled', scheduled_date__gt=now)
+            .order_by('scheduled_date').values_list('scheduled_date', flat=True).first()
+        )
+        next_end = (
+            Event.objects.filter(status='live', ends_at__gt=now)
+            .order_by('ends_at').values_list('ends_at', flat=True).first()
+        )
+        candidates = [d for d in (next_start, next_end) if d]
+        return min(candidates) if candidates else None
+
     def handle(self, *args, **kwargs):
-        now = timezone.now()
-        for e in Event.objects.filter(status='scheduled', scheduled_date__lte=now):
-            e.status='live'
-            e.save()
-        for e in Event.objects.filter(status='live', scheduled_date__lte=now):
-            e.status='finished'
-            e.save()
-        self.stdout.write('Estats actualitzats')
+        while True:
+            now = timezone.now()
+            started, finished = self.transition(now)
+            self.stdout.write(f'Estats actualitzats: {started} en directe, {finished} finalitzats')
+
+            if not kwargs['loop']:
+                return
+
+            # Dormim fins a la propera transició; el límit cobreix events creats mentrestant
+            sleep = kwargs['max_sleep']
+            upcoming = self.next_transition(now)
+            if upcoming:
+                sleep = min(sleep, (upcoming - timezone.now()).total_seconds())
+            time.sleep(max(1, sleep))
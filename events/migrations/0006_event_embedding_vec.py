@@ -0,0 +1,50 @@
+import struct
+
+from django.db import migrations, models
+
+# Còpia del format float32 de semantic_search.services.codec (les migracions
+# no han de dependre del codi de l'aplicació, que pot canviar)
+_HEADER = struct.Struct("<2sBBf")
+
+
+def _encode(vec):
+    return _HEADER.pack(b"EV", 1, 1, 1.0) + struct.pack(f"<{len(vec)}f", *vec)
+
+
+def _decode(blob):
+    _, _, code, scale = _HEADER.unpack_from(blob)
+    data = bytes(blob)[_HEADER.size:]
+    if code == 1:
+        return list(struct.unpack(f"<{len(data) // 4}f", data))
+    if code == 2:
+        return list(struct.unpack(f"<{len(data) // 2}e", data))
+    return [x * scale for x in struct.unpack(f"<{len(data)}b", data)]
+
+
+def json_to_binary(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    for pk, emb in Event.objects.filter(embedding__isnull=False).values_list('id', 'embedding').iterator():
+        if isinstance(emb, list) and emb:
+            Event.objects.filter(pk=pk).update(embedding_vec=_encode(emb), embedding=None)
+
+
+def binary_to_json(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    for pk, blob in Event.objects.filter(embedding_vec__isnull=False).values_list('id', 'embedding_vec').iterator():
+        Event.objects.filter(pk=pk).update(embedding=_decode(blob), embedding_vec=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_alter_event_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='embedding_vec',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0006_event_embedding_vec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='embedding_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def fill_ends_at(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    for pk, scheduled_date in Event.objects.filter(ends_at__isnull=True).values_list('id', 'scheduled_date').iterator():
+        if scheduled_date:
+            Event.objects.filter(pk=pk).update(ends_at=scheduled_date + timedelta(minutes=120))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_event_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=120, verbose_name='Durada (minuts)'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Final previst'),
+        ),
+        migrations.RunPython(fill_ends_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['status', 'scheduled_date'], name='event_status_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['status', 'ends_at'], name='event_status_ends_idx'),
+        ),
+    ]
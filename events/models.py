@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -27,6 +29,8 @@ class Event(models.Model):
     - creator: Usuari que ha creat l'esdeveniment (clau forana).
     - category: Temàtica de l'esdeveniment (Gaming, Música, etc.).
     - scheduled_date: Data i hora en què està previst l'inici.
+    - duration_minutes: Durada prevista; amb scheduled_date defineix ends_at.
+    - ends_at: Data i hora de final (calculada en desar), usada per update_event_status.
     - status: Estat actual (Programat, En Directe, Finalitzat, Cancel·lat).
     - thumbnail: Imatge de portada (es redimensiona automàticament).
     - max_viewers: Límit o estimació d'espectadors.
@@ -38,6 +42,8 @@ class Event(models.Model):
     creator = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Creador")
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES, verbose_name="Categoria")
     scheduled_date = models.DateTimeField(verbose_name="Data programada")
+    duration_minutes = models.PositiveIntegerField(default=120, verbose_name="Durada (minuts)")
+    ends_at = models.DateTimeField(blank=True, null=True, editable=False, verbose_name="Final previst")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="Estat", default='scheduled')
     thumbnail = models.ImageField(upload_to='events/thumbnails/', blank=True, null=True, default='events/default_thumbnail.jpg', verbose_name="Imatge de portada")
     max_viewers = models.PositiveIntegerField(default=100, verbose_name="Màxim d'espectadors")
@@ -52,7 +58,10 @@ class Event(models.Model):
         Sobreescriu el mètode save per processar la imatge abans de guardar-la.
         Si hi ha una imatge pujada, la redimensiona a 600x600 px màxim
         per optimitzar l'espai i la velocitat de càrrega.
+        També recalcula ends_at a partir de la data i la durada.
         """
+        if self.scheduled_date:
+            self.ends_at = self.scheduled_date + timedelta(minutes=self.duration_minutes or 0)
         super().save(*args, **kwargs)
         
         if self.thumbnail:
@@ -135,15 +144,22 @@ class Event(models.Model):
         return self.stream_url
 
     # Semantic Search Fields
-    embedding = models.JSONField(blank=True, null=True)  # llista de floats
+    embedding = models.JSONField(blank=True, null=True)  # format antic: llista de floats
+    embedding_vec = models.BinaryField(blank=True, null=True)  # bytes compactes (semantic_search.services.codec)
     embedding_model = models.CharField(max_length=200, blank=True, null=True)
     embedding_updated_at = models.DateTimeField(blank=True, null=True)
+    embedding_hash = models.CharField(max_length=64, blank=True, null=True)  # hash del text embedat
 
     class Meta:
         """
         Opcions metadades del model.
         - ordering: Ordena per defecte els esdeveniments per data de creació (més nous primer).
+        - indexes: status+data per trobar ràpidament les properes transicions d'estat.
         """
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'scheduled_date'], name='event_status_sched_idx'),
+            models.Index(fields=['status', 'ends_at'], name='event_status_ends_idx'),
+        ]
         verbose_name = 'Esdeveniment'
         verbose_name_plural = 'Esdeveniments'
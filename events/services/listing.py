@@ -0,0 +1,112 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Camps que fan servir les targetes del llistat (events/includes/event_card.html)
+CARD_FIELDS = (
+    'id', 'title', 'category', 'status', 'scheduled_date', 'thumbnail',
+    'max_viewers', 'created_at', 'creator__id', 'creator__username',
+)
+
+_VERSION_KEY = 'events:list:version'
+
+
+class KeysetPage:
+    """
+    Pàgina del llistat paginada per clau (created_at, id) en lloc de per número.
+    No cal cap count(): es demana un element de més per saber si n'hi ha més.
+    """
+
+    def __init__(self, object_list, params, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _query(self, cursor):
+        params = self._params.copy()
+        params.pop('cursor', None)
+        params.pop('page', None)
+        if cursor:
+            params['cursor'] = cursor
+        return params.urlencode()
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def next_query(self):
+        return self._query(self.next_cursor)
+
+    @property
+    def first_query(self):
+        return self._query(None)
+
+
+def encode_cursor(event) -> str:
+    return f'{event.created_at.isoformat()}_{event.pk}'
+
+
+def decode_cursor(value):
+    """
+    (created_at, id) d'un cursor d'encode_cursor, o None si no és vàlid. El
+    cursor ve de l'URL: es rebutgen dates sense zona i ids fora de rang.
+    """
+    try:
+        stamp, pk = (value or '').rsplit('_', 1)
+        created_at, pk = parse_datetime(stamp), int(pk)
+    except ValueError:
+        return None
+    if created_at is None or timezone.is_naive(created_at) or not 0 < pk < 2 ** 63:
+        return None
+    return created_at, pk
+
+
+def keyset_page(queryset, params, per_page: int) -> KeysetPage:
+    """
+    `queryset` ha d'estar ordenat per ('-created_at', '-id').
+    """
+    cursor = params.get('cursor')
+    decoded = decode_cursor(cursor)
+    if decoded:
+        created_at, pk = decoded
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    else:
+        cursor = None
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return KeysetPage(rows[:per_page], params, cursor, next_cursor)
+
+
+def page_cache_key(params) -> str:
+    """
+    Clau de cache d'una pàgina anònima del llistat. Inclou la versió, que
+    canvia cada cop que es desa un event (invalidació sense esborrar claus).
+    """
+    version = cache.get_or_set(_VERSION_KEY, 1, None)
+    query = '&'.join(sorted(f'{k}={v}' for k in params for v in params.getlist(k)))
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    return f'events:list:{version}:{digest}'
+
+
+def page_cache_ttl() -> int:
+    return getattr(settings, 'EVENTS_LIST_CACHE_TTL', 30)
+
+
+def invalidate_list_cache():
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
@@ -0,0 +1,267 @@
+"""
+Cerca de text complet per al filtre "search" del llistat d'events.
+
+Índex invertit en memòria sobre títol, descripció i etiquetes, amb
+tokenització pensada per al català i el castellà (sense accents, l·l, apòstrofs,
+paraules buides) i rànquing BM25 amb pes per camp. Es manté al dia amb els
+signals de l'app i amb un refresc incremental per updated_at, com el VectorIndex
+de la cerca semàntica.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+from events.models import Event
+
+# Pes de cada camp al rànquing (el títol compta més que la descripció)
+FIELD_WEIGHTS = {'title': 3.0, 'tags': 2.0, 'description': 1.0}
+_ROW_FIELDS = ('id', 'title', 'description', 'tags', 'category', 'updated_at')
+# Marca d'aigua inicial d'un índex buit: el refresh recull qualsevol event posterior
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Paràmetres BM25
+_K1 = 1.2
+_B = 0.75
+# Els termes de la consulta d'aquesta mida o més també fan coincidència per prefix
+_PREFIX_MIN = 3
+
+STOPWORDS = frozenset("""
+a al als amb de del dels el els en es i la les lo los o per pel pels que un una uns unes
+com on se si no mes pero sobre entre fins cap sense dins tambe aquest aquesta aquests
+aquestes aquell aquella ha han has he hi ja jo tu ell ella nosaltres vosaltres ells elles
+y e u con para por las una unos unas su sus este esta estos estas ese esa como pero mas
+sin hasta desde tras durante ante le les lo yo tu el ella ellos ellas es son ser
+""".split())
+
+_WORD_RE = re.compile(r'\w+')
+_COMBINING_RE = re.compile('[\u0300-\u036f]')
+
+
+def _strip_accents(text: str) -> str:
+    if text.isascii():
+        return text
+    return _COMBINING_RE.sub('', unicodedata.normalize('NFKD', text))
+
+
+def _stem(token: str) -> str:
+    # Plurals regulars (concerts -> concert, juegos -> juego)
+    if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Minúscules, sense accents, "l·l" -> "l" (així "intel·ligència" coincideix
+    amb "inteligencia") i separació per caràcters no
+    alfanumèrics (així "l'art" dona "art"). Descarta paraules buides i d'una lletra.
+    """
+    if not text:
+        return []
+    text = _strip_accents(text.lower().replace('l·l', 'l').replace('l.l', 'l'))
+    return [
+        _stem(t) for t in _WORD_RE.findall(text)
+        if len(t) > 1 and t not in STOPWORDS
+    ]
+
+
+class TextIndex:
+    """
+    Índex invertit terme -> {event_id: freqüència ponderada}.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._category = {}
+        self._total_len = 0.0
+        self._vocab = []
+        self._vocab_dirty = False
+        self._watermark = None
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def upsert(self, pk: int, title: str, description: str, tags: str, category: str = None):
+        tf = Counter()
+        for field, text in (('title', title), ('description', description), ('tags', tags)):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                tf[token] += weight
+        with self._lock:
+            self.remove(pk)
+            if not tf:
+                return
+            self._category[pk] = category
+            for term, freq in tf.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._vocab_dirty = True
+                postings[pk] = freq
+            length = sum(tf.values())
+            self._doc_terms[pk] = tuple(tf)
+            self._doc_len[pk] = length
+            self._total_len += length
+
+    def remove(self, pk: int):
+        with self._lock:
+            terms = self._doc_terms.pop(pk, None)
+            if terms is None:
+                return
+            self._total_len -= self._doc_len.pop(pk)
+            self._category.pop(pk, None)
+            for term in terms:
+                postings = self._postings[term]
+                del postings[pk]
+                if not postings:
+                    del self._postings[term]
+                    self._vocab_dirty = True
+
+    def load(self, rows):
+        """Carrega tuples (id, title, description, tags, category, updated_at)."""
+        for pk, title, description, tags, category, updated_at in rows:
+            self.upsert(pk, title, description, tags, category)
+            if updated_at and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    def _expand(self, term: str) -> list[str]:
+        # Termes del vocabulari que comencen per `term` (cerca binària al vocabulari ordenat)
+        if len(term) < _PREFIX_MIN:
+            return [term] if term in self._postings else []
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+        start = bisect.bisect_left(self._vocab, term)
+        end = bisect.bisect_left(self._vocab, term + '\uffff')
+        return self._vocab[start:end]
+
+    def category_of(self, pk: int):
+        return self._category.get(pk)
+
+    def search(self, query: str, limit: int = None, match_all: bool = True) -> list[tuple[int, float]]:
+        """
+        Retorna [(event_id, score), ...] ordenat desc. Amb `match_all` tots els
+        termes de la consulta han d'aparèixer (per paraula exacta o prefix);
+        si no, n'hi ha prou amb un.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n = len(self._doc_len)
+            if not n:
+                return []
+            # Per cada terme, les llistes de tots els termes del vocabulari que hi coincideixen
+            matches = []
+            for term in terms:
+                postings = [self._postings[t] for t in self._expand(term)]
+                if postings:
+                    matches.append(postings)
+                elif match_all:
+                    return []
+            if not matches:
+                return []
+
+            if match_all:
+                # Intersecció començant pel terme més selectiu: només es puntuen els candidats
+                matches.sort(key=lambda postings: sum(len(p) for p in postings))
+                candidates = set().union(*matches[0])
+                for postings in matches[1:]:
+                    candidates = {pk for pk in candidates if any(pk in p for p in postings)}
+                    if not candidates:
+                        return []
+            else:
+                candidates = set().union(*(p for postings in matches for p in postings))
+
+            avg_len = self._total_len / n
+            norms = {pk: _K1 * (1 - _B + _B * self._doc_len[pk] / avg_len) for pk in candidates}
+            scores = dict.fromkeys(candidates, 0.0)
+            for postings in matches:
+                best = {}
+                for p in postings:
+                    idf = math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+                    for pk in candidates if len(candidates) < len(p) else p:
+                        tf = p.get(pk)
+                        if tf is None or pk not in norms:
+                            continue
+                        s = idf * tf * (_K1 + 1) / (tf + norms[pk])
+                        if s > best.get(pk, 0.0):
+                            best[pk] = s
+                for pk, s in best.items():
+                    scores[pk] += s
+
+        key = lambda item: (item[1], item[0])
+        if limit:
+            return heapq.nlargest(limit, scores.items(), key=key)
+        return sorted(scores.items(), key=key, reverse=True)
+
+    def build(self):
+        with self._lock:
+            self.load(Event.objects.values_list(*_ROW_FIELDS).iterator())
+            if self._watermark is None:
+                self._watermark = _EPOCH
+            self._checked_at = time.monotonic()
+
+    def refresh(self, force: bool = False):
+        """
+        Incorpora els canvis d'altres processos des de l'última lectura
+        (com a molt un cop cada EVENTS_SEARCH_REFRESH_SECONDS).
+        """
+        interval = getattr(settings, 'EVENTS_SEARCH_REFRESH_SECONDS', 30)
+        if not force and time.monotonic() - self._checked_at < interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self._watermark is None:
+                self._watermark = _EPOCH
+            qs = Event.objects.filter(updated_at__gt=self._watermark).values_list(*_ROW_FIELDS)
+            self.load(qs.iterator())
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> TextIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = TextIndex()
+                index.build()
+                _index = index
+    else:
+        _index.refresh()
+    return _index
+
+
+def peek_index():
+    """Retorna l'índex només si ja s'ha construït (per als signals)."""
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def search_event_ids(query: str) -> list[int]:
+    """
+    Ids dels events que coincideixen amb `query`, del més al menys rellevant
+    (com a molt EVENTS_SEARCH_MAX_RESULTS).
+    """
+    limit = getattr(settings, 'EVENTS_SEARCH_MAX_RESULTS', 1000)
+    return [pk for pk, _ in get_index().search(query, limit=limit)]
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Event
+from .services.listing import invalidate_list_cache
+from .services.search import peek_index
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_event_list(sender, **kwargs):
+    """
+    Qualsevol canvi en un event invalida les pàgines del llistat en cache.
+    """
+    invalidate_list_cache()
+
+
+@receiver(post_save, sender=Event)
+def sync_text_index_on_save(sender, instance, **kwargs):
+    """
+    Manté l'índex de text complet del procés al dia quan es desa un event.
+    """
+    index = peek_index()
+    if index is None or instance.get_deferred_fields() & {'title', 'description', 'tags', 'category'}:
+        return
+    index.upsert(instance.pk, instance.title, instance.description, instance.tags, instance.category)
+
+
+@receiver(post_delete, sender=Event)
+def sync_text_index_on_delete(sender, instance, **kwargs):
+    index = peek_index()
+    if index is not None:
+        index.remove(instance.pk)
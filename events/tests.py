@@ -0,0 +1,163 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users.models import CustomUser
+from .management.commands.update_event_status import Command as UpdateEventStatus
+from .models import Event
+from .services.listing import decode_cursor, encode_cursor, keyset_page
+from .services.search import TextIndex
+
+
+def create_event(creator, title='Concert', **kwargs):
+    kwargs.setdefault('scheduled_date', timezone.now())
+    return Event.objects.create(
+        title=title, description='', creator=creator, category='music', thumbnail=None, **kwargs
+    )
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False)
+class TextIndexRefreshTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = CustomUser.objects.create_user(username='creador', password='x')
+
+    def test_refresh_from_empty_index(self):
+        index = TextIndex()
+        index.build()
+        self.assertEqual(len(index), 0)
+
+        # Creat per un altre procés: aquest índex només el veu via refresh
+        event = create_event(self.creator, title='Festival de jazz')
+        index.refresh(force=True)
+        self.assertEqual([pk for pk, _ in index.search('jazz')], [event.pk])
+
+    def test_refresh_picks_up_updates(self):
+        event = create_event(self.creator, title='Concert de rock')
+        index = TextIndex()
+        index.build()
+
+        Event.objects.filter(pk=event.pk).update(title='Concert de jazz', updated_at=timezone.now())
+        index.refresh(force=True)
+        self.assertEqual([pk for pk, _ in index.search('jazz')], [event.pk])
+        self.assertEqual(index.search('rock'), [])
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False)
+class UpdateEventStatusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = CustomUser.objects.create_user(username='creador', password='x')
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.command = UpdateEventStatus()
+
+    def event(self, minutes_ago, status='scheduled', **kwargs):
+        return create_event(self.creator, scheduled_date=self.now - timedelta(minutes=minutes_ago), status=status, **kwargs)
+
+    def status(self, event):
+        return Event.objects.values_list('status', flat=True).get(pk=event.pk)
+
+    def test_transitions(self):
+        starting = self.event(0)  # comença just ara
+        running = self.event(30, duration_minutes=60)
+        ending = self.event(60, status='live', duration_minutes=60)  # acaba just ara
+        upcoming = self.event(-10)
+        cancelled = self.event(30, status='cancelled')
+
+        self.assertEqual(self.command.transition(self.now), (2, 1))
+        self.assertEqual(
+            [self.status(e) for e in (starting, running, ending, upcoming, cancelled)],
+            ['live', 'live', 'finished', 'scheduled', 'cancelled'],
+        )
+        # Ja aplicades: una segona passada no canvia res
+        self.assertEqual(self.command.transition(self.now), (0, 0))
+
+    def test_missed_events_go_straight_to_finished(self):
+        missed = self.event(180, duration_minutes=60)
+        instant = self.event(0, duration_minutes=0)
+        self.assertEqual(self.command.transition(self.now), (0, 2))
+        self.assertEqual([self.status(missed), self.status(instant)], ['finished', 'finished'])
+
+    def test_events_without_ends_at_use_default_duration(self):
+        # Com els carregats amb fixtures: save() no ha calculat ends_at
+        live, old = self.event(60), self.event(121, status='live')
+        Event.objects.filter(pk__in=[live.pk, old.pk]).update(ends_at=None)
+        self.assertEqual(self.command.transition(self.now), (1, 1))
+        self.assertEqual([self.status(live), self.status(old)], ['live', 'finished'])
+
+    def test_list_cache_only_invalidated_on_changes(self):
+        target = 'events.management.commands.update_event_status.invalidate_list_cache'
+        with mock.patch(target) as invalidate:
+            self.command.transition(self.now)
+            invalidate.assert_not_called()
+            self.event(0)
+            self.command.transition(self.now)
+            invalidate.assert_called_once()
+
+    def test_next_transition(self):
+        self.assertIsNone(self.command.next_transition(self.now))
+        self.event(-30)
+        live = self.event(100, status='live', duration_minutes=110)
+        self.assertEqual(self.command.next_transition(self.now), live.ends_at)
+        # Els cancel·lats no programen cap despertador
+        self.event(-5, status='cancelled')
+        self.assertEqual(self.command.next_transition(self.now), live.ends_at)
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False)
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = CustomUser.objects.create_user(username='creador', password='x')
+        cls.events = [create_event(cls.creator, title=f'Event {i}') for i in range(7)]
+        # Tots amb la mateixa data de creació menys un: els empats els desfà l'id
+        stamp = timezone.now().replace(microsecond=0)
+        Event.objects.update(created_at=stamp)
+        Event.objects.filter(pk=cls.events[0].pk).update(created_at=stamp - timedelta(seconds=1))
+
+    def queryset(self):
+        return Event.objects.order_by('-created_at', '-id')
+
+    def pages(self, per_page):
+        pages, params = [], QueryDict(mutable=True)
+        while True:
+            page = keyset_page(self.queryset(), params, per_page)
+            pages.append([e.pk for e in page])
+            if not page.has_next:
+                return pages
+            params = QueryDict(page.next_query)
+
+    def test_cursor_round_trip(self):
+        event = Event.objects.get(pk=self.events[3].pk)
+        self.assertEqual(decode_cursor(encode_cursor(event)), (event.created_at, event.pk))
+
+    def test_ties_on_created_at(self):
+        pages = self.pages(per_page=2)
+        self.assertEqual([len(p) for p in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), list(self.queryset().values_list('pk', flat=True)))
+        self.assertEqual(pages[-1], [self.events[0].pk])
+
+    def test_exact_last_page_has_no_next(self):
+        page = keyset_page(self.queryset(), QueryDict(), per_page=7)
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_next)
+
+    def test_tampered_cursors_restart_from_the_first_page(self):
+        first = [e.pk for e in keyset_page(self.queryset(), QueryDict(), per_page=3)]
+        for cursor in ('', 'abc', '_5', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00_x',
+                       '2026-13-45T00:00:00+00:00_5', 'nodata_5', '2026-01-01T00:00:00_5',
+                       '2026-01-01T00:00:00+00:00_-1', '2026-01-01T00:00:00+00:00_' + '9' * 30):
+            with self.subTest(cursor=cursor):
+                params = QueryDict(mutable=True)
+                params['cursor'] = cursor
+                page = keyset_page(self.queryset(), params, per_page=3)
+                self.assertEqual([e.pk for e in page], first)
+                self.assertIsNone(page.cursor)
@@ -3,12 +3,31 @@ from django.contrib.auth.decorators import login_required
 from .models import Event
 from .forms import EventCreationForm, EventUpdateForm, EventSearchForm
 from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.contrib.messages import get_messages
+from django.http import HttpResponse
 from datetime import datetime, time
+from .services import listing
+from .services import search as text_search
 
 def event_list_view(request):
+    # Els visitants anònims veuen tots la mateixa pàgina: la servim de la cache
+    cache_key = None
+    if not request.user.is_authenticated and not len(get_messages(request)):
+        cache_key = listing.page_cache_key(request.GET)
+        html = cache.get(cache_key)
+        if html is not None:
+            return HttpResponse(html)
+
     form = EventSearchForm(request.GET or None)
-    events = Event.objects.all().order_by('-created_at')
+    # Només els camps que mostren les targetes, i el creador en la mateixa consulta
+    events = (
+        Event.objects.select_related('creator')
+        .only(*listing.CARD_FIELDS)
+        .order_by('-created_at', '-id')
+    )
 
+    ranked_ids = None
     if form.is_valid():
         search = form.cleaned_data.get('search')
         category = form.cleaned_data.get('category')
@@ -17,7 +36,9 @@ def event_list_view(request):
         date_to = form.cleaned_data.get('date_to')
 
         if search:
-            events = events.filter(title__icontains=search)
+            # Índex de text complet (títol, descripció i etiquetes) en lloc d'un regex sobre tota la col·lecció
+            ranked_ids = text_search.search_event_ids(search)
+            events = events.filter(pk__in=ranked_ids)
 
         if category:
             events = events.filter(category=category)
@@ -35,16 +56,27 @@ def event_list_view(request):
             end_dt = datetime.combine(date_to, time.max)
             events = events.filter(scheduled_date__lte=end_dt)
 
-    # Paginación
-    paginator = Paginator(events, 12)
+    # Paginació per cursor (sense count()); els enllaços antics amb ?page= continuen funcionant
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if ranked_ids is not None:
+        # Resultats d'una cerca: ordenats per rellevància i amb pàgines numerades
+        matching = set(events.values_list('id', flat=True))
+        page_obj = Paginator([pk for pk in ranked_ids if pk in matching], 12).get_page(page_number)
+        by_pk = events.in_bulk(page_obj.object_list)
+        page_obj.object_list = [by_pk[pk] for pk in page_obj.object_list if pk in by_pk]
+    elif page_number:
+        page_obj = Paginator(events, 12).get_page(page_number)
+    else:
+        page_obj = listing.keyset_page(events, request.GET, 12)
 
     context = {
         'form': form,
         'events': page_obj
     }
-    return render(request, 'events/event_list.html', context)
+    response = render(request, 'events/event_list.html', context)
+    if cache_key:
+        cache.set(cache_key, response.content, listing.page_cache_ttl())
+    return response
 
 from chat.forms import ChatMessageForm
 
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class SemanticSearchConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "semantic_search"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Opcional: el worker no accepta peticions fins que el model està carregat
+        if getattr(settings, "SEMANTIC_WARMUP_ON_START", False):
+            from .services.embeddings import warmup
+            warmup()
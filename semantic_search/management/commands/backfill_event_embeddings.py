@@ -1,8 +1,33 @@
+import json
+import os
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 
 from events.models import Event
-from semantic_search.services.embeddings import embed_text, model_name
+from semantic_search.services.documents import event_document
+from semantic_search.services import snapshot as shared_store
+from semantic_search.services.embeddings import embed_texts, model_name, start_pool, stop_pool
+from semantic_search.services.store import save_embeddings
+
+# Nombre d'events que es llegeixen de la DB a cada tros
+CHUNK_SIZE = 512
+CHECKPOINT_FILE = settings.BASE_DIR / ".backfill_embeddings.json"
+
+def _read_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_checkpoint(data: dict):
+    # Escriptura atòmica: mai deixem un fitxer a mitges si el procés mor
+    tmp = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, CHECKPOINT_FILE)
 
 class Command(BaseCommand):
     help = "Genera i desa embeddings per a Events."
@@ -10,47 +35,68 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--force", action="store_true", help="Recalcula encara que ja hi hagi embedding")
         parser.add_argument("--limit", type=int, default=0, help="Limita el nombre d'events (0 = tots)")
+        parser.add_argument("--batch-size", type=int, default=64, help="Mida del batch de SentenceTransformer.encode")
+        parser.add_argument("--workers", type=int, default=0, help="Processos CPU per codificar (0/1 = un sol procés)")
+        parser.add_argument("--resume", action="store_true", help="Continua des de l'últim checkpoint")
 
     def handle(self, *args, **options):
         force = options["force"]
         limit = options["limit"]
+        batch_size = max(1, options["batch_size"])
+        workers = options["workers"]
+
+        last_pk = 0
+        total = 0
+        checkpoint = _read_checkpoint() if options["resume"] else None
+        if checkpoint and checkpoint.get("model") == model_name() and checkpoint.get("force") == force:
+            last_pk = checkpoint["last_pk"]
+            total = checkpoint["total"]
+            self.stdout.write(f"Reprenent des de l'event {last_pk} ({total} ja fets)")
 
-        qs = Event.objects.all().order_by("created_at")
+        qs = Event.objects.all().only("id", "title", "description", "category", "tags", "scheduled_date")
         if not force:
-            qs = qs.filter(embedding__isnull=True)
-
-        if limit and limit > 0:
-            qs = qs[:limit]
-
-        CATEGORY_MAP = {
-            'sports': 'Esports, Futbol, Baloncesto, Basquet, Tenis, Competición, Partido',
-            'gaming': 'Videojuegos, eSports, Twitch, YouTube, Streamer, Torneo de Videojuegos, Fortnite, CS:GO, LoL',
-            'music': 'Concierto, Canción, Álbum, Banda, Artista, En vivo, Música',
-            'talk': 'Podcast, Entrevista, Charla, Conferencia, Mesa redonda, Debate',
-            'education': 'Curso, Clase, Taller, Aprender, Tutorial, Guía',
-            'entertainment': 'Comedia, Show, Espectáculo, Magia, Entretenimiento',
-            'technology': 'Programación, Software, Hardware, IA, Inteligencia Artificial, Tech',
-            'art': 'Pintura, Dibujo, Diseño, Creatividad, Arte',
-        }
+            qs = qs.filter(embedding_vec__isnull=True)
 
-        total = 0
-        for e in qs:
-            text = " | ".join([
-                (e.title or "").strip(),
-                (e.description or "").strip(),
-                (e.category or "").strip(),
-                CATEGORY_MAP.get(e.category, ""),
-                (e.tags or "").strip(),
-            ]).strip()
-
-            if not text:
-                continue
-
-            vec = embed_text(text)
-            e.embedding = vec
-            e.embedding_model = model_name()
-            e.embedding_updated_at = timezone.now()
-            e.save(update_fields=["embedding", "embedding_model", "embedding_updated_at"])
-            total += 1
+        pool = start_pool(workers) if workers > 1 else None
+        started = time.monotonic()
+        done_now = 0
+        finished = False
+        try:
+            while True:
+                chunk_size = CHUNK_SIZE
+                if limit and limit > 0:
+                    chunk_size = min(chunk_size, limit - done_now)
+                    if chunk_size <= 0:
+                        break
+
+                # Paginació per clau (pk) per poder reprendre sense offsets
+                chunk = list(qs.filter(pk__gt=last_pk).order_by("pk")[:chunk_size])
+                if not chunk:
+                    finished = True
+                    break
+
+                texts = [event_document(e) for e in chunk]
+                events = [e for e, text in zip(chunk, texts) if text]
+                if events:
+                    vectors = embed_texts([t for t in texts if t], batch_size=batch_size, pool=pool)
+                    save_embeddings(events, vectors)
 
+                last_pk = chunk[-1].pk
+                total += len(events)
+                done_now += len(chunk)
+                _write_checkpoint({"last_pk": last_pk, "total": total, "model": model_name(), "force": force})
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"  {total} embeddings ({done_now / elapsed:.1f} events/s)")
+        finally:
+            if pool is not None:
+                stop_pool(pool)
+
+        if finished and os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
         self.stdout.write(self.style.SUCCESS(f"Embeddings generats: {total}"))
+
+        # Nova versió del magatzem compartit: els workers hi canvien al proper refresc
+        if shared_store.enabled():
+            manifest = shared_store.publish()
+            self.stdout.write(f"Magatzem d'embeddings publicat: versió {manifest['version']} ({manifest['size']} events)")
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from semantic_search.services.ann import IVF, default_nlist
+from semantic_search.services.index import VectorIndex
+from semantic_search.services.ranker import normalize_rows
+
+
+def _clustered(rng, n, dim, clusters):
+    """Vectors agrupats en `clusters` temes (els embeddings reals no són uniformes)."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    data = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(data)[0]
+
+
+class Command(BaseCommand):
+    help = "Benchmark de la cerca ANN (IVF): recall@k i latència respecte a la cerca exacta."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+        parser.add_argument("--dim", type=int, default=384)
+        parser.add_argument("--k", type=int, default=20)
+        parser.add_argument("--nlist", type=int, default=None)
+        parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--clusters", type=int, default=500)
+
+    @override_settings(SEMANTIC_ANN_MIN_SIZE=0)  # mesurem l'IVF també als catàlegs petits
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        dim, k = options["dim"], options["k"]
+
+        for n in options["sizes"]:
+            data = _clustered(rng, n, dim, options["clusters"])
+            index = VectorIndex()
+            for pk in range(1, n + 1):
+                index.upsert(pk, data[pk - 1])
+
+            queries = normalize_rows(data[rng.choice(n, options["queries"])] +
+                                     0.3 * rng.standard_normal((options["queries"], dim)).astype(np.float32))[0]
+
+            t0 = time.perf_counter()
+            ivf = IVF.train(*index.ann_snapshot()[:1], nlist=options["nlist"] or default_nlist(n))
+            train_s = time.perf_counter() - t0
+            index.attach_ann(ivf)
+
+            # Anada i tornada pel fitxer, com farien els workers
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "ann.npz")
+                ivf.save(path, *index.assignments())
+                t0 = time.perf_counter()
+                index.attach_ann(*IVF.load(path))
+                load_s = time.perf_counter() - t0
+
+            self.stdout.write(f"N={n} nlist={ivf.nlist}: entrenament {train_s:.1f}s, càrrega del fitxer {load_s:.2f}s")
+            exact, exact_ms = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                exact.append({pk for pk, _ in index.search(q, k=k, nprobe=0)})
+                exact_ms.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(f"  {'exacta':>10} recall@{k}=1.000 {np.median(exact_ms):>8.2f}ms")
+
+            for nprobe in options["nprobe"]:
+                recall, ms = 0.0, []
+                for q, truth in zip(queries, exact):
+                    t0 = time.perf_counter()
+                    found = {pk for pk, _ in index.search(q, k=k, nprobe=nprobe)}
+                    ms.append((time.perf_counter() - t0) * 1000)
+                    recall += len(found & truth) / len(truth)
+                self.stdout.write(
+                    f"  nprobe={nprobe:<3} recall@{k}={recall / len(queries):.3f} {np.median(ms):>8.2f}ms"
+                    f" ({np.median(exact_ms) / np.median(ms):.1f}x)"
+                )
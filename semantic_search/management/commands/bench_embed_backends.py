@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from semantic_search.services.backends import BACKENDS, load_backend
+from semantic_search.services.embeddings import model_name
+
+_QUERIES = [
+    "concerts de jazz aquest cap de setmana", "torneig de videojocs", "curs de programació",
+    "xerrada sobre intel·ligència artificial", "partit de futbol", "taller de pintura",
+    "música en directe", "podcast d'entrevistes", "espectacle de màgia", "tutorial de django",
+]
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+class Command(BaseCommand):
+    help = "Compara els backends d'embeddings: càrrega, memòria, latència per consulta i paritat amb torch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+        parser.add_argument("--repeat", type=int, default=50, help="Consultes individuals a mesurar")
+        parser.add_argument("--batch", type=int, default=32)
+        # Ús intern: cada backend es mesura en un procés nou perquè la memòria sigui comparable
+        parser.add_argument("--child", help="(intern) fitxer .npz on desar el resultat")
+
+    def handle(self, *args, **options):
+        if options["child"]:
+            return self._measure(options["backends"][0], options)
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in options["backends"]:
+                out = os.path.join(tmp, f"{name}.npz")
+                cmd = [sys.executable, sys.argv[0], "bench_embed_backends", "--backends", name,
+                       "--repeat", str(options["repeat"]), "--batch", str(options["batch"]), "--child", out]
+                proc = subprocess.run(cmd, capture_output=True, text=True)
+                if proc.returncode != 0 or not os.path.exists(out):
+                    error = (proc.stderr.strip().splitlines() or ["?"])[-1]
+                    self.stdout.write(f"{name:<11} no disponible: {error}")
+                    continue
+                with np.load(out) as data:
+                    results[name] = (json.loads(str(data["stats"])), data["vectors"])
+
+        reference = results.get("torch", (None, None))[1]
+        self.stdout.write(
+            f"{'backend':<11} {'càrrega':>8} {'RSS':>8} {'p50':>8} {'p95':>8} {'lot/s':>8} {'cos min':>8}"
+        )
+        for name, (stats, vectors) in results.items():
+            parity = float(np.sum(vectors * reference, axis=1).min()) if reference is not None else float("nan")
+            self.stdout.write(
+                f"{name:<11} {stats['load']:>7.2f}s {stats['rss']:>6.0f}MB {stats['p50']:>6.1f}ms "
+                f"{stats['p95']:>6.1f}ms {stats['throughput']:>8.0f} {parity:>8.4f}"
+            )
+
+    def _measure(self, name, options):
+        rss0 = _rss_mb()
+        t0 = time.perf_counter()
+        backend = load_backend(model_name(), name)
+        backend.encode(["warmup"])
+        load = time.perf_counter() - t0
+
+        latencies = []
+        for i in range(options["repeat"]):
+            t0 = time.perf_counter()
+            backend.encode([f"{_QUERIES[i % len(_QUERIES)]} {i}"])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        texts = [f"{q} {i}" for i in range(options["batch"] * 4) for q in _QUERIES[:1]]
+        t0 = time.perf_counter()
+        backend.encode(texts, batch_size=options["batch"])
+        throughput = len(texts) / (time.perf_counter() - t0)
+
+        stats = {
+            "load": load,
+            "rss": _rss_mb() - rss0,
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "throughput": throughput,
+        }
+        np.savez(options["child"], stats=json.dumps(stats), vectors=backend.encode(_QUERIES))
@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from semantic_search.services.ranker import cosine_top_k, normalize_rows, top_k
+
+
+def _legacy_cosine_top_k(query_vec, items, k=20):
+    # Implementació original (bucle Python) com a referència
+    q = np.array(query_vec, dtype=np.float32)
+    scored = []
+    for obj, emb in items:
+        v = np.array(emb, dtype=np.float32)
+        if v.shape != q.shape or np.linalg.norm(v) == 0:
+            continue
+        scored.append((obj, float(np.dot(q, v))))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:k]
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark del rànquing cosinus: bucle original vs versió vectoritzada."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+        parser.add_argument("--dim", type=int, default=384)
+        parser.add_argument("--k", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        dim, k, repeat = options["dim"], options["k"], options["repeat"]
+
+        self.stdout.write(f"{'N':>8} {'original':>12} {'cosine_top_k':>14} {'top_k':>10} {'speedup':>9}")
+        for n in options["sizes"]:
+            matrix, _ = normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+            query = matrix[0].tolist()
+            items = [(i, row) for i, row in enumerate(matrix.tolist())]
+            mask = np.ones(n, dtype=bool)
+
+            legacy = _best_of(lambda: _legacy_cosine_top_k(query, items, k), repeat)
+            wrapper = _best_of(lambda: cosine_top_k(query, items, k), repeat)
+            batched = _best_of(lambda: top_k(query, matrix, k=k, mask=mask, normalized=True), repeat)
+
+            self.stdout.write(
+                f"{n:>8} {legacy:>10.2f}ms {wrapper:>12.2f}ms {batched:>8.2f}ms {legacy / batched:>8.0f}x"
+            )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from semantic_search.services.ann import IVF, ann_path, default_nlist
+from semantic_search.services.index import get_index
+
+
+class Command(BaseCommand):
+    help = "Entrena l'índex ANN (IVF) amb els embeddings actuals i el desa a SEMANTIC_ANN_PATH."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--nlist", type=int, default=None, help="Nombre de llistes (per defecte ~4·√N)")
+        parser.add_argument("--iters", type=int, default=10, help="Iteracions de k-means")
+        parser.add_argument("--sample", type=int, default=None, help="Vectors de mostra per entrenar")
+
+    def handle(self, *args, **options):
+        index = get_index()
+        matrix, ids = index.ann_snapshot()
+        if not len(ids):
+            raise CommandError("No hi ha embeddings a l'índex.")
+
+        nlist = options["nlist"] or default_nlist(len(ids))
+        t0 = time.perf_counter()
+        ivf = IVF.train(matrix, nlist=nlist, iters=options["iters"], sample_size=options["sample"])
+        index.attach_ann(ivf)
+        ivf.save(ann_path(), *index.assignments())
+        self.stdout.write(self.style.SUCCESS(
+            f"IVF amb {ivf.nlist} llistes per a {len(ids)} events en {time.perf_counter() - t0:.1f}s -> {ann_path()}"
+        ))
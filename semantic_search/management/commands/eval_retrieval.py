@@ -0,0 +1,77 @@
+import json
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from events.models import Event
+from semantic_search.services.embeddings import embed_texts
+from semantic_search.services.hybrid import hybrid_rank
+from semantic_search.services.index import get_index
+
+
+def _synthetic_queries(sample: int, seed: int):
+    """
+    Consultes generades a partir d'events amb embedding: el títol, les
+    etiquetes i l'inici de la descripció, amb l'event com a únic rellevant.
+    """
+    pks = list(Event.objects.filter(embedding_vec__isnull=False).values_list("id", flat=True))
+    random.Random(seed).shuffle(pks)
+    queries = []
+    for e in Event.objects.filter(pk__in=pks[:sample]).only("id", "title", "description", "tags"):
+        for text in (e.title, e.tags, " ".join((e.description or "").split()[:8])):
+            if text and text.strip():
+                queries.append({"query": text.strip(), "relevant": [e.pk]})
+    return queries
+
+
+class Command(BaseCommand):
+    help = "Avalua la recuperació (recall@k i latència): només vectorial vs híbrida."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", help="Fitxer JSONL amb {\"query\": ..., \"relevant\": [ids]} per línia")
+        parser.add_argument("--sample", type=int, default=100, help="Events per generar consultes si no hi ha --queries")
+        parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10, 20])
+        parser.add_argument("--future", action="store_true", help="Només events futurs")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["queries"]:
+            with open(options["queries"], encoding="utf-8") as f:
+                queries = [json.loads(line) for line in f if line.strip()]
+        else:
+            queries = _synthetic_queries(options["sample"], options["seed"])
+        if not queries:
+            raise CommandError("No hi ha consultes per avaluar (cal tenir events amb embedding).")
+
+        ks = sorted(options["k"])
+        depth, only_future = ks[-1], options["future"]
+        index = get_index()
+
+        t0 = time.perf_counter()
+        vectors = embed_texts([q["query"] for q in queries])
+        embed_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        methods = {
+            "vectorial": lambda q, vec: index.search(vec, k=depth, only_future=only_future),
+            "híbrida": lambda q, vec: hybrid_rank(q, vec, k=depth, only_future=only_future),
+        }
+        self.stdout.write(f"{len(queries)} consultes, embedding {embed_ms:.1f} ms/consulta (no inclòs a la latència)")
+        header = " ".join(f"{'R@' + str(k):>7}" for k in ks)
+        self.stdout.write(f"{'mètode':<10} {header} {'p50':>8} {'p95':>8}")
+
+        for name, fn in methods.items():
+            hits = {k: 0.0 for k in ks}
+            latencies = []
+            for q, vec in zip(queries, vectors):
+                t0 = time.perf_counter()
+                ranked = [pk for pk, _ in fn(q["query"], vec)]
+                latencies.append((time.perf_counter() - t0) * 1000)
+                relevant = set(q["relevant"])
+                for k in ks:
+                    hits[k] += len(relevant.intersection(ranked[:k])) / len(relevant)
+
+            recall = " ".join(f"{hits[k] / len(queries):>7.3f}" for k in ks)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            self.stdout.write(f"{name:<10} {recall} {p50:>6.2f}ms {p95:>6.2f}ms")
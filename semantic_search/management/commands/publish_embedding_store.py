@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from semantic_search.services import snapshot as shared_store
+
+
+class Command(BaseCommand):
+    help = "Publica una nova versió del magatzem d'embeddings compartit (mmap) a partir de la DB."
+
+    def handle(self, *args, **options):
+        manifest = shared_store.publish()
+        self.stdout.write(self.style.SUCCESS(
+            f"Versió {manifest['version']}: {manifest['size']} events ({manifest['dim']} dimensions) a {shared_store.store_dir()}"
+        ))
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from semantic_search.services.embed_server import MicroBatcher, make_server
+from semantic_search.services.embeddings import get_model, model_name
+
+
+class Command(BaseCommand):
+    help = "Servidor local d'embeddings: carrega el model un cop i agrupa les peticions concurrents."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", default=None,
+                            help="host:port o unix:/camí/al/socket (per defecte, segons SEMANTIC_EMBED_SERVER_URL)")
+        parser.add_argument("--window-ms", type=float, default=5.0, help="Finestra per agrupar peticions")
+        parser.add_argument("--max-batch", type=int, default=64, help="Textos màxims per lot")
+
+    def handle(self, *args, **options):
+        address = options["bind"] or _address_from_url(getattr(settings, "SEMANTIC_EMBED_SERVER_URL", None))
+
+        t0 = time.perf_counter()
+        model = get_model()
+        model.encode(["warmup"], normalize_embeddings=True)
+        self.stdout.write(f"Model {model_name()} carregat en {time.perf_counter() - t0:.1f}s")
+
+        batcher = MicroBatcher(
+            lambda texts: model.encode(texts, normalize_embeddings=True, show_progress_bar=False),
+            window=options["window_ms"] / 1000,
+            max_batch=options["max_batch"],
+        )
+        server = make_server(address, batcher, model_name())
+        self.stdout.write(self.style.SUCCESS(f"Servidor d'embeddings escoltant a {address}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def _address_from_url(url):
+    if not url:
+        return "127.0.0.1:8765"
+    if url.startswith("unix://"):
+        return "unix:" + url[len("unix://"):]
+    return url.split("://", 1)[-1].rstrip("/")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from semantic_search.services.backends import backend_name
+from semantic_search.services.embeddings import model_name, warmup
+
+
+class Command(BaseCommand):
+    help = "Precarrega el model d'embeddings i fa una codificació de prova (abans d'acceptar tràfic)."
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        timings = warmup()
+        total = time.perf_counter() - t0
+
+        if "server" in timings:
+            self.stdout.write(f"Servidor d'embeddings disponible ({timings['server'] * 1000:.0f} ms)")
+        else:
+            self.stdout.write(
+                f"{model_name()} ({backend_name()}): càrrega amb imports {timings['load']:.2f}s, "
+                f"primera codificació {timings['encode'] * 1000:.0f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Models preparats en {total:.2f}s"))
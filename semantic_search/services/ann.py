@@ -0,0 +1,116 @@
+"""
+Cerca aproximada (ANN) per a catàlegs grans: índex IVF (inverted file).
+
+Els vectors es reparteixen en `nlist` llistes amb k-means esfèric; una
+consulta només puntua les files de les `nprobe` llistes amb el centroide més
+proper. Més `nprobe` vol dir més recall i més latència.
+
+Els centroides i les assignacions es desen en un fitxer .npz local
+(SEMANTIC_ANN_PATH) perquè els workers no hagin de tornar a entrenar en arrencar.
+"""
+import math
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+from .ranker import normalize_rows
+
+_FORMAT_VERSION = 1
+_ASSIGN_CHUNK = 65_536
+
+
+def ann_path() -> str:
+    return getattr(settings, "SEMANTIC_ANN_PATH", None) or os.path.join(settings.BASE_DIR, ".semantic_ann.npz")
+
+
+def default_nlist(n: int) -> int:
+    """Nombre de llistes per a `n` vectors (~4·√n, com a mínim 16)."""
+    return max(16, int(4 * math.sqrt(max(n, 1))))
+
+
+class IVF:
+
+    def __init__(self, centroids):
+        self.centroids, _ = normalize_rows(centroids)
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @classmethod
+    def train(cls, matrix, nlist: int = None, iters: int = 10, sample_size: int = None, seed: int = 0):
+        """
+        K-means esfèric sobre una mostra de `matrix` (files ja normalitzades).
+        """
+        rng = np.random.default_rng(seed)
+        n = matrix.shape[0]
+        nlist = min(nlist or default_nlist(n), n)
+        sample_size = min(n, sample_size or max(64 * nlist, 50_000))
+        data = matrix[np.sort(rng.choice(n, sample_size, replace=False))] if sample_size < n else matrix
+
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = cls(centroids).assign(data)
+            counts = np.bincount(assign, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            nonempty = counts > 0
+            sums = np.zeros_like(centroids)
+            sums[nonempty] = np.add.reduceat(data[np.argsort(assign, kind="stable")], starts[nonempty])
+            # Les llistes buides es reinicien amb un punt a l'atzar
+            empty = np.flatnonzero(~nonempty)
+            if len(empty):
+                sums[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+            centroids, _ = normalize_rows(sums)
+        return cls(centroids)
+
+    def assign(self, matrix) -> np.ndarray:
+        """Llista (centroide més proper) de cada fila."""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        out = np.empty(matrix.shape[0], dtype=np.int32)
+        for start in range(0, matrix.shape[0], _ASSIGN_CHUNK):
+            chunk = matrix[start:start + _ASSIGN_CHUNK]
+            out[start:start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return out
+
+    def probe(self, query, nprobe: int) -> np.ndarray:
+        """Màscara booleana (nlist,) de les `nprobe` llistes més properes a la consulta."""
+        sims = self.centroids @ np.asarray(query, dtype=np.float32).ravel()
+        nprobe = min(max(nprobe, 1), self.nlist)
+        lookup = np.zeros(self.nlist, dtype=bool)
+        lookup[np.argpartition(-sims, nprobe - 1)[:nprobe]] = True
+        return lookup
+
+    def save(self, path: str, ids=None, assign=None):
+        """
+        Desa els centroides (i opcionalment ids + assignacions) de forma atòmica:
+        s'escriu un fitxer temporal al mateix directori i es fa os.replace.
+        """
+        ids = np.zeros(0, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        assign = np.zeros(0, dtype=np.int32) if assign is None else np.asarray(assign, dtype=np.int32)
+        order = np.argsort(ids)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, version=_FORMAT_VERSION, centroids=self.centroids, ids=ids[order], assign=assign[order])
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str):
+        """Retorna (ivf, ids ordenats, assignacions) o None si el fitxer no existeix o no és vàlid."""
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != _FORMAT_VERSION:
+                    return None
+                return cls(data["centroids"]), data["ids"], data["assign"]
+        except (OSError, KeyError, ValueError):
+            return None
@@ -0,0 +1,168 @@
+"""
+Backends d'inferència per als embeddings (SEMANTIC_EMBED_BACKEND).
+
+  torch       SentenceTransformer tal qual (referència)
+  torch-int8  el mateix amb les capes Linear quantitzades dinàmicament a int8
+  onnx        model exportat a ONNX i executat amb ONNX Runtime
+  onnx-int8   l'ONNX anterior amb quantització dinàmica int8 dels pesos
+
+Tots tenen el mateix `encode(texts, batch_size, normalize_embeddings)` que
+SentenceTransformer i retornen float32 (N, D). SEMANTIC_EMBED_THREADS fixa
+els fils de CPU (0 = el valor per defecte de la llibreria).
+Les biblioteques només s'importen en carregar el backend.
+"""
+import logging
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Longitud màxima de seqüència del model (la mateixa que fa servir SentenceTransformer)
+MAX_SEQ_LENGTH = 128
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.where(norms > 0, norms, 1)
+
+
+class TorchBackend:
+    name = "torch"
+    # Només el model sense quantitzar es pot repartir entre processos (encode_multi_process)
+    supports_pool = True
+
+    def __init__(self, model_name: str, threads: int = 0):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True, **kwargs):
+        vecs = self.model.encode(
+            list(texts), batch_size=batch_size, normalize_embeddings=normalize_embeddings, show_progress_bar=False
+        )
+        return np.asarray(vecs, dtype=np.float32)
+
+
+class TorchInt8Backend(TorchBackend):
+    name = "torch-int8"
+    supports_pool = False
+
+    def __init__(self, model_name: str, threads: int = 0):
+        super().__init__(model_name, threads)
+        import torch
+
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_path(model_name: str, quantize: bool = False) -> str:
+    base = getattr(settings, "SEMANTIC_ONNX_DIR", None) or os.path.join(settings.BASE_DIR, ".onnx")
+    suffix = ".int8.onnx" if quantize else ".onnx"
+    return os.path.join(str(base), model_name.replace("/", "__") + suffix)
+
+
+def export_onnx(model_name: str, quantize: bool = False) -> str:
+    """
+    Exporta el transformer del model a ONNX (cal torch i transformers) i,
+    si cal, en crea la versió quantitzada. Retorna el camí del fitxer.
+    """
+    path = onnx_path(model_name, quantize)
+    fp32 = onnx_path(model_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if not os.path.exists(fp32):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        logger.info("Exportant %s a ONNX (%s)", model_name, fp32)
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        sample = AutoTokenizer.from_pretrained(model_name)(["exemple"], return_tensors="pt")
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fp32), suffix=".onnx.tmp")
+        os.close(fd)
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            tmp,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+        os.replace(tmp, fp32)
+
+    if quantize and not os.path.exists(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".onnx.tmp")
+        os.close(fd)
+        quantize_dynamic(fp32, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, path)
+    return path
+
+
+class OnnxBackend:
+    name = "onnx"
+    supports_pool = False
+    quantize = False
+
+    def __init__(self, model_name: str, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = onnx_path(model_name, self.quantize)
+        if not os.path.exists(path):
+            path = export_onnx(model_name, self.quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True, **kwargs):
+        texts = list(texts)
+        out = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=MAX_SEQ_LENGTH, return_tensors="np",
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.inputs if name in encoded}
+            hidden = self.session.run(None, feeds)[0]
+            # Mean pooling amb la màscara d'atenció, com el mòdul Pooling del model
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            out.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        vecs = np.concatenate(out).astype(np.float32) if out else np.zeros((0, 0), dtype=np.float32)
+        return _normalize(vecs) if normalize_embeddings else vecs
+
+
+class OnnxInt8Backend(OnnxBackend):
+    name = "onnx-int8"
+    quantize = True
+
+
+BACKENDS = {cls.name: cls for cls in (TorchBackend, TorchInt8Backend, OnnxBackend, OnnxInt8Backend)}
+
+
+def backend_name() -> str:
+    return getattr(settings, "SEMANTIC_EMBED_BACKEND", "torch")
+
+
+def load_backend(model_name: str, name: str = None):
+    name = name or backend_name()
+    if name not in BACKENDS:
+        raise ValueError(f"Backend d'embeddings desconegut: {name} (opcions: {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_name, threads=getattr(settings, "SEMANTIC_EMBED_THREADS", 0))
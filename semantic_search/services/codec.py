@@ -0,0 +1,55 @@
+import struct
+
+import numpy as np
+
+# Format binari compacte dels embeddings:
+#   capçalera de 8 bytes: b"EV" + versió (1 byte) + tipus (1 byte) + escala float32
+#   seguit dels valors en little-endian (float32, float16 o int8 quantitzat)
+_MAGIC = b"EV"
+_VERSION = 1
+_HEADER = struct.Struct("<2sBBf")
+
+_DTYPES = {
+    "float32": (1, np.dtype("<f4")),
+    "float16": (2, np.dtype("<f2")),
+    "int8": (3, np.dtype("i1")),
+}
+_BY_CODE = {code: (name, dtype) for name, (code, dtype) in _DTYPES.items()}
+
+
+def encode_vector(vec, dtype: str = "float32") -> bytes:
+    """
+    Converteix un vector a bytes. Amb "int8" es quantitza simètricament
+    i es desa l'escala a la capçalera.
+    """
+    if dtype not in _DTYPES:
+        raise ValueError(f"Tipus d'embedding no suportat: {dtype}")
+    code, np_dtype = _DTYPES[dtype]
+    v = np.asarray(vec, dtype=np.float32).ravel()
+
+    scale = 1.0
+    if dtype == "int8":
+        peak = float(np.abs(v).max()) if v.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        data = np.clip(np.rint(v / scale), -127, 127).astype(np_dtype)
+    else:
+        data = v.astype(np_dtype)
+    return _HEADER.pack(_MAGIC, _VERSION, code, scale) + data.tobytes()
+
+
+def decode_vector(blob):
+    """
+    Llegeix un vector codificat amb encode_vector directament a NumPy
+    (np.frombuffer, sense passar per llistes Python). Retorna float32 o None.
+    """
+    if not blob:
+        return None
+    buf = memoryview(blob)
+    magic, version, code, scale = _HEADER.unpack_from(buf)
+    if magic != _MAGIC or version != _VERSION or code not in _BY_CODE:
+        raise ValueError("Format d'embedding desconegut")
+    name, np_dtype = _BY_CODE[code]
+    data = np.frombuffer(buf, dtype=np_dtype, offset=_HEADER.size)
+    if name == "int8":
+        return data.astype(np.float32) * np.float32(scale)
+    return data.astype(np.float32, copy=False)
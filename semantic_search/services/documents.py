@@ -0,0 +1,31 @@
+import hashlib
+
+CATEGORY_MAP = {
+    'sports': 'Esports, Futbol, Baloncesto, Basquet, Tenis, Competición, Partido',
+    'gaming': 'Videojuegos, eSports, Twitch, YouTube, Streamer, Torneo de Videojuegos, Fortnite, CS:GO, LoL',
+    'music': 'Concierto, Canción, Álbum, Banda, Artista, En vivo, Música',
+    'talk': 'Podcast, Entrevista, Charla, Conferencia, Mesa redonda, Debate',
+    'education': 'Curso, Clase, Taller, Aprender, Tutorial, Guía',
+    'entertainment': 'Comedia, Show, Espectáculo, Magia, Entretenimiento',
+    'technology': 'Programación, Software, Hardware, IA, Inteligencia Artificial, Tech',
+    'art': 'Pintura, Dibujo, Diseño, Creatividad, Arte',
+}
+
+# Camps d'Event que formen el text de l'embedding
+DOCUMENT_FIELDS = ("title", "description", "category", "tags")
+
+
+def event_document(e) -> str:
+    """Text que es passa al model per generar l'embedding d'un event."""
+    return " | ".join([
+        (e.title or "").strip(),
+        (e.description or "").strip(),
+        (e.category or "").strip(),
+        CATEGORY_MAP.get(e.category, ""),
+        (e.tags or "").strip(),
+    ]).strip()
+
+
+def document_hash(text: str) -> str:
+    """Hash del contingut: si no canvia, no cal tornar a calcular l'embedding."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
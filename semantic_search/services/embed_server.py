@@ -0,0 +1,251 @@
+"""
+Servidor local d'embeddings (manage.py run_embedding_server).
+
+Carrega el model un sol cop i agrupa les peticions concurrents: les que
+arriben dins d'una finestra de pocs mil·lisegons es codifiquen en un sol
+model.encode(). Escolta per HTTP a localhost o per un socket Unix.
+
+Protocol:
+  POST /embed  {"texts": [...]}  ->  float32 little-endian (N, D) en binari,
+               amb les capçaleres X-Embedding-Dim i X-Embedding-Model
+  GET /health  ->  JSON amb el model i estadístiques dels lots
+"""
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ("texts", "result", "error", "done")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Agrupa les crides concurrents a `encode` en lots de com a molt `max_batch`
+    textos, esperant com a molt `window` segons des de la primera petició.
+    """
+
+    def __init__(self, encode, window: float = 0.005, max_batch: int = 64):
+        self._encode = encode
+        self._window = window
+        self._max_batch = max_batch
+        self._cond = threading.Condition()
+        self._queue = []
+        self.batches = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: list[str]) -> np.ndarray:
+        job = _Job(texts)
+        with self._cond:
+            self._queue.append(job)
+            self._cond.notify()
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch": self.texts / self.batches if self.batches else 0.0,
+                "queued": len(self._queue),
+            }
+
+    def _take(self) -> list[_Job]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self._window
+            while sum(len(j.texts) for j in self._queue) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            jobs, count = [], 0
+            while self._queue and (not jobs or count + len(self._queue[0].texts) <= self._max_batch):
+                job = self._queue.pop(0)
+                jobs.append(job)
+                count += len(job.texts)
+            return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._take()
+            try:
+                vecs = np.asarray(self._encode([t for j in jobs for t in j.texts]), dtype=np.float32)
+                start = 0
+                for job in jobs:
+                    job.result = vecs[start:start + len(job.texts)]
+                    start += len(job.texts)
+                with self._cond:
+                    self.batches += 1
+                    self.texts += start
+            except Exception as exc:
+                logger.exception("Error codificant un lot de %s peticions", len(jobs))
+                for job in jobs:
+                    job.error = exc
+            finally:
+                for job in jobs:
+                    job.done.set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, body: bytes, content_type: str, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data: dict):
+        self._reply(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._json(404, {"error": "not found"})
+        self._json(200, {"model": self.server.model_name, **self.server.batcher.stats()})
+
+    def do_POST(self):
+        if self.path != "/embed":
+            return self._json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            texts = json.loads(self.rfile.read(length))["texts"]
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("texts ha de ser una llista de cadenes")
+        except (ValueError, KeyError, TypeError) as exc:
+            return self._json(400, {"error": str(exc)})
+        try:
+            vecs = self.server.batcher.submit(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+        except Exception as exc:
+            return self._json(500, {"error": str(exc)})
+        self._reply(200, vecs.astype("<f4").tobytes(), "application/octet-stream", {
+            "X-Embedding-Dim": str(vecs.shape[1] if vecs.ndim == 2 else 0),
+            "X-Embedding-Model": self.server.model_name,
+        })
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+# Cua d'espera del socket: cal que absorbeixi ràfegues de tots els workers
+_BACKLOG = 256
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    request_queue_size = _BACKLOG
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = _BACKLOG
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler espera una adreça (host, port)
+        return request, ("unix", 0)
+
+
+def make_server(address: str, batcher: MicroBatcher, model_name: str):
+    """
+    `address` és "host:port" o "unix:/camí/al/socket".
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = _UnixHTTPServer(path, _Handler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = _TCPHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+    server.batcher = batcher
+    server.model_name = model_name
+    return server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class EmbedClient:
+    """
+    Client del servidor, amb una connexió persistent per fil.
+    `url` és "http://127.0.0.1:8765" o "unix:///camí/al/socket".
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.url)
+            if parsed.scheme == "unix":
+                conn = _UnixConnection(parsed.path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def embed(self, texts: list[str]):
+        """Retorna (matriu float32 (N, D), nom del model). Llença OSError si falla."""
+        body = json.dumps({"texts": texts}).encode("utf-8")
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request("POST", "/embed", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as exc:
+                # La connexió persistent pot haver caducat: un reintent amb una de nova
+                conn.close()
+                self._local.conn = None
+                if attempt == 2:
+                    raise OSError(f"Error de connexió amb el servidor d'embeddings: {exc!r}") from exc
+        if response.status != 200:
+            raise OSError(f"El servidor d'embeddings ha respost {response.status}: {data[:200]!r}")
+        try:
+            dim = int(response.getheader("X-Embedding-Dim") or 0)
+            if dim:
+                vecs = np.frombuffer(data, dtype="<f4").reshape(len(texts), dim)
+            else:
+                vecs = np.zeros((len(texts), 0), np.float32)
+        except ValueError as exc:
+            raise OSError(f"Resposta del servidor d'embeddings no vàlida: {exc}") from exc
+        return vecs, response.getheader("X-Embedding-Model")
@@ -1,25 +1,223 @@
+import hashlib
+import http.client
+import logging
 import threading
-from sentence_transformers import SentenceTransformer
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .backends import backend_name, load_backend
 
 _MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 _lock = threading.Lock()
 _model = None
+_client = None
+_server_down_until = 0.0
+
+logger = logging.getLogger(__name__)
 
 def get_model():
+    """
+    Backend d'inferència del procés (SEMANTIC_EMBED_BACKEND, vegeu backends.py).
+    Té el mateix encode() que SentenceTransformer.
+    """
     global _model
     if _model is None:
         with _lock:
             if _model is None:
-                _model = SentenceTransformer(_MODEL_NAME)
+                # Import tardà: torch, onnxruntime, etc. només es carreguen
+                # als processos que realment calculen embeddings
+                _model = load_backend(_MODEL_NAME)
     return _model
 
+def warmup() -> dict:
+    """
+    Carrega el model i fa una codificació de prova perquè la primera petició
+    no pagui el cost. Amb SEMANTIC_EMBED_SERVER_URL només s'obre la connexió
+    amb el servidor (si respon, el model del procés no cal).
+    Retorna els temps de cada pas en segons.
+    """
+    timings = {}
+    if getattr(settings, "SEMANTIC_EMBED_SERVER_URL", None):
+        t0 = time.perf_counter()
+        if _remote_embed(["warmup"]) is not None:
+            timings["server"] = time.perf_counter() - t0
+            return timings
+    t0 = time.perf_counter()
+    model = get_model()
+    timings["load"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    model.encode(["warmup"], normalize_embeddings=True)
+    timings["encode"] = time.perf_counter() - t0
+    return timings
+
+def _remote_embed(texts: list[str]):
+    """
+    Embeddings calculats pel servidor local (SEMANTIC_EMBED_SERVER_URL).
+    Retorna None si no n'hi ha o no respon; llavors es fa servir el model del procés.
+    """
+    global _client, _server_down_until
+    url = getattr(settings, "SEMANTIC_EMBED_SERVER_URL", None)
+    if not url or time.monotonic() < _server_down_until:
+        return None
+    if _client is None or _client.url != url:
+        from .embed_server import EmbedClient
+        _client = EmbedClient(url, timeout=getattr(settings, "SEMANTIC_EMBED_SERVER_TIMEOUT", 5.0))
+    try:
+        vecs, name = _client.embed(texts)
+        if name != model_name():
+            raise OSError(f"el servidor fa servir el model {name}")
+    except (OSError, http.client.HTTPException, ValueError) as exc:
+        # No ho tornem a provar fins d'aquí a una estona per no afegir latència a cada consulta
+        logger.warning("Servidor d'embeddings no disponible (%s); es calcula al procés", exc)
+        _server_down_until = time.monotonic() + getattr(settings, "SEMANTIC_EMBED_SERVER_RETRY", 30)
+        return None
+    return vecs
+
+class _QueryCache:
+    """
+    Cache LRU amb TTL dels embeddings de consultes, local al procés.
+    Opcionalment delega en una cache de Django compartida entre workers
+    (SEMANTIC_EMBED_CACHE_ALIAS).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        ttl = getattr(settings, "SEMANTIC_EMBED_CACHE_TTL", 3600)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, vec = entry
+                if not ttl or time.monotonic() - stored_at < ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return vec
+                del self._data[key]
+
+        shared = _shared_cache()
+        if shared is not None:
+            vec = shared.get(key)
+            if vec is not None:
+                self._put_local(key, vec)
+                with self._lock:
+                    self.shared_hits += 1
+                return vec
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, vec: tuple):
+        self._put_local(key, vec)
+        shared = _shared_cache()
+        if shared is not None:
+            shared.set(key, vec, getattr(settings, "SEMANTIC_EMBED_CACHE_TTL", 3600) or None)
+
+    def _put_local(self, key: str, vec: tuple):
+        size = getattr(settings, "SEMANTIC_EMBED_CACHE_SIZE", 2048)
+        if size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), vec)
+            self._data.move_to_end(key)
+            while len(self._data) > size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / total if total else 0.0,
+            }
+
+_query_cache = _QueryCache()
+
+def _shared_cache():
+    alias = getattr(settings, "SEMANTIC_EMBED_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+def normalize_query(text: str) -> str:
+    """Normalitza espais i Unicode perquè consultes equivalents comparteixin entrada de cache."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def _cache_key(text: str) -> str:
+    # El backend forma part de la clau: els vectors quantitzats no són idèntics
+    digest = hashlib.sha1(f"{model_name()}\0{backend_name()}\0{text}".encode("utf-8")).hexdigest()
+    return f"semantic:qemb:{digest}"
+
 def embed_text(text: str) -> list[float]:
-    text = (text or "").strip()
+    text = normalize_query(text)
     if not text:
         return []
+
+    key = _cache_key(text)
+    vec = _query_cache.get(key)
+    if vec is None:
+        vecs = _remote_embed([text])
+        if vecs is None:
+            vecs = get_model().encode([text], normalize_embeddings=True)
+        vec = tuple(vecs[0].tolist())
+        _query_cache.put(key, vec)
+    return list(vec)
+
+def embed_cache_stats() -> dict:
+    """Comptadors d'encerts/errades de la cache d'embeddings de consultes."""
+    return _query_cache.stats()
+
+def clear_embed_cache():
+    _query_cache.clear()
+
+def embed_texts(texts: list[str], batch_size: int = 32, pool=None) -> np.ndarray:
+    """
+    Calcula embeddings normalitzats per a molts textos de cop.
+    Retorna una matriu float32 (len(texts), D).
+    Si es passa un `pool` (veure start_pool), el treball es reparteix entre processos.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    if pool is None:
+        vecs = _remote_embed(list(texts))
+        if vecs is not None:
+            return vecs
     model = get_model()
-    vec = model.encode([text], normalize_embeddings=True)[0]
-    return vec.tolist()
+    if pool is not None:
+        vecs = np.asarray(model.model.encode_multi_process(texts, pool, batch_size=batch_size), dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs / np.where(norms > 0, norms, 1)
+    return model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+
+def start_pool(workers: int):
+    """
+    Arrenca un pool de `workers` processos CPU per a embed_texts.
+    Retorna None si el backend no ho suporta (llavors es treballa en un sol procés).
+    """
+    model = get_model()
+    if not model.supports_pool:
+        logger.warning("El backend %s no suporta --workers; es fa servir un sol procés", model.name)
+        return None
+    return model.model.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+def stop_pool(pool):
+    get_model().model.stop_multi_process_pool(pool)
 
 def model_name() -> str:
     return _MODEL_NAME
@@ -0,0 +1,124 @@
+"""
+Recuperació híbrida: rànquing lèxic (títol, descripció i etiquetes amb BM25,
+més paraules clau de categoria) fusionat amb el rànquing vectorial per
+Reciprocal Rank Fusion (RRF).
+
+Si la coincidència lèxica és forta (tots els termes de la consulta apareixen
+en pocs events) i, un cop aplicat el filtre de data, en queden almenys k,
+el pas vectorial només puntua aquests candidats.
+"""
+from django.conf import settings
+
+from events.models import CATEGORY_CHOICES
+from events.services import search as text_search
+from .documents import CATEGORY_MAP
+from .embeddings import embed_text
+from .index import get_index, load_events
+
+_CATEGORY_LABELS = dict(CATEGORY_CHOICES)
+# CATEGORY_MAP és en castellà (forma part del text dels embeddings); aquí hi afegim el català
+_CATEGORY_KEYWORDS_CA = {
+    'sports': 'esport futbol basquet partit competicio',
+    'gaming': 'videojoc jocs gamer torneig partida',
+    'music': 'musica concert canço disc grup directe',
+    'talk': 'xerrada entrevista conferencia taula rodona',
+    'education': 'curs classe taller aprendre tutorial',
+    'entertainment': 'comedia espectacle magia entreteniment',
+    'technology': 'programacio tecnologia intel·ligencia artificial',
+    'art': 'pintura dibuix disseny creativitat art',
+}
+_category_terms = None
+
+
+def _categories_for(query: str) -> set[str]:
+    """Categories que la consulta esmenta (clau, nom o paraules de CATEGORY_MAP)."""
+    global _category_terms
+    if _category_terms is None:
+        _category_terms = {
+            key: set(text_search.tokenize(" ".join([
+                key, _CATEGORY_LABELS.get(key, ""), CATEGORY_MAP.get(key, ""), _CATEGORY_KEYWORDS_CA.get(key, ""),
+            ])))
+            for key in _CATEGORY_LABELS
+        }
+    tokens = set(text_search.tokenize(query))
+    return {key for key, terms in _category_terms.items() if tokens & terms}
+
+
+def rrf(rankings, k: int = 60) -> dict:
+    """
+    Reciprocal Rank Fusion: score(d) = sum(1 / (k + rang)) sobre cada llista.
+    `rankings` és una seqüència de llistes d'ids ordenades de millor a pitjor.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, pk in enumerate(ranking, start=1):
+            fused[pk] = fused.get(pk, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def hybrid_rank(query: str, query_vec, k: int = 20, only_future: bool = False, min_score: float = None):
+    """
+    Retorna [(event_id, score_cosinus), ...] ordenat per la puntuació fusionada.
+
+    Els events sense embedding (o que no passen el filtre de data) no surten.
+    `min_score` descarta els candidats amb poca similitud vectorial, excepte
+    els que contenen tots els termes de la consulta.
+    """
+    text_index = text_search.get_index()
+    vector_index = get_index()
+    depth = max(k * 5, 50)
+    prefilter_max = getattr(settings, "SEMANTIC_HYBRID_PREFILTER_MAX", 200)
+
+    strict = text_index.search(query, limit=prefilter_max + 1, match_all=True)
+    vector = None
+    if strict and len(strict) <= prefilter_max:
+        # Coincidència lèxica forta: el pas vectorial només puntua aquests candidats
+        lexical = strict
+        vector = vector_index.search(query_vec, k=len(lexical), only_future=only_future,
+                                     candidates=[pk for pk, _ in lexical])
+        if len(vector) < k:
+            # Després del filtre de data (o sense embedding) no n'hi ha prou: cerca completa
+            vector = None
+    if vector is None:
+        lexical = text_index.search(query, limit=depth, match_all=False)
+        vector = vector_index.search(query_vec, k=depth, only_future=only_future)
+        # Puntuació vectorial (i filtre de data) dels candidats lèxics que no hi són
+        seen = {pk for pk, _ in vector}
+        missing = [pk for pk, _ in lexical if pk not in seen]
+        if missing:
+            vector += vector_index.search(query_vec, k=len(missing), only_future=only_future,
+                                          candidates=missing)
+            vector.sort(key=lambda item: item[1], reverse=True)
+
+    cosine = dict(vector)
+    lexical_ids = [pk for pk, _ in lexical if pk in cosine]
+    rankings = [[pk for pk, _ in vector], lexical_ids]
+
+    categories = _categories_for(query)
+    if categories:
+        rankings.append([pk for pk, _ in vector if text_index.category_of(pk) in categories])
+
+    fused = rrf(rankings, k=getattr(settings, "SEMANTIC_RRF_K", 60))
+    if min_score is not None:
+        matched = {pk for pk, _ in strict}
+        fused = {pk: s for pk, s in fused.items() if pk in matched or cosine[pk] >= min_score}
+
+    ranked = sorted(fused, key=lambda pk: (fused[pk], cosine[pk]), reverse=True)[:k]
+    return [(pk, cosine[pk]) for pk in ranked]
+
+
+def hybrid_search(query: str, k: int = 20, only_future: bool = False, fields=None,
+                  min_score: float = None, query_vec=None):
+    """
+    Cerca híbrida per a les vistes: retorna [(Event, score_cosinus), ...].
+    Amb SEMANTIC_HYBRID = False només es fa servir el rànquing vectorial.
+    """
+    if query_vec is None:
+        query_vec = embed_text(query)
+    if getattr(settings, "SEMANTIC_HYBRID", True):
+        ranked = hybrid_rank(query, query_vec, k=k, only_future=only_future, min_score=min_score)
+    else:
+        ranked = get_index().search(query_vec, k=k, only_future=only_future)
+        if min_score is not None:
+            ranked = [(pk, s) for pk, s in ranked if s >= min_score]
+    return load_events(ranked, fields)
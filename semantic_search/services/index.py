@@ -0,0 +1,423 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from events.models import Event
+from .ann import IVF, ann_path
+from . import snapshot as shared_store
+from .codec import decode_vector
+from .ranker import top_k
+
+_INITIAL_CAPACITY = 1024
+_ROW_FIELDS = ("id", "scheduled_date", "embedding_vec", "embedding", "updated_at", "embedding_updated_at")
+# Marca d'aigua inicial d'un índex buit: qualsevol canvi posterior es recull al refresh
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp(dt) -> float:
+    return dt.timestamp() if dt else np.nan
+
+
+class VectorIndex:
+    """
+    Índex vectorial en memoria per a la cerca semàntica.
+
+    Guarda els embeddings normalitzats en una matriu float32 contigua (N, D)
+    juntament amb els ids i les dates programades. Una consulta és un sol
+    producte matriu-vector + argpartition, sense deserialitzar res de la DB.
+
+    Amb un IVF enganxat (SEMANTIC_ANN) i prou events, la cerca només puntua
+    les files de les llistes més properes a la consulta (vegeu ann.py).
+
+    Amb SEMANTIC_EMBEDDING_STORE, la major part de l'índex és una versió del
+    magatzem compartit oberta amb mmap (la "base", vegeu snapshot.py) i aquí
+    només es guarden en RAM els events canviats des de la publicació (el "delta").
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dim = 0
+        self._size = 0
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._dates = np.zeros(0, dtype=np.float64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._ivf = None
+        self._ann_mtime = None
+        self._pos = {}
+        # Base compartida (mmap, només lectura) i les seves files obsoletes
+        self._base = None
+        self._base_dead = np.zeros(0, dtype=bool)
+        self._base_assign = np.zeros(0, dtype=np.int32)
+        self._base_alive = 0
+        self._watermark = None
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._pos) + self._base_alive
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def _reserve(self, n: int):
+        capacity = self._matrix.shape[0]
+        if n <= capacity:
+            return
+        new_capacity = max(_INITIAL_CAPACITY, capacity)
+        while new_capacity < n:
+            new_capacity *= 2
+
+        matrix = np.zeros((new_capacity, self._dim), dtype=np.float32)
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        dates = np.full(new_capacity, np.nan, dtype=np.float64)
+        alive = np.zeros(new_capacity, dtype=bool)
+        assign = np.zeros(new_capacity, dtype=np.int32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        dates[:self._size] = self._dates[:self._size]
+        alive[:self._size] = self._alive[:self._size]
+        assign[:self._size] = self._assign[:self._size]
+        self._matrix, self._ids, self._dates, self._alive = matrix, ids, dates, alive
+        self._assign = assign
+
+    def _compact(self):
+        # Quan més de la meitat de files són esborrades, les eliminem
+        keep = np.flatnonzero(self._alive[:self._size])
+        n = len(keep)
+        self._matrix[:n] = self._matrix[keep]
+        self._ids[:n] = self._ids[keep]
+        self._dates[:n] = self._dates[keep]
+        self._assign[:n] = self._assign[keep]
+        self._alive[:n] = True
+        self._alive[n:] = False
+        self._size = n
+        self._pos = {int(pk): row for row, pk in enumerate(self._ids[:n])}
+
+    def _set_dim(self, dim: int):
+        self._dim = dim
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+
+    def _kill_base(self, pk: int):
+        # La versió de la base queda obsoleta (la nova, si n'hi ha, va al delta)
+        if self._base is None:
+            return
+        rows = self._base.rows_for([pk])
+        if len(rows) and not self._base_dead[rows[0]]:
+            self._base_dead[rows[0]] = True
+            self._base_alive -= 1
+
+    def upsert(self, pk: int, embedding, scheduled_date=None):
+        """
+        Afegeix o actualitza un event. Si l'embedding és buit, invàlid o de
+        dimensió diferent, l'event es treu de l'índex.
+        """
+        vec = np.asarray(embedding if embedding is not None else [], dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec)) if vec.size else 0.0
+        with self._lock:
+            if not self._dim and vec.size:
+                self._set_dim(vec.size)
+            if vec.size != self._dim or not np.isfinite(norm) or norm == 0:
+                self.remove(pk)
+                return
+
+            self._kill_base(pk)
+            row = self._pos.get(pk)
+            if row is None:
+                self._reserve(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._pos[pk] = row
+                self._ids[row] = pk
+                self._alive[row] = True
+            self._matrix[row] = vec / norm
+            self._dates[row] = _timestamp(scheduled_date)
+            if self._ivf is not None:
+                self._assign[row] = self._ivf.assign(self._matrix[row])[0]
+
+    def remove(self, pk: int):
+        with self._lock:
+            self._kill_base(pk)
+            row = self._pos.pop(pk, None)
+            if row is None:
+                return
+            self._alive[row] = False
+            if self._size > _INITIAL_CAPACITY and len(self._pos) < self._size // 2:
+                self._compact()
+
+    def load(self, rows):
+        """
+        Carrega l'índex a partir de tuples
+        (id, scheduled_date, embedding_vec, embedding, updated_at, embedding_updated_at).
+        Els vectors binaris es llegeixen amb np.frombuffer; el JSON antic només és un recurs.
+        La marca d'aigua avança amb la més recent de les dues dates, que són les
+        que filtra refresh().
+        """
+        for pk, scheduled_date, blob, legacy, updated_at, embedding_updated_at in rows:
+            vec = decode_vector(blob) if blob else legacy
+            self.upsert(pk, vec, scheduled_date)
+            for stamp in (updated_at, embedding_updated_at):
+                if stamp and (self._watermark is None or stamp > self._watermark):
+                    self._watermark = stamp
+
+    def attach_base(self, snapshot):
+        """
+        Fa servir una versió del magatzem compartit com a base i buida el delta.
+        Cal un refresh() després per recuperar els canvis posteriors a la publicació.
+        """
+        with self._lock:
+            self._base = snapshot
+            self._base_dead = np.zeros(len(snapshot), dtype=bool)
+            self._base_assign = np.zeros(len(snapshot), dtype=np.int32)
+            self._base_alive = len(snapshot)
+            self._pos = {}
+            self._size = 0
+            self._alive[:] = False
+            if len(snapshot) and snapshot.matrix.shape[1] != self._dim:
+                self._set_dim(snapshot.matrix.shape[1])
+            self._watermark = snapshot.watermark or _EPOCH
+            if self._ivf is not None:
+                # Les assignacions desades al fitxer ANN es tornen a aplicar per id
+                self._ann_mtime = None
+                self._load_ann()
+
+    def _segments(self):
+        """
+        (matriu, ids, dates, vives, assignacions) de la base i del delta.
+        Les matrius de la base són mmap: no es copien.
+        """
+        segments = []
+        if self._base is not None and len(self._base):
+            base = self._base
+            segments.append((base.matrix, base.ids, base.dates, ~self._base_dead, self._base_assign))
+        n = self._size
+        segments.append((self._matrix[:n], self._ids[:n], self._dates[:n], self._alive[:n], self._assign[:n]))
+        return segments
+
+    def _rows_for(self, ids, pks) -> np.ndarray:
+        # Files d'un segment (base o delta) per a uns ids
+        if self._base is not None and ids is self._base.ids:
+            return self._base.rows_for(list(pks))
+        return np.fromiter((row for row in map(self._pos.get, pks) if row is not None), dtype=np.int64)
+
+    def attach_ann(self, ivf, ids=None, assign=None):
+        """
+        Enganxa un IVF a l'índex. Les assignacions desades (ids ordenats +
+        llista) s'aprofiten; la resta de files s'assignen ara.
+        """
+        with self._lock:
+            if ivf is not None and ivf.dim != self._dim:
+                logger.warning("L'índex ANN té dimensió %s i els embeddings %s; s'ignora", ivf.dim, self._dim)
+                ivf = None
+            self._ivf = ivf
+            if ivf is None:
+                return
+            for matrix, seg_ids, _, _, seg_assign in self._segments():
+                todo = np.ones(len(seg_ids), dtype=bool)
+                if ids is not None and len(ids) and len(seg_ids):
+                    at = np.minimum(np.searchsorted(ids, seg_ids), len(ids) - 1)
+                    found = ids[at] == seg_ids
+                    seg_assign[found] = assign[at[found]]
+                    todo = ~found
+                rows = np.flatnonzero(todo)
+                if len(rows):
+                    seg_assign[rows] = ivf.assign(matrix[rows])
+
+    def ann_snapshot(self):
+        """(matriu normalitzada, ids) de les files vives, per entrenar l'IVF."""
+        with self._lock:
+            parts = [(m[np.flatnonzero(a)], i[np.flatnonzero(a)]) for m, i, _, a, _ in self._segments()]
+        return np.concatenate([m for m, _ in parts]), np.concatenate([i for _, i in parts])
+
+    def assignments(self):
+        """(ids, llista) de les files vives amb l'IVF actual."""
+        with self._lock:
+            parts = [(i[a], s[a]) for _, i, _, a, s in self._segments()]
+        return np.concatenate([i for i, _ in parts]), np.concatenate([s for _, s in parts])
+
+    def _ann_rows(self, q, k: int, nprobe, mask, assign):
+        # Files candidates segons l'IVF, o None si cal la cerca exacta
+        if nprobe is None:
+            nprobe = getattr(settings, "SEMANTIC_ANN_NPROBE", 16)
+        min_size = getattr(settings, "SEMANTIC_ANN_MIN_SIZE", 50_000)
+        if self._ivf is None or nprobe <= 0 or len(self) < min_size:
+            return None
+        rows = np.flatnonzero(self._ivf.probe(q, nprobe)[assign] & mask)
+        # Si les llistes provades no tenen prou candidats (p. ex. només futurs), cerca exacta
+        return rows if len(rows) >= k else None
+
+    def search(self, query_vec, k: int = 20, only_future: bool = False, now=None, candidates=None, nprobe=None):
+        """
+        Retorna [(event_id, score), ...] ordenat desc per similitud cosinus.
+        Amb `candidates` (ids) només es puntuen aquests events.
+        `nprobe` és el nombre de llistes IVF a provar (per defecte
+        SEMANTIC_ANN_NPROBE; 0 força la cerca exacta).
+        """
+        if query_vec is None or k <= 0:
+            return []
+        q = np.asarray(query_vec, dtype=np.float32).ravel()
+        if not self._dim or q.size != self._dim:
+            return []
+        threshold = _timestamp(now or timezone.now()) if only_future else None
+
+        if candidates is not None:
+            candidates = list(candidates)
+
+        results = []
+        with self._lock:
+            for matrix, ids, dates, alive, assign in self._segments():
+                if candidates is None:
+                    mask = alive.copy()
+                    if threshold is not None:
+                        mask &= dates >= threshold
+                    rows = self._ann_rows(q, k, nprobe, mask, assign)
+                    if rows is not None:
+                        matrix, ids, mask = matrix[rows], ids[rows], None
+                else:
+                    rows = self._rows_for(ids, candidates)
+                    rows = rows[alive[rows]]
+                    matrix, ids = matrix[rows], ids[rows]
+                    mask = None if threshold is None else dates[rows] >= threshold
+                indices, scores = top_k(q, matrix, k=k, mask=mask, normalized=True)
+                results.extend((int(ids[i]), float(s)) for i, s in zip(indices, scores) if i >= 0)
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def _load_ann(self):
+        """Carrega el fitxer ANN si SEMANTIC_ANN està activat i ha canviat."""
+        if not getattr(settings, "SEMANTIC_ANN", False):
+            return
+        path = ann_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            if self._ann_mtime is None and len(self) >= getattr(settings, "SEMANTIC_ANN_MIN_SIZE", 50_000):
+                logger.warning("SEMANTIC_ANN actiu però no hi ha %s; executa build_ann_index", path)
+            self._ann_mtime = 0
+            return
+        if mtime == self._ann_mtime:
+            return
+        self._ann_mtime = mtime
+        loaded = IVF.load(path)
+        if loaded is not None:
+            self.attach_ann(*loaded)
+
+    def _load_store(self) -> bool:
+        """Canvia a la versió activa del magatzem compartit si és nova. Retorna True si ha canviat."""
+        if not shared_store.enabled():
+            return False
+        manifest = shared_store.read_manifest()
+        if not manifest or (self._base is not None and manifest["version"] == self._base.version):
+            return False
+        snapshot = shared_store.open_snapshot(manifest)
+        if snapshot is None:
+            return False
+        self.attach_base(snapshot)
+        return True
+
+    def build(self):
+        """
+        Construeix l'índex des de zero: des del magatzem compartit si n'hi ha
+        (més els canvis posteriors de la DB) o llegint tots els embeddings de la DB.
+        """
+        with self._lock:
+            if self._load_store():
+                self.refresh(force=True)
+            else:
+                qs = (
+                    Event.objects.filter(Q(embedding_vec__isnull=False) | Q(embedding__isnull=False))
+                    .values_list(*_ROW_FIELDS)
+                )
+                self.load(qs.iterator())
+                if self._watermark is None:
+                    # Sense cap embedding encara: el proper refresh ho ha de llegir tot
+                    self._watermark = _EPOCH
+            self._load_ann()
+            self._checked_at = time.monotonic()
+
+    def refresh(self, force: bool = False):
+        """
+        Aplica de forma incremental els canvis fets per altres processos des
+        de l'última lectura (com a molt un cop cada SEMANTIC_INDEX_REFRESH_SECONDS).
+        Si s'ha publicat una versió nova del magatzem compartit, s'hi canvia.
+        """
+        interval = getattr(settings, "SEMANTIC_INDEX_REFRESH_SECONDS", 30)
+        if not force and time.monotonic() - self._checked_at < interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._load_store()
+            self._load_ann()
+            if self._watermark is None:
+                self._watermark = _EPOCH
+            qs = (
+                Event.objects
+                .filter(Q(updated_at__gt=self._watermark) | Q(embedding_updated_at__gt=self._watermark))
+                .values_list(*_ROW_FIELDS)
+            )
+            self.load(qs.iterator())
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> VectorIndex:
+    """
+    Retorna l'índex del procés, construint-lo el primer cop que es fa servir.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = VectorIndex()
+                index.build()
+                _index = index
+    else:
+        _index.refresh()
+    return _index
+
+
+def peek_index():
+    """Retorna l'índex només si ja s'ha construït (per als signals)."""
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def load_events(ranked, fields=None):
+    """
+    Carrega els events d'un rànquing [(event_id, score), ...] amb una sola
+    consulta i en conserva l'ordre. Retorna [(Event, score), ...].
+    """
+    if not ranked:
+        return []
+    qs = Event.objects.filter(pk__in=[pk for pk, _ in ranked])
+    if fields:
+        qs = qs.only(*fields)
+    by_pk = {e.pk: e for e in qs}
+    # Els events esborrats per altres processos simplement no apareixen
+    return [(by_pk[pk], score) for pk, score in ranked if pk in by_pk]
+
+
+def search_events(query_vec, k: int = 20, only_future: bool = False, fields=None):
+    """
+    Cerca al VectorIndex i carrega només els events guanyadors.
+    Retorna [(Event, score), ...] ordenat desc.
+    """
+    return load_events(get_index().search(query_vec, k=k, only_future=only_future), fields)
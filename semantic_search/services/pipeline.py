@@ -0,0 +1,104 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from events.models import Event
+from .documents import DOCUMENT_FIELDS, document_hash, event_document
+from .embeddings import embed_texts
+from .store import save_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingQueue:
+    """
+    Cua en segon pla que recalcula embeddings d'events modificats.
+
+    Els ids pendents es guarden en un conjunt, de manera que diverses edicions
+    del mateix event abans que el worker el processi només generen un embedding.
+    Un fil dimoni buida la cua per lots sense bloquejar les peticions.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = {}  # dict com a conjunt ordenat (ordre d'arribada)
+        self._busy = False
+        self._thread = None
+
+    def enqueue(self, pk: int):
+        with self._cond:
+            self._pending[pk] = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Espera que la cua quedi buida. Retorna False si s'esgota el temps."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.notify_all()
+                self._cond.wait(min(remaining, 0.1))
+        return True
+
+    def _run(self):
+        delay = getattr(settings, "SEMANTIC_AUTO_EMBED_DELAY", 1.0)
+        batch_size = getattr(settings, "SEMANTIC_AUTO_EMBED_BATCH", 32)
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Finestra curta per agrupar edicions seguides en un sol lot
+            time.sleep(delay)
+            with self._cond:
+                pks = list(self._pending)[:batch_size]
+                for pk in pks:
+                    del self._pending[pk]
+                self._busy = True
+            try:
+                self._process(pks)
+            except Exception:
+                logger.exception("Error generant embeddings per als events %s", pks)
+            finally:
+                connection.close()
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _process(self, pks: list[int]):
+        events = list(Event.objects.filter(pk__in=pks).only("id", "scheduled_date", "embedding_hash", *DOCUMENT_FIELDS))
+        todo, texts = [], []
+        for e in events:
+            text = event_document(e)
+            # Pot ser que un altre procés ja l'hagi actualitzat
+            if text and document_hash(text) != e.embedding_hash:
+                todo.append(e)
+                texts.append(text)
+        if todo:
+            save_embeddings(todo, embed_texts(texts))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> EmbeddingQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = EmbeddingQueue()
+                atexit.register(_queue.flush, 5.0)
+    return _queue
@@ -1,5 +1,71 @@
 import numpy as np
 
+def normalize_rows(matrix):
+    """
+    Normalitza cada fila d'una matriu (N, D) a norma 1.
+    Retorna (matriu float32 normalitzada, màscara de files vàlides).
+    Les files amb norma zero o valors no finits queden a zero i marcades com a invàlides.
+    """
+    m = np.asarray(matrix, dtype=np.float32)
+    if m.ndim == 1:
+        m = m.reshape(1, -1)
+    norms = np.linalg.norm(m, axis=1)
+    valid = np.isfinite(norms) & (norms > 0)
+    out = np.zeros_like(m)
+    np.divide(m, norms[:, None], out=out, where=valid[:, None])
+    return out, valid
+
+
+def top_k(queries, matrix, k: int = 20, mask=None, normalized: bool = False):
+    """
+    Rànquing vectoritzat per similitud cosinus.
+
+    queries: vector (D,) o matriu (Q, D) de consultes.
+    matrix: matriu (N, D) float32 de candidats.
+    mask: booleà (N,) opcional; les files a False no es retornen mai.
+    normalized: si és True, les files de `matrix` ja estan normalitzades.
+
+    Retorna (indices, scores) ordenats desc, de forma (k',) o (Q, k') amb
+    k' = min(k, files vàlides). Les consultes de norma zero tenen índex -1.
+    """
+    q = np.asarray(queries, dtype=np.float32)
+    single = q.ndim == 1
+    q, q_valid = normalize_rows(q)
+
+    m = np.asarray(matrix, dtype=np.float32)
+    if m.ndim != 2 or m.shape[1] != q.shape[1]:
+        raise ValueError("La dimensió de les consultes i de la matriu no coincideix")
+
+    if normalized:
+        valid = np.ones(m.shape[0], dtype=bool)
+    else:
+        m, valid = normalize_rows(m)
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+
+    k = min(k, int(valid.sum()))
+    if k <= 0:
+        empty_i = np.zeros((q.shape[0], 0), dtype=np.int64)
+        empty_s = np.zeros((q.shape[0], 0), dtype=np.float32)
+        return (empty_i[0], empty_s[0]) if single else (empty_i, empty_s)
+
+    scores = q @ m.T
+    scores[:, ~valid] = -np.inf
+
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    indices = np.take_along_axis(part, order, axis=1)
+    top_scores = np.take_along_axis(part_scores, order, axis=1)
+
+    indices[~q_valid] = -1
+    top_scores[~q_valid] = -np.inf
+
+    if single:
+        return indices[0], top_scores[0]
+    return indices, top_scores
+
+
 def cosine_top_k(query_vec: list[float], items: list[tuple[object, list[float]]], k: int = 20):
     """
     items: [(event_obj, embedding_list), ...]
@@ -12,15 +78,12 @@ def cosine_top_k(query_vec: list[float], items: list[tuple[object, list[float]]]
     if np.linalg.norm(q) == 0:
         return []
 
-    scored = []
-    for obj, emb in items:
-        if not emb:
-            continue
-        v = np.array(emb, dtype=np.float32)
-        if v.shape != q.shape or np.linalg.norm(v) == 0:
-            continue
-        score = float(np.dot(q, v))  # ja normalitzats => cosine
-        scored.append((obj, score))
-
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return scored[:k]
+    # Descartem embeddings buits o de mida diferent abans de construir la matriu
+    dim = q.shape[0]
+    valid_items = [(obj, emb) for obj, emb in items if emb and len(emb) == dim]
+    if not valid_items:
+        return []
+
+    matrix = np.array([emb for _, emb in valid_items], dtype=np.float32)
+    indices, scores = top_k(q, matrix, k=k)
+    return [(valid_items[i][0], float(s)) for i, s in zip(indices, scores)]
@@ -0,0 +1,191 @@
+"""
+Magatzem d'embeddings compartit entre processos (SEMANTIC_EMBEDDING_STORE).
+
+Una versió publicada són tres fitxers .npy al directori SEMANTIC_STORE_DIR:
+  vectors-<v>.npy  matriu float32 (N, D) normalitzada
+  ids-<v>.npy      ids dels events, ordenats
+  dates-<v>.npy    scheduled_date en epoch (nan si no en té)
+i un manifest `current.json` que apunta a la versió activa. El manifest
+s'escriu l'últim i amb os.replace, de manera que el canvi de versió és atòmic.
+
+Els workers obren els fitxers amb mmap en mode lectura: les pàgines les
+comparteix el sistema operatiu i la memòria privada de cada procés no creix
+amb el catàleg.
+"""
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from events.models import Event
+from .codec import decode_vector
+
+MANIFEST = "current.json"
+# Versions antigues que es conserven (un worker encara pot tenir mapejada l'anterior)
+KEEP_VERSIONS = 2
+
+
+def enabled() -> bool:
+    return getattr(settings, "SEMANTIC_EMBEDDING_STORE", False)
+
+
+def store_dir() -> str:
+    return str(getattr(settings, "SEMANTIC_STORE_DIR", None) or os.path.join(settings.BASE_DIR, ".embedding_store"))
+
+
+class Snapshot:
+    """Una versió del magatzem oberta amb mmap (només lectura)."""
+
+    def __init__(self, version: str, matrix, ids, dates, watermark):
+        self.version = version
+        self.matrix = matrix
+        self.ids = ids
+        self.dates = dates
+        self.watermark = watermark
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, pks) -> np.ndarray:
+        """Files (ordenades per id) dels `pks` que hi són."""
+        pks = np.asarray(pks, dtype=np.int64)
+        if not len(self.ids) or not len(pks):
+            return np.zeros(0, dtype=np.int64)
+        at = np.minimum(np.searchsorted(self.ids, pks), len(self.ids) - 1)
+        return at[self.ids[at] == pks]
+
+
+def read_manifest():
+    try:
+        with open(os.path.join(store_dir(), MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_snapshot(manifest=None):
+    """Obre la versió del manifest (per defecte l'activa). None si no n'hi ha cap."""
+    manifest = manifest or read_manifest()
+    if not manifest:
+        return None
+    base = store_dir()
+    version = manifest["version"]
+    try:
+        matrix = np.load(os.path.join(base, f"vectors-{version}.npy"), mmap_mode="r")
+        ids = np.load(os.path.join(base, f"ids-{version}.npy"), mmap_mode="r")
+        dates = np.load(os.path.join(base, f"dates-{version}.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    n = manifest["size"]
+    watermark = parse_datetime(manifest["watermark"]) if manifest.get("watermark") else None
+    return Snapshot(version, matrix[:n], ids[:n], dates[:n], watermark)
+
+
+def _write_manifest(base: str, manifest: dict):
+    fd, tmp = tempfile.mkstemp(dir=base, suffix=".json.tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(base, MANIFEST))
+
+
+def _cleanup(base: str, current: str):
+    versions = sorted({
+        name.split("-", 1)[1].rsplit(".", 1)[0]
+        for name in os.listdir(base) if name.startswith("vectors-") and name.endswith(".npy")
+    })
+    for version in versions[:-KEEP_VERSIONS]:
+        if version == current:
+            continue
+        for prefix in ("vectors", "ids", "dates"):
+            try:
+                os.unlink(os.path.join(base, f"{prefix}-{version}.npy"))
+            except OSError:
+                pass
+
+
+def _next_version() -> str:
+    version = time.strftime("%Y%m%d%H%M%S") + f"{int(time.time() * 1000) % 1000:03d}"
+    current = read_manifest()
+    if current and version <= current["version"]:
+        # Dues publicacions dins del mateix mil·lisegon: la versió ha de créixer igualment
+        version = str(int(current["version"]) + 1)
+    return version
+
+
+def publish(chunk_size: int = 2048) -> dict:
+    """
+    Escriu una nova versió amb tots els embeddings de la DB i l'activa.
+    Retorna el manifest publicat.
+
+    Els ids es llegeixen primer i només s'escriuen aquests: un embedding
+    desat mentre es publica no hi cap (els fitxers tenen la mida del
+    recompte) i el recollirà refresh(), perquè la marca d'aigua no passa de
+    l'inici de la publicació.
+    """
+    base = store_dir()
+    os.makedirs(base, exist_ok=True)
+    version = _next_version()
+
+    qs = (
+        Event.objects.filter(Q(embedding_vec__isnull=False) | Q(embedding__isnull=False))
+        .order_by("pk")
+    )
+    started = timezone.now()
+    expected = set(qs.values_list("id", flat=True))
+    total = len(expected)
+    rows = qs.values_list("id", "scheduled_date", "embedding_vec", "embedding", "updated_at", "embedding_updated_at")
+    paths = {prefix: os.path.join(base, f"{prefix}-{version}.npy") for prefix in ("vectors", "ids", "dates")}
+    vectors = ids = dates = None
+    n, dim, watermark = 0, 0, None
+    try:
+        for pk, scheduled_date, blob, legacy, updated_at, embedding_updated_at in rows.iterator(chunk_size=chunk_size):
+            if pk not in expected:
+                continue
+            vec = decode_vector(blob) if blob else np.asarray(legacy or [], dtype=np.float32)
+            for stamp in (updated_at, embedding_updated_at):
+                if stamp and (watermark is None or stamp > watermark):
+                    watermark = min(stamp, started)
+            if vectors is None and vec.size:
+                dim = vec.size
+                # Els fitxers es creen amb la mida màxima; el manifest diu quantes files són vàlides
+                vectors = np.lib.format.open_memmap(paths["vectors"], mode="w+", dtype=np.float32, shape=(total, dim))
+                ids = np.lib.format.open_memmap(paths["ids"], mode="w+", dtype=np.int64, shape=(total,))
+                dates = np.lib.format.open_memmap(paths["dates"], mode="w+", dtype=np.float64, shape=(total,))
+            norm = float(np.linalg.norm(vec)) if vec.size else 0.0
+            if vec.size != dim or not np.isfinite(norm) or norm == 0:
+                continue
+            vectors[n] = vec / norm
+            ids[n] = pk
+            dates[n] = scheduled_date.timestamp() if scheduled_date else np.nan
+            n += 1
+        if vectors is None:
+            for prefix, dtype, shape in (("vectors", np.float32, (0, 0)), ("ids", np.int64, (0,)), ("dates", np.float64, (0,))):
+                np.save(paths[prefix], np.zeros(shape, dtype=dtype))
+        else:
+            for array in (vectors, ids, dates):
+                array.flush()
+    except BaseException:
+        # Cap fitxer a mitges: es tanquen els mmap i s'esborren
+        vectors = ids = dates = None
+        for path in paths.values():
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+    finally:
+        vectors = ids = dates = None
+
+    manifest = {
+        "version": version,
+        "size": n,
+        "dim": dim,
+        "watermark": watermark.isoformat() if watermark else None,
+    }
+    _write_manifest(base, manifest)
+    _cleanup(base, version)
+    return manifest
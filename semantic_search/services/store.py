@@ -0,0 +1,67 @@
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from events.models import Event
+from .codec import encode_vector
+from .documents import document_hash, event_document
+from .index import peek_index
+
+EMBEDDING_FIELDS = ["embedding_vec", "embedding", "embedding_model", "embedding_updated_at", "embedding_hash"]
+
+
+def _bulk_write_mongo(updates: list[tuple[int, dict]]):
+    # Amb djongo, bulk_update genera un CASE ... WHEN que no sap traduir.
+    # Escrivim directament amb pymongo, preparant els valors com ho faria l'ORM.
+    from pymongo import UpdateOne
+
+    connection.ensure_connection()
+    collection = connection.connection[Event._meta.db_table]
+    fields = {name: Event._meta.get_field(name) for name in EMBEDDING_FIELDS}
+    ops = [
+        UpdateOne(
+            {"id": pk},
+            {"$set": {name: fields[name].get_db_prep_save(value, connection) for name, value in values.items()}},
+        )
+        for pk, values in updates
+    ]
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def save_embeddings(events: list[Event], vectors):
+    """
+    Desa d'un sol cop els embeddings de `events` (vectors[i] correspon a events[i])
+    i actualitza el VectorIndex del procés si ja existeix.
+    Els events han de tenir carregats els camps de text (per calcular el hash).
+    """
+    # Import tardà: els signals importen aquest mòdul i no han de carregar el model
+    from .embeddings import model_name
+
+    now = timezone.now()
+    name = model_name()
+    dtype = getattr(settings, "SEMANTIC_EMBEDDING_DTYPE", "float32")
+    vectors = [np.asarray(vec, dtype=np.float32) for vec in vectors]
+    # El JSON antic es buida: només es desa el format binari compacte
+    updates = [
+        (e.pk, {
+            "embedding_vec": encode_vector(vec, dtype),
+            "embedding": None,
+            "embedding_model": name,
+            "embedding_updated_at": now,
+            "embedding_hash": document_hash(event_document(e)),
+        })
+        for e, vec in zip(events, vectors)
+    ]
+
+    if connection.vendor == "djongo":
+        _bulk_write_mongo(updates)
+    else:
+        objs = [Event(pk=pk, **values) for pk, values in updates]
+        Event.objects.bulk_update(objs, EMBEDDING_FIELDS)
+
+    index = peek_index()
+    if index is not None:
+        for e, vec in zip(events, vectors):
+            index.upsert(e.pk, vec, e.scheduled_date)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from events.models import Event
+from .services.codec import decode_vector
+from .services.documents import DOCUMENT_FIELDS, document_hash, event_document
+from .services.index import peek_index
+from .services.store import EMBEDDING_FIELDS
+
+
+@receiver(post_save, sender=Event)
+def sync_index_on_save(sender, instance, **kwargs):
+    """
+    Manté el VectorIndex del procés al dia quan es desa un event.
+    """
+    index = peek_index()
+    if index is None or instance.get_deferred_fields() & {"embedding_vec", "embedding", "scheduled_date"}:
+        return
+    vec = decode_vector(instance.embedding_vec) if instance.embedding_vec else instance.embedding
+    index.upsert(instance.pk, vec, instance.scheduled_date)
+
+
+@receiver(post_save, sender=Event)
+def enqueue_embedding_refresh(sender, instance, update_fields=None, raw=False, **kwargs):
+    """
+    Si el text de l'event ha canviat (segons el hash), encua el càlcul de
+    l'embedding en segon pla. La petició no espera el model.
+    """
+    if raw or not getattr(settings, "SEMANTIC_AUTO_EMBED", True):
+        return
+    if update_fields and set(update_fields) <= set(EMBEDDING_FIELDS):
+        return
+    if instance.get_deferred_fields() & {"embedding_hash", *DOCUMENT_FIELDS}:
+        return
+
+    text = event_document(instance)
+    if text and document_hash(text) != instance.embedding_hash:
+        # Import tardà: la cua carrega el model d'embeddings
+        from .services.pipeline import get_queue
+
+        pk = instance.pk
+        transaction.on_commit(lambda: get_queue().enqueue(pk))
+
+
+@receiver(post_delete, sender=Event)
+def sync_index_on_delete(sender, instance, **kwargs):
+    index = peek_index()
+    if index is not None:
+        index.remove(instance.pk)
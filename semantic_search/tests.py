@@ -0,0 +1,553 @@
+import importlib.util
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from .services import embeddings, hybrid, pipeline
+from .services.backends import load_backend
+from .services.codec import decode_vector, encode_vector
+from .services.embed_server import EmbedClient
+from .services.embeddings import model_name
+from .services.ann import IVF
+from .services.index import VectorIndex
+from .services.ranker import top_k
+
+
+def _installed(*modules):
+    return all(importlib.util.find_spec(m) is not None for m in modules)
+
+
+SENTENCES = [
+    "Concert de jazz en directe aquest dissabte",
+    "Torneig de Fortnite amb premis per als guanyadors",
+    "Taller d'introducció a la programació amb Python",
+    "Charla sobre inteligencia artificial y ética",
+    "Partit de bàsquet de la lliga local",
+    "Exposició de pintura i dibuix contemporani",
+]
+
+
+@skipUnless(_installed("torch", "sentence_transformers"), "Cal torch i sentence_transformers")
+class EmbeddingBackendParityTests(SimpleTestCase):
+    """
+    Els backends optimitzats han de donar vectors pràcticament iguals als de
+    torch (similitud cosinus per frase).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reference = load_backend(model_name(), "torch").encode(SENTENCES)
+
+    def assertParity(self, backend: str, min_cosine: float):
+        vecs = load_backend(model_name(), backend).encode(SENTENCES)
+        self.assertEqual(vecs.shape, self.reference.shape)
+        cosines = np.sum(vecs * self.reference, axis=1)
+        self.assertGreaterEqual(float(cosines.min()), min_cosine, f"{backend}: {cosines}")
+
+    @skipUnless(_installed("onnxruntime", "transformers"), "Cal onnxruntime")
+    def test_onnx(self):
+        self.assertParity("onnx", 0.999)
+
+    @skipUnless(_installed("onnxruntime", "transformers"), "Cal onnxruntime")
+    def test_onnx_int8(self):
+        self.assertParity("onnx-int8", 0.97)
+
+    def test_torch_int8(self):
+        self.assertParity("torch-int8", 0.97)
+
+
+def _create_event(title="Concert", **kwargs):
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from events.models import Event
+
+    user = get_user_model().objects.get_or_create(username="creador")[0]
+    return Event.objects.create(
+        title=title, description="", creator=user, category="music", thumbnail=None,
+        scheduled_date=timezone.now() + timedelta(days=1), **kwargs
+    )
+
+
+def _store_embedding(event, vec, at):
+    # update() no toca updated_at: com un backfill fet per un altre procés
+    from events.models import Event
+
+    Event.objects.filter(pk=event.pk).update(embedding_vec=encode_vector(vec), embedding_updated_at=at)
+
+
+class VectorCodecTests(SimpleTestCase):
+
+    def setUp(self):
+        self.vec = np.random.default_rng(0).standard_normal(384).astype(np.float32)
+
+    def test_float32_round_trip(self):
+        blob = encode_vector(self.vec)
+        self.assertEqual(len(blob), 8 + 384 * 4)
+        decoded = decode_vector(blob)
+        self.assertEqual(decoded.dtype, np.float32)
+        np.testing.assert_array_equal(decoded, self.vec)
+
+    def test_float16_round_trip(self):
+        decoded = decode_vector(encode_vector(self.vec, "float16"))
+        np.testing.assert_allclose(decoded, self.vec, rtol=1e-3, atol=1e-3)
+
+    def test_int8_round_trip(self):
+        blob = encode_vector(self.vec, "int8")
+        self.assertEqual(len(blob), 8 + 384)
+        decoded = decode_vector(blob)
+        cosine = np.dot(decoded, self.vec) / (np.linalg.norm(decoded) * np.linalg.norm(self.vec))
+        self.assertGreater(cosine, 0.999)
+        # Un vector nul no pot dividir per una escala zero
+        np.testing.assert_array_equal(decode_vector(encode_vector(np.zeros(4), "int8")), np.zeros(4))
+
+    def test_decodes_from_memoryview(self):
+        # Els BinaryField arriben com a memoryview amb alguns backends
+        np.testing.assert_array_equal(decode_vector(memoryview(encode_vector(self.vec))), self.vec)
+
+    def test_empty_and_unknown(self):
+        self.assertIsNone(decode_vector(None))
+        self.assertIsNone(decode_vector(b""))
+        with self.assertRaises(ValueError):
+            decode_vector(b"XX" + encode_vector(self.vec)[2:])
+        with self.assertRaises(ValueError):
+            encode_vector(self.vec, "float64")
+
+
+class VectorIndexLoadTests(SimpleTestCase):
+    """load() llegeix el format binari i, si no n'hi ha, el JSON antic."""
+
+    def test_binary_and_legacy_rows(self):
+        from django.utils import timezone
+
+        now = timezone.now()
+        index = VectorIndex()
+        index.load([
+            (1, None, encode_vector([1.0, 0.0, 0.0]), None, now, None),
+            (2, None, None, [0.0, 2.0, 0.0], now, None),  # només JSON antic
+            (3, None, b"", [0.0, 0.0, 3.0], now, None),
+            (4, None, None, None, now, None),  # sense embedding
+        ])
+        self.assertEqual(len(index), 3)
+        for pk, query in ((1, [1.0, 0.0, 0.0]), (2, [0.0, 1.0, 0.0]), (3, [0.0, 0.0, 1.0])):
+            self.assertEqual(index.search(query, k=1)[0][0], pk)
+
+    def test_binary_takes_precedence_over_legacy(self):
+        index = VectorIndex()
+        index.load([(1, None, encode_vector([1.0, 0.0]), [0.0, 1.0], None, None)])
+        self.assertAlmostEqual(index.search([1.0, 0.0], k=1)[0][1], 1.0, places=5)
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False, SEMANTIC_EMBEDDING_STORE=False, SEMANTIC_ANN=False)
+class VectorIndexRefreshTests(TestCase):
+
+    def spy_loads(self, index):
+        loaded = []
+        load = index.load
+
+        def spy(rows):
+            rows = list(rows)
+            loaded.append(sorted(row[0] for row in rows))
+            load(rows)
+
+        index.load = spy
+        return loaded
+
+    def test_refresh_only_reads_new_changes(self):
+        from django.utils import timezone
+
+        first, second = _create_event("u"), _create_event("dos")
+        _store_embedding(first, [1.0, 0.0, 0.0], timezone.now() + timedelta(minutes=5))
+        index = VectorIndex()
+        index.build()
+        self.assertEqual(len(index), 1)
+
+        loaded = self.spy_loads(index)
+        index.refresh(force=True)
+        index.refresh(force=True)
+        self.assertEqual(loaded, [[], []])
+
+        _store_embedding(second, [0.0, 1.0, 0.0], timezone.now() + timedelta(minutes=10))
+        index.refresh(force=True)
+        index.refresh(force=True)
+        self.assertEqual(loaded[2:], [[second.pk], []])
+        self.assertEqual([pk for pk, _ in index.search([0.0, 1.0, 0.0], k=1)], [second.pk])
+
+    def test_refresh_from_empty_index(self):
+        from django.utils import timezone
+
+        index = VectorIndex()
+        index.build()
+        self.assertEqual(len(index), 0)
+
+        event = _create_event()
+        _store_embedding(event, [1.0, 0.0, 0.0], timezone.now())
+        index.refresh(force=True)
+        self.assertEqual(len(index), 1)
+
+
+class _BrokenEmbedHandler(BaseHTTPRequestHandler):
+    """Servidor d'embeddings que respon amb una dimensió que no quadra amb les dades."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = np.zeros(5, dtype="<f4").tobytes()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Embedding-Dim", "3")
+        self.send_header("X-Embedding-Model", model_name())
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RemoteEmbedFallbackTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _BrokenEmbedHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        embeddings._server_down_until = 0.0
+
+    def test_bad_response_is_an_oserror(self):
+        with self.assertRaises(OSError):
+            EmbedClient(self.url).embed(["hola"])
+
+    def test_remote_embed_falls_back(self):
+        with override_settings(SEMANTIC_EMBED_SERVER_URL=self.url):
+            self.assertIsNone(embeddings._remote_embed(["hola"]))
+        embeddings._server_down_until = 0.0
+
+    def test_dead_server_falls_back(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with override_settings(SEMANTIC_EMBED_SERVER_URL=self.url, SEMANTIC_EMBED_SERVER_TIMEOUT=1.0):
+            self.assertIsNone(embeddings._remote_embed(["hola"]))
+        embeddings._server_down_until = 0.0
+
+
+class HybridRankTests(SimpleTestCase):
+    """Fusió RRF i prefiltre lèxic sobre índexs construïts a mà."""
+
+    def rank(self, events, query, query_vec, **kwargs):
+        from events.services.search import TextIndex
+        from django.utils import timezone
+
+        text, vector = TextIndex(), VectorIndex()
+        for pk, title, vec, days in events:
+            text.upsert(pk, title, "", "", "other")
+            vector.upsert(pk, vec, timezone.now() + timedelta(days=days))
+        with mock.patch.object(hybrid.text_search, "get_index", return_value=text), \
+                mock.patch.object(hybrid, "get_index", return_value=vector):
+            return hybrid.hybrid_rank(query, query_vec, **kwargs)
+
+    def test_rrf(self):
+        fused = hybrid.rrf([[1, 2, 3], [3, 2]], k=60)
+        self.assertEqual(sorted(fused, key=fused.get, reverse=True), [3, 2, 1])
+        self.assertAlmostEqual(fused[2], 2 / 62)
+
+    def test_lexical_match_moves_up(self):
+        events = [
+            (1, "Concert de rock", [1.0, 0.0, 0.0], 1),
+            (2, "Festival de jazz", [0.9, 0.1, 0.0], 1),
+            (3, "Taller de ceràmica", [0.8, 0.2, 0.0], 1),
+        ]
+        # Sense coincidència lèxica decideix el vector; "jazz" puja l'event 2
+        self.assertEqual([pk for pk, _ in self.rank(events, "música", [1.0, 0.0, 0.0], k=3)], [1, 2, 3])
+        self.assertEqual([pk for pk, _ in self.rank(events, "jazz", [1.0, 0.0, 0.0], k=3)][0], 2)
+
+    def test_strict_prefilter_limits_candidates(self):
+        events = [(pk, f"Concert de jazz {pk}", [1.0, pk / 10, 0.0], 1) for pk in range(1, 4)]
+        events.append((9, "Taller", [1.0, 0.0, 0.0], 1))
+        # L'event 9 és el més proper, però no conté "jazz"
+        ranked = self.rank(events, "jazz", [1.0, 0.0, 0.0], k=3)
+        self.assertEqual(sorted(pk for pk, _ in ranked), [1, 2, 3])
+
+    def test_past_only_strict_matches_fall_back_to_vector_search(self):
+        events = [
+            (1, "Concert de jazz", [1.0, 0.0, 0.0], -1),  # ja ha passat
+            (2, "Festival de música", [0.99, 0.1, 0.0], 1),
+        ]
+        ranked = self.rank(events, "jazz", [1.0, 0.0, 0.0], k=5, only_future=True)
+        self.assertEqual([pk for pk, _ in ranked], [2])
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=False, SEMANTIC_ANN=False, SEMANTIC_EMBEDDING_STORE=True)
+class EmbeddingStoreTests(TestCase):
+    """publish() -> attach_base() -> search() i canvi de versió."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(SEMANTIC_STORE_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.dir = directory.name
+
+    def test_publish_attach_and_republish(self):
+        from django.utils import timezone
+        from .services import snapshot
+
+        first, second = _create_event("u"), _create_event("dos")
+        _store_embedding(first, [1.0, 0.0, 0.0], timezone.now())
+        manifest = snapshot.publish()
+        self.assertEqual((manifest["size"], manifest["dim"]), (1, 3))
+
+        index = VectorIndex()
+        index.build()
+        self.assertEqual(index.search([1.0, 0.0, 0.0], k=5)[0][0], first.pk)
+
+        _store_embedding(second, [0.0, 1.0, 0.0], timezone.now())
+        republished = snapshot.publish()
+        self.assertGreater(republished["version"], manifest["version"])
+        self.assertEqual(snapshot.read_manifest()["version"], republished["version"])
+
+        index.refresh(force=True)
+        self.assertEqual(index._base.version, republished["version"])
+        self.assertEqual(len(index._base), 2)
+        self.assertEqual(index.search([0.0, 1.0, 0.0], k=1)[0][0], second.pk)
+
+    def test_embedding_saved_while_publishing(self):
+        from django.utils import timezone
+        from .services import snapshot
+
+        from django.db import connection
+
+        first, late = _create_event("u"), _create_event("tard")
+        _store_embedding(first, [1.0, 0.0, 0.0], timezone.now())
+        queries = []
+
+        def write_before_second_query(execute, sql, params, many, context):
+            # Un altre procés desa un embedding entre el recompte i la lectura
+            queries.append(sql)
+            if len(queries) == 2:
+                _store_embedding(late, [0.0, 1.0, 0.0], timezone.now())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(write_before_second_query):
+            manifest = snapshot.publish()
+        self.assertEqual(manifest["size"], 1)
+
+        # El refresh posterior el recupera
+        index = VectorIndex()
+        index.build()
+        self.assertEqual(index.search([0.0, 1.0, 0.0], k=1)[0][0], late.pk)
+
+    def test_failed_publish_leaves_no_files(self):
+        from django.utils import timezone
+        from .services import snapshot
+
+        for title in ("u", "dos"):
+            _store_embedding(_create_event(title), [1.0, 0.0, 0.0], timezone.now())
+        decode, calls = snapshot.decode_vector, []
+
+        def decode_then_fail(blob):
+            # Falla a la segona fila, amb els fitxers ja creats
+            calls.append(blob)
+            if len(calls) > 1:
+                raise RuntimeError("disc ple")
+            return decode(blob)
+
+        with mock.patch.object(snapshot, "decode_vector", side_effect=decode_then_fail):
+            with self.assertRaises(RuntimeError):
+                snapshot.publish()
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+@override_settings(SEMANTIC_EMBED_SERVER_URL=None, SEMANTIC_EMBED_CACHE_ALIAS=None)
+class QueryEmbeddingCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        embeddings.clear_embed_cache()
+        self.addCleanup(embeddings.clear_embed_cache)
+        model = mock.Mock()
+        model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 3), dtype=np.float32)
+        patcher = mock.patch.object(embeddings, "get_model", return_value=model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.model = model
+
+    def test_repeated_query_is_a_hit(self):
+        first = embeddings.embed_text("concerts de jazz")
+        second = embeddings.embed_text("  concerts   de jazz ")
+        self.assertEqual(first, second)
+        self.assertEqual(self.model.encode.call_count, 1)
+        stats = embeddings.embed_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    @override_settings(SEMANTIC_EMBED_CACHE_SIZE=2)
+    def test_size_bound(self):
+        for text in ("u", "dos", "tres"):
+            embeddings.embed_text(text)
+        self.assertEqual(embeddings.embed_cache_stats()["size"], 2)
+        # "u" era la més antiga: s'ha de tornar a calcular
+        embeddings.embed_text("u")
+        self.assertEqual(self.model.encode.call_count, 4)
+        embeddings.embed_text("tres")
+        self.assertEqual(self.model.encode.call_count, 4)
+
+
+class TopKTests(SimpleTestCase):
+
+    MATRIX = np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0], [-1.0, 0.0]], dtype=np.float32)
+
+    def test_order_and_k_larger_than_n(self):
+        indices, scores = top_k([1.0, 0.0], self.MATRIX, k=10)
+        self.assertEqual(indices.tolist(), [0, 1, 2, 3])
+        np.testing.assert_allclose(scores, [1.0, 0.8, 0.0, -1.0], atol=1e-6)
+
+    def test_mask(self):
+        indices, _ = top_k([1.0, 0.0], self.MATRIX, k=2, mask=[False, True, True, True])
+        self.assertEqual(indices.tolist(), [1, 2])
+        indices, scores = top_k([1.0, 0.0], self.MATRIX, k=2, mask=[False] * 4)
+        self.assertEqual((indices.shape, scores.shape), ((0,), (0,)))
+
+    def test_zero_norm_query(self):
+        indices, _ = top_k([[0.0, 0.0], [0.0, 1.0]], self.MATRIX, k=1)
+        self.assertEqual(indices.tolist(), [[-1], [2]])
+
+
+class VectorIndexSearchTests(SimpleTestCase):
+
+    def setUp(self):
+        from django.utils import timezone
+
+        now = timezone.now()
+        self.index = VectorIndex()
+        self.index.upsert(1, [1.0, 0.0], now - timedelta(days=1))
+        self.index.upsert(2, [0.8, 0.6], now + timedelta(days=1))
+        self.index.upsert(3, [0.0, 1.0], now + timedelta(days=2))
+        self.index.upsert(4, [0.0, 0.0], now)  # norma zero: no entra
+
+    def ids(self, query, **kwargs):
+        return [pk for pk, _ in self.index.search(query, **kwargs)]
+
+    def test_k_larger_than_n(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.ids([1.0, 0.0], k=50), [1, 2, 3])
+
+    def test_zero_and_wrong_queries(self):
+        self.assertEqual(self.ids([0.0, 0.0]), [])
+        self.assertEqual(self.ids([1.0, 0.0, 0.0]), [])
+        self.assertEqual(self.ids([1.0, 0.0], k=0), [])
+
+    def test_only_future(self):
+        self.assertEqual(self.ids([1.0, 0.0], only_future=True), [2, 3])
+
+    def test_candidates(self):
+        self.assertEqual(self.ids([1.0, 0.0], candidates=[3, 1, 99]), [1, 3])
+        self.assertEqual(self.ids([1.0, 0.0], candidates=[1, 3], only_future=True), [3])
+        self.index.remove(1)
+        self.assertEqual(self.ids([1.0, 0.0], candidates=[1, 3]), [3])
+        self.assertEqual(self.ids([1.0, 0.0], candidates=[]), [])
+
+
+class AnnSearchTests(SimpleTestCase):
+
+    def build(self, n, dim=32, clusters=40, seed=7):
+        # Vectors agrupats (com els embeddings reals), amb llavor fixa
+        rng = np.random.default_rng(seed)
+        centers = rng.normal(size=(clusters, dim))
+        vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+        index = VectorIndex()
+        for pk, vec in enumerate(vectors, start=1):
+            index.upsert(pk, vec)
+        return index, rng
+
+    def exact(self, index, query, k):
+        return [pk for pk, _ in index.search(query, k=k, nprobe=0)]
+
+    def ann(self, index, query, k, nprobe):
+        return [pk for pk, _ in index.search(query, k=k, nprobe=nprobe)]
+
+    @override_settings(SEMANTIC_ANN_MIN_SIZE=0)
+    def test_recall_against_exact_search(self):
+        index, rng = self.build(2000)
+        matrix, ids = index.ann_snapshot()
+        index.attach_ann(IVF.train(matrix, nlist=32, seed=0))
+
+        k, hits, queries = 10, 0, rng.normal(size=(50, 32))
+        for query in queries:
+            hits += len(set(self.ann(index, query, k, nprobe=8)) & set(self.exact(index, query, k)))
+        self.assertGreaterEqual(hits / (k * len(queries)), 0.85)
+        # Provant totes les llistes la cerca és exacta
+        self.assertEqual(self.ann(index, queries[0], k, nprobe=32), self.exact(index, queries[0], k))
+
+    def test_small_index_falls_back_to_exact_search(self):
+        index, rng = self.build(20)
+        matrix, _ = index.ann_snapshot()
+        ivf = IVF.train(matrix, nlist=64, seed=0)
+        self.assertEqual(ivf.nlist, 20)
+        index.attach_ann(ivf)
+        query = rng.normal(size=32)
+        # Per sota de SEMANTIC_ANN_MIN_SIZE no es fa servir l'IVF
+        self.assertEqual(self.ann(index, query, 10, nprobe=1), self.exact(index, query, 10))
+        # Si les llistes provades tenen menys de k files, també cerca exacta
+        with override_settings(SEMANTIC_ANN_MIN_SIZE=0):
+            self.assertEqual(self.ann(index, query, 10, nprobe=1), self.exact(index, query, 10))
+
+
+@override_settings(SEMANTIC_AUTO_EMBED=True, SEMANTIC_AUTO_EMBED_DELAY=0)
+class EmbeddingPipelineTests(TransactionTestCase):
+    """Desar un event encua l'embedding; el worker el calcula amb embed_texts simulat."""
+
+    def setUp(self):
+        self.queue = pipeline.EmbeddingQueue()
+        patcher = mock.patch.object(pipeline, "_queue", self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def embed(self, **kwargs):
+        return mock.patch.object(pipeline, "embed_texts", **kwargs)
+
+    def test_save_enqueues_refresh(self):
+        from events.models import Event
+
+        with self.embed(side_effect=lambda texts: [np.ones(4, dtype=np.float32)] * len(texts)) as embed:
+            event = _create_event("Concert de jazz")
+            self.assertTrue(self.queue.flush(5))
+        embed.assert_called_once()
+        event = Event.objects.get(pk=event.pk)
+        self.assertTrue(event.embedding_hash)
+        self.assertEqual(decode_vector(event.embedding_vec).tolist(), [1.0] * 4)
+
+        # Desar sense canvis al text no torna a calcular res
+        with mock.patch.object(self.queue, "enqueue") as enqueue:
+            event.save()
+        enqueue.assert_not_called()
+
+    @override_settings(SEMANTIC_AUTO_EMBED=False)
+    def test_auto_embed_disabled(self):
+        with mock.patch.object(self.queue, "enqueue") as enqueue:
+            _create_event("Concert de jazz")
+        enqueue.assert_not_called()
+
+    def test_worker_failure_is_logged(self):
+        from events.models import Event
+
+        with self.embed(side_effect=RuntimeError("model caigut")):
+            with self.assertLogs(pipeline.logger, "ERROR") as logs:
+                broken = _create_event("Concert de jazz")
+                self.assertTrue(self.queue.flush(5))
+        self.assertIn(str([broken.pk]), logs.output[0])
+
+        # El worker continua viu per als events següents
+        with self.embed(side_effect=lambda texts: [np.ones(4, dtype=np.float32)] * len(texts)):
+            event = _create_event("Partit de bàsquet")
+            self.assertTrue(self.queue.flush(5))
+        self.assertTrue(Event.objects.get(pk=event.pk).embedding_hash)
+        self.assertFalse(Event.objects.get(pk=broken.pk).embedding_hash)
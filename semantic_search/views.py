@@ -1,9 +1,8 @@
 from django.shortcuts import render
-from django.utils import timezone
 
 from events.models import Event
-from .services.embeddings import embed_text, model_name
-from .services.ranker import cosine_top_k
+from .services.embeddings import model_name
+from .services.hybrid import hybrid_search
 
 def _event_text(e: Event) -> str:
     parts = [
@@ -20,21 +19,13 @@ def semantic_search(request):
 
     results = []
     if q:
-        q_vec = embed_text(q)
-
-        # Carreguem candidats de la DB de forma optimitzada
-        qs = Event.objects.all().only('id', 'title', 'description', 'category', 'scheduled_date', 'embedding')
-        if only_future:
-            qs = qs.filter(scheduled_date__gte=timezone.now())
-
-        items = []
-        for e in qs:
-            emb = getattr(e, "embedding", None)
-            if emb:
-                items.append((e, emb))
-
-        ranked = cosine_top_k(q_vec, items, k=20)
-        results = ranked
+        # Rànquing híbrid (lèxic + vectorial); de la DB només carreguem els 20 guanyadors
+        results = hybrid_search(
+            q,
+            k=20,
+            only_future=only_future,
+            fields=('id', 'title', 'description', 'category', 'scheduled_date'),
+        )
 
     context = {
         "query": q,